@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+"""queues.py
+
+Compares the priority queues of the shortest-path searches on a street
+network.
+
+    python benchmarks/queues.py [network.shp] [sources]
+
+from the root of the repository, or anywhere with spatialx installed.
+
+Without a shapefile, a jittered grid with lengths spread like those of a
+street network is used.
+"""
+import os
+import sys
+import random
+import time
+import networkx as nx
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                os.pardir))
+import spatialx as sx
+from spatialx.centrality.betweenness import _Buffers, _search
+
+
+def _grid(n=100, seed=0):
+    rng = random.Random(seed)
+    G = nx.grid_2d_graph(n, n)
+    for v in G:
+        G.nodes[v]['x'] = v[0] * 100. + rng.uniform(-30, 30)
+        G.nodes[v]['y'] = v[1] * 100. + rng.uniform(-30, 30)
+    for u, v in G.edges():
+        G[u][v]['length'] = ((G.nodes[u]['x'] - G.nodes[v]['x'])**2 +
+                             (G.nodes[u]['y'] - G.nodes[v]['y'])**2)**.5
+    return G
+
+
+def _sweep(search, adjacency, sources, n):
+    """Runs the searches, returns the time and the (S, D, sigma) of each"""
+    buf = _Buffers(n)
+    results = []
+    start = time.time()
+    for s in sources:
+        search(adjacency, s, buf)
+        buf.reset()
+    elapsed = time.time() - start
+    for s in sources[:10]:
+        S = search(adjacency, s, buf)
+        results.append([(v, buf.D[v], buf.sigma[v]) for v in S])
+        buf.reset()
+    return elapsed, results
+
+
+def main(argv):
+    if len(argv) > 1:
+        from spatialx.readwrite.shp import read_shp
+        G = read_shp(argv[1])
+    else:
+        G = _grid()
+    k = int(argv[2]) if len(argv) > 2 else 200
+
+    A = sx.CSRGraph(G)
+    adjacency = A.adjacency()
+    sources = random.Random(0).sample(range(len(A)), min(k, len(A)))
+    print("%d nodes, %d edges, %d sources" % (len(A), A.number_of_edges(),
+                                              len(sources)))
+    reference = None
+    for queue in ['heap', 'dial']:
+        elapsed, results = _sweep(_search(A, queue), adjacency, sources,
+                                  len(A))
+        if reference is None:
+            reference = elapsed, results
+        print("%-7s %8.3fs  x%.2f  same paths: %s" % (queue, elapsed,
+                                                      reference[0] / elapsed,
+                                                      results == reference[1]))
+
+
+if __name__ == '__main__':
+    main(sys.argv)
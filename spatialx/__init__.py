@@ -12,8 +12,13 @@ import spatialx as sx
 """
 from __future__ import absolute_import
 
+from spatialx.classes.csrgraph import *
+from spatialx.classes.dcel import *
 from spatialx.centrality import *
 from spatialx.dual import *
+from spatialx.simplify import *
+from spatialx.delineation import *
+from spatialx.checkpoint import *
 
 __author__ = "Rémi Louf"
 __copyright__ = "Copyright 2015, Rémi Louf"
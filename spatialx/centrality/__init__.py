@@ -1,8 +1,16 @@
 # -*- coding: utf-8 -*-
 """Import centrality algorithms"""
 
+from spatialx.centrality.omega import *
+
 from spatialx.centrality.betweenness import *
 
+from spatialx.centrality.approximate import *
+
+from spatialx.centrality.dynamic import *
+
+from spatialx.centrality.multi import *
+
 from spatialx.centrality.greedy_navigator import *
 
 #import spatialx.centrality.simple
@@ -4,12 +4,23 @@
 Algorithms to compute the (generalized) betweenness centrality.
 We use networkx's algorithm as a base
 """
+from bisect import bisect_right
 from heapq import heappush, heappop
-from itertools import count
+from functools import partial
+import hashlib
 import random
+import numpy as np
 import networkx as nx
 
 import spatialx as sx
+import spatialx.checkpoint
+from spatialx.classes.csrgraph import CSRGraph
+from spatialx.centrality.omega import (_omega_weights,
+                                       _omega_attributes,
+                                       _needs_graph,
+                                       _SourceOmega)
+from spatialx.centrality.bfs import _single_source_bfs_csr
+from spatialx.centrality.queues import _quantum, _single_source_dial_csr
 
 
 __all__ = ['betweenness_centrality', 
@@ -18,6 +29,8 @@ __all__ = ['betweenness_centrality',
            'e_gbetweenness_centrality']
 
 
+INF = float('inf')
+
 #
 # Helper functions
 #
@@ -25,96 +38,365 @@ __all__ = ['betweenness_centrality',
 ## Betweenness
 
 ## Generalized Betweenness
-def _single_source_shortest_path_basic(G, s):
-    S = []
-    P = {}
-    for v in G:
-        P[v] = []
-    sigma = dict.fromkeys(G, 0.0)    # sigma[v]=0 for v in G
-    D = {}
-    sigma[s] = 1.0
-    D[s] = 0
-    Q = [s]
-    while Q:   # use BFS to find shortest paths
-        v = Q.pop(0)
-        S.append(v)
-        Dv = D[v]
-        sigmav = sigma[v]
-        for w in G[v]:
-            if w not in D:
-                Q.append(w)
-                D[w] = Dv + 1
-            if D[w] == Dv + 1:   # this is a shortest path, count paths
-                sigma[w] += sigmav
-                P[w].append(v)  # predecessors
-    return S, P, sigma
+class _Buffers(object):
+    """Per-source work arrays of Brandes' algorithm
 
+    They are allocated once for the whole sweep, and only the entries touched
+    by a single-source search are reset before the next source.
+    """
 
+    def __init__(self, n):
+        self.S = []
+        self.touched = []
+        self.D = [INF] * n
+        self.seen = [INF] * n
+        self.sigma = [0.0] * n
+        self.delta = [0.0] * n
+        self.omega = [0.0] * n
+        self.buckets = []         # bucket queue, see `queues`
+
+    def reset(self):
+        D = self.D
+        seen = self.seen
+        sigma = self.sigma
+        delta = self.delta
+        for v in self.touched:
+            D[v] = INF
+            seen[v] = INF
+            sigma[v] = 0.0
+            delta[v] = 0.0
+        del self.S[:]
+        del self.touched[:]
+
+    def clear_delta(self):
+        """Resets the dependencies only, to accumulate another weighting"""
+        delta = self.delta
+        for v in self.S:
+            delta[v] = 0.0
+
+
+def _snapshot(G, weight, attributes=()):
+    """Returns a CSR snapshot of G, or G itself if it already is one
+
+    The snapshot holds the position of the nodes and the given attributes.
+    """
+    if isinstance(G, CSRGraph):
+        return G
+    return CSRGraph(G, weight, ('x', 'y') + tuple(attributes))
 
-def _single_source_dijkstra_path_basic(G, s, weight='length'):
-    # modified from Eppstein
-    S = []
-    P = {}
-    for v in G:
-        P[v] = []
-    sigma = dict.fromkeys(G, 0.0)    # sigma[v]=0 for v in G
-    D = {}
-    sigma[s] = 1.0
+
+def _single_source_dijkstra_csr(adjacency, s, buf, target=None, cutoff=INF):
+    """Single-source shortest paths on a CSR snapshot
+
+    Fills `buf.S` with the nodes reached from `s` in order of non-decreasing
+    distance, `buf.D` with their distance and `buf.sigma` with the number of
+    shortest paths from `s`. Predecessors are not stored: the predecessors of
+    `w` are the in-neighbours `v` such that `D[v] + l(v, w) == D[w]`, which
+    the accumulation recovers from the distances.
+
+    If `target` is given the search stops once its distance is known. Nodes
+    further than `cutoff` from `s` are not reached.
+    """
+    offsets, neighbors, lengths, _ = adjacency
+    S = buf.S
+    D = buf.D
+    seen = buf.seen
+    sigma = buf.sigma
+    touched = buf.touched
     push = heappush
     pop = heappop
-    seen = {s: 0}
-    c = count()
-    Q = []   # use Q as heap with (distance,node id) tuples
-    push(Q, (0, next(c), s, s))
+
+    seen[s] = 0.0
+    sigma[s] = 1.0
+    touched.append(s)
+    Q = [(0.0, s)]   # use Q as heap with (distance, node id) tuples
     while Q:
-        (dist, _, pred, v) = pop(Q)
-        if v in D:
+        (dist, v) = pop(Q)
+        if D[v] != INF:
             continue  # already searched this node.
-        sigma[v] += sigma[pred]  # count paths
-        S.append(v)
         D[v] = dist
-        for w, edgedata in G[v].items():
-            vw_dist = dist + edgedata.get(weight, 1)
-            if w not in D and (w not in seen or vw_dist < seen[w]):
+        S.append(v)
+        if v == target:
+            break
+        sigmav = sigma[v]
+        for j in range(offsets[v], offsets[v + 1]):
+            w = neighbors[j]
+            vw_dist = dist + lengths[j]
+            if vw_dist > cutoff:
+                continue
+            seenw = seen[w]
+            if vw_dist < seenw:
+                if seenw == INF:
+                    touched.append(w)
                 seen[w] = vw_dist
-                push(Q, (vw_dist, next(c), v, w))
-                sigma[w] = 0.0
-                P[w] = [v]
-            elif vw_dist == seen[w]:  # handle equal paths
-                sigma[w] += sigma[v]
-                P[w].append(v)
-    return S, P, sigma
-
-
-def _accumulate_generalized(betweenness, S, P, sigma, s, omega, G):
-    delta = dict.fromkeys(S, 0)
-    while S:
-        w = S.pop()
-        coeff = (omega(G,s,w) + delta[w]) / sigma[w]
-        for v in P[w]:
-            delta[v] += sigma[v] * coeff
+                sigma[w] = sigmav
+                push(Q, (vw_dist, w))
+            elif vw_dist == seenw:  # handle equal paths
+                sigma[w] += sigmav
+    return S
+
+
+def _search(A, queue='heap'):
+    """Single-source search on the snapshot A using the given queue
+
+    'heap' is a binary heap with lazy deletion and 'dial' a bucket queue, see
+    `spatialx.centrality.queues`. Both settle the nodes in the same order and
+    give the same distances and numbers of shortest paths. If the snapshot has no edge
+    lengths (`weight=None`) the search is a BFS whatever the queue.
+    """
+    if A.weight is None:
+        return _single_source_bfs_csr
+    if queue == 'heap':
+        return _single_source_dijkstra_csr
+    elif queue == 'dial':
+        quantum, size = _quantum(A.lengths.tolist())
+        return partial(_single_source_dial_csr, quantum=quantum, size=size)
+    raise ValueError("Unknown priority queue %s" % queue)
+
+
+def _searches(A, sources, buf, cutoff=INF, queue='heap'):
+    """Runs the search from each source id, yields it once it is in buf
+
+    The buffers must be reset before the next source is yielded.
+    """
+    search = _search(A, queue)
+    adjacency = A.adjacency()
+    for s in sources:
+        search(adjacency, s, buf, cutoff=cutoff)
+        yield s
+
+
+def _accumulate_generalized(betweenness, buf, in_adjacency, s, weights,
+                            stop=None):
+    """Accumulates the dependencies of s on the nodes in `buf.S[:stop]`"""
+    in_offsets, in_neighbors, in_lengths, _ = in_adjacency
+    D = buf.D
+    sigma = buf.sigma
+    delta = buf.delta
+    S = buf.S if stop is None else buf.S[:stop]
+    for w in reversed(S):
+        coeff = (weights[w] + delta[w]) / sigma[w]
+        Dw = D[w]
+        for j in range(in_offsets[w], in_offsets[w + 1]):
+            v = in_neighbors[j]
+            if D[v] + in_lengths[j] == Dw:  # v is a predecessor of w
+                delta[v] += sigma[v] * coeff
         if w != s:
             betweenness[w] += delta[w]
     return betweenness
 
 
-def _accumulate_edges_generalized(betweenness, S, P, sigma, s, omega, G):
-    delta = dict.fromkeys(S, 0)
-    while S:
-        w = S.pop()
-        coeff = (omega(G,s,w) + delta[w]) / sigma[w]
-        for v in P[w]:
-            c = sigma[v] * coeff
-            if (v, w) not in betweenness:
-                betweenness[(w, v)] += c
-            else:
-                betweenness[(v, w)] += c
-            delta[v] += c
+def _accumulate_edges_generalized(betweenness, e_betweenness, buf, in_adjacency,
+                                  s, weights, stop=None):
+    """Accumulates the dependencies of s on the nodes in `buf.S[:stop]` and
+    on the edges between them"""
+    in_offsets, in_neighbors, in_lengths, in_edge_index = in_adjacency
+    D = buf.D
+    sigma = buf.sigma
+    delta = buf.delta
+    S = buf.S if stop is None else buf.S[:stop]
+    for w in reversed(S):
+        coeff = (weights[w] + delta[w]) / sigma[w]
+        Dw = D[w]
+        for j in range(in_offsets[w], in_offsets[w + 1]):
+            v = in_neighbors[j]
+            if D[v] + in_lengths[j] == Dw:  # v is a predecessor of w
+                c = sigma[v] * coeff
+                e_betweenness[in_edge_index[j]] += c
+                delta[v] += c
         if w != s:
             betweenness[w] += delta[w]
+    return betweenness, e_betweenness
+
+
+def _gbetweenness_sweep(A, sources, omegas, G, edges=False, radii=(INF,),
+                        queue='heap'):
+    """Runs Brandes' algorithm from each source id on the snapshot A
+
+    The shortest paths do not depend on the weighting of the pairs: each
+    single-source search is followed by one accumulation per weighting in
+    `omegas`. A weighting None gives weight 1 to all pairs (usual
+    betweenness), see `spatialx.centrality.omega` for the other forms.
+
+    The searches stop at the largest of the `radii`. Since the nodes are
+    reached in order of distance, the nodes within a smaller radius are a
+    prefix of the nodes reached, and the accumulation for that radius only
+    runs over this prefix.
+
+    Returns, for each radius and each weighting, the node or, if `edges` is
+    True, the edge accumulator as a list indexed by node or edge id.
+    """
+    in_adjacency = A.in_adjacency()
+    buf = _Buffers(len(A))
+    radii = sorted(radii)
+    cutoff = radii[-1]
+    size = A.number_of_edges() if edges else len(A)
+    betweenness = [[[0.0] * len(A) for omega in omegas] for r in radii]
+    if edges:
+        e_betweenness = [[[0.0] * size for omega in omegas] for r in radii]
+    omega_weights = [_omega_weights(omega, G, A) for omega in omegas]
+    for s in _searches(A, list(sources), buf, cutoff, queue):
+        # single source shortest paths
+        S = buf.S
+        if len(radii) > 1:
+            distances = [buf.D[v] for v in S]
+        # accumulation
+        first = True
+        for i, r in enumerate(radii):
+            stop = None if r == cutoff else bisect_right(distances, r)
+            for k, weights in enumerate(omega_weights):
+                if not first:
+                    buf.clear_delta()
+                first = False
+                if edges:
+                    _accumulate_edges_generalized(betweenness[i][k],
+                                                  e_betweenness[i][k],
+                                                  buf, in_adjacency, s,
+                                                  weights(s, buf), stop)
+                else:
+                    _accumulate_generalized(betweenness[i][k], buf,
+                                            in_adjacency, s,
+                                            weights(s, buf), stop)
+        buf.reset()
+    if edges:
+        return e_betweenness
     return betweenness
 
 
+def _gbetweenness_chunk(state, sources):
+    """Sweep over a chunk of sources, run in the worker processes"""
+    return np.array(_gbetweenness_sweep(state['A'],
+                                        sources,
+                                        state['omegas'],
+                                        state['G'],
+                                        state['edges'],
+                                        state['radii'],
+                                        state['queue']))
+
+
+def _omega_list(omega):
+    """Returns the weightings of omega as a list, and their keys if any"""
+    if isinstance(omega, dict):
+        keys = list(omega)
+        return [omega[key] for key in keys], keys
+    elif isinstance(omega, list):
+        return omega, None
+    return [omega], None
+
+
+def _omega_form(values, omega, keys):
+    """Puts one value per weighting back in the form of omega"""
+    if isinstance(omega, dict):
+        return dict(zip(keys, values))
+    elif isinstance(omega, list):
+        return list(values)
+    return values[0]
+
+
+def _omega_digest(omegas, G, A, queue='heap', sources=3):
+    """Description of the weightings, for the checkpoint key
+
+    The tuples are described by their value and the functions by their
+    qualified name; all of them by a hash of the weights they give to the
+    pairs of the first few sources.
+    """
+    buf = _Buffers(len(A))
+    search = _search(A, queue)
+    adjacency = A.adjacency()
+    parts = []
+    for omega in omegas:
+        if omega is None:
+            parts.append('None')
+            continue
+        if isinstance(omega, tuple):
+            name = repr(omega)
+        else:
+            func = omega.func if isinstance(omega, _SourceOmega) else omega
+            name = '%s.%s' % (getattr(func, '__module__', None),
+                              getattr(func, '__qualname__',
+                                      type(func).__name__))
+        weights = _omega_weights(omega, G, A)
+        h = hashlib.sha1()
+        for s in range(min(sources, len(A))):
+            search(adjacency, s, buf)
+            w = weights(s, buf)
+            h.update(np.array([w[t] for t in buf.S],
+                              dtype=np.float64).tobytes())
+            buf.reset()
+        parts.append('%s:%s' % (name, h.hexdigest()))
+    return parts
+
+
+def _gbetweenness(G, omega, weight, edges, n_jobs, cutoff=None,
+                  checkpoint=None, shard=None, queue='heap'):
+    """Node or edge (generalized) betweenness, unnormalized
+
+    omega can be a single weighting, or a list or dictionary of weightings
+    which are all accumulated from the same shortest-path searches. cutoff
+    can be None, a radius, or a list of radii. Returns the snapshot and the
+    result(s): a dictionary keyed by radius if cutoff is a list, of results in
+    the same form as omega.
+
+    The sources are split in chunks which only depend on the number of nodes;
+    the partial sums are added in chunk order so that the result does not
+    depend on the number of processes. See `spatialx.checkpoint.sweep` for
+    checkpoint and shard.
+    """
+    omegas, keys = _omega_list(omega)
+    if cutoff is None:
+        radii = [INF]
+    elif isinstance(cutoff, (list, tuple)):
+        radii = sorted(cutoff)
+    else:
+        radii = [cutoff]
+
+    A = _snapshot(G, weight, _omega_attributes(omegas))
+    _search(A, queue)  # fail early on an unknown queue
+    # the graph is only sent to the workers for the weighting functions
+    state = {'A': A, 'omegas': omegas,
+             'G': G if _needs_graph(omegas) else None,
+             'edges': edges, 'radii': radii, 'queue': queue}
+    size = A.number_of_edges() if edges else len(A)
+    key = None
+    if checkpoint is not None:  # the digest runs searches and the omegas
+        key = sx.checkpoint.digest('gbetweenness %s' % ('edges' if edges
+                                                        else 'nodes'),
+                                   A,
+                                   omega=_omega_digest(omegas, G, A, queue),
+                                   radii=radii,
+                                   queue=queue)
+    betweenness = sx.checkpoint.sweep(_gbetweenness_chunk,
+                                      range(len(A)),
+                                      state,
+                                      (len(radii), len(omegas), size),
+                                      key,
+                                      n_jobs,
+                                      checkpoint,
+                                      shard)
+
+    to_dict = A.edge_dict if edges else A.node_dict
+    results = [_omega_form([to_dict(b) for b in by_radius], omega, keys)
+               for by_radius in betweenness]
+    if isinstance(cutoff, (list, tuple)):
+        return A, dict(zip(radii, results))
+    return A, results[0]
+
+
+def _rescale_all(betweenness, omega, cutoff, rescale, n, normalized,
+                 directed):
+    """Rescales the result(s) of `_gbetweenness`"""
+    if isinstance(cutoff, (list, tuple)):
+        return dict((r, _rescale_all(b, omega, None, rescale, n, normalized,
+                                     directed))
+                    for r, b in betweenness.items())
+    if isinstance(omega, dict):
+        return dict((k, rescale(b, n, normalized, directed))
+                    for k, b in betweenness.items())
+    elif isinstance(omega, list):
+        return [rescale(b, n, normalized, directed) for b in betweenness]
+    return rescale(betweenness, n, normalized, directed)
+
+
 def _rescale(betweenness, n, normalized, directed=False):
     if normalized is True:
         if n <= 2:
@@ -157,10 +439,49 @@ def _rescale_e(betweenness, n, normalized, directed=False):
 ## Betweenness centrality ##
 ############################
 
-def betweenness_centrality(G, normalized=True):
+def betweenness_centrality(G, normalized=True, weight='length', n_jobs=1,
+                           cutoff=None, checkpoint=None, shard=None,
+                           queue='heap'):
     """ Script to compute the betweenness centrality
 
-    We use directly Networkx' algorithm.
+    Same algorithm as Networkx', run on a CSR snapshot of the graph and
+    possibly in parallel.
+
+    Parameters
+    ----------
+
+    G: Networkx graph
+
+    normalized: bool, optional
+        If True the betweenness values are normalized by `1/((n-1)(n-2))`.
+
+    weight: string or None, optional
+        Edge attribute used as the length of the edges. If None, all edges
+        have length 1 and the shortest paths are found with breadth-first
+        searches.
+
+    n_jobs: int, optional
+        Number of worker processes the sources are distributed over (-1 for
+        one per CPU). The result does not depend on the number of processes.
+
+    cutoff: float or list of floats, optional
+        Only count the pairs of nodes within this network distance of each
+        other (local betweenness). With a list of radii, the values for all
+        radii are computed from a single search per source and returned as a
+        dictionary keyed by radius.
+
+    checkpoint: string, optional
+        Path of a checkpoint file. The partial result is saved there
+        periodically, and a computation interrupted is resumed from it.
+
+    shard: tuple (i, k), optional
+        Only process the i-th of k shards of the sources, e.g. on different
+        machines; see `merge_checkpoints` to combine the checkpoints.
+
+    queue: string, optional
+        Priority queue of the shortest-path searches: 'heap' (binary heap with
+        lazy deletion) or 'dial' (bucket queue over quantized lengths). The
+        results are the same.
 
     Returns
     -------
@@ -168,14 +489,56 @@ def betweenness_centrality(G, normalized=True):
     nodes: dictionary
         Dictionary of nodes with betweenness centrality as value
     """
-    return nx.betweenness_centrality(G, None, normalized, 'length')
+    A, betweenness = _gbetweenness(G, None, weight, False, n_jobs, cutoff,
+                                   checkpoint, shard, queue)
+    return _rescale_all(betweenness, None, cutoff, _rescale, len(A),
+                        normalized, A.is_directed())
     
 
 
-def e_betweenness_centrality(G, normalized=True):
+def e_betweenness_centrality(G, normalized=True, weight='length', n_jobs=1,
+                             cutoff=None, checkpoint=None, shard=None,
+                             queue='heap'):
     """ Script to compute the edge betweenness centrality
 
-    We directly use Networkx's algorithms.
+    Same algorithm as Networkx', run on a CSR snapshot of the graph and
+    possibly in parallel.
+
+    Parameters
+    ----------
+
+    G: Networkx graph
+
+    normalized: bool, optional
+        If True the betweenness values are normalized by `1/(n(n-1))`.
+
+    weight: string or None, optional
+        Edge attribute used as the length of the edges. If None, all edges
+        have length 1 and the shortest paths are found with breadth-first
+        searches.
+
+    n_jobs: int, optional
+        Number of worker processes the sources are distributed over (-1 for
+        one per CPU). The result does not depend on the number of processes.
+
+    cutoff: float or list of floats, optional
+        Only count the pairs of nodes within this network distance of each
+        other (local betweenness). With a list of radii, the values for all
+        radii are computed from a single search per source and returned as a
+        dictionary keyed by radius.
+
+    checkpoint: string, optional
+        Path of a checkpoint file. The partial result is saved there
+        periodically, and a computation interrupted is resumed from it.
+
+    shard: tuple (i, k), optional
+        Only process the i-th of k shards of the sources, e.g. on different
+        machines; see `merge_checkpoints` to combine the checkpoints.
+
+    queue: string, optional
+        Priority queue of the shortest-path searches: 'heap' (binary heap with
+        lazy deletion) or 'dial' (bucket queue over quantized lengths). The
+        results are the same.
 
     Returns
     -------
@@ -183,7 +546,10 @@ def e_betweenness_centrality(G, normalized=True):
     edges: dictionnary
         Dictionary of edges with edge betweenness centrality as value
     """
-    return nx.edge_betweenness_centrality(G, normalized, 'length')
+    A, betweenness = _gbetweenness(G, None, weight, True, n_jobs, cutoff,
+                                   checkpoint, shard, queue)
+    return _rescale_all(betweenness, None, cutoff, _rescale_e, len(A),
+                        normalized, A.is_directed())
 
 
 
@@ -192,55 +558,104 @@ def e_betweenness_centrality(G, normalized=True):
 ## Generalized betweenness centrality ##
 ########################################
 
-def gbetweenness_centrality(G, normalized=True):
+def gbetweenness_centrality(G, omega, normalized=True, weight='length',
+                            n_jobs=1, cutoff=None, checkpoint=None,
+                            shard=None, queue='heap'):
     r""" Script to compute the generalized betweenness centrality
 
+    .. math::
+
+       c_B(v) =\sum_{s,t \in V} \frac{\sigma(s, t|v)}{\sigma(s, t)} \omega_{st}
+
     Parameters
     ----------
     G : graph
-      A NetworkX graph
+      A NetworkX graph, or a `CSRGraph` snapshot of one. Taking the snapshot
+      once is cheaper when several centralities are computed on the same
+      graph.
+
+    omega : function or tuple
+      Called as `omega(G, s, t)`, returns the weight associated with the
+      pair of nodes `s` and `t`. Per-source functions (see `source_omega`)
+      and node-attribute tuples such as `('pop', 'pop', 'gravity')` compute
+      the weights of all the targets of a source at once; see
+      `spatialx.centrality.omega`. A list or dictionary of weightings
+      computes the betweenness for each of them from a single sweep of
+      shortest-path searches.
 
     normalized : bool, optional
       If True the betweenness values are normalized by `2/((n-1)(n-2))`
       for graphs, and `1/((n-1)(n-2))` for directed graphs where `n`
       is the number of nodes in G.
 
+    weight : string or None, optional
+      Edge attribute used as the length of the edges. If None, all edges have
+      length 1 (topological betweenness) and the shortest paths are found with
+      breadth-first searches. Ignored if G is already a `CSRGraph`.
+
+    n_jobs : int, optional
+      Number of worker processes the sources are distributed over (-1 for one
+      per CPU). The graph is sent once to each worker, and the partial sums
+      are reduced in a fixed order so that the result does not depend on the
+      number of processes. With more than one process omega must be a
+      module-level function on platforms that do not fork.
+
+    cutoff : float or list of floats, optional
+      Only count the pairs of nodes within this network distance of each
+      other (local betweenness); the searches stop at the radius. With a list
+      of radii, the values for all radii are computed from a single search
+      per source and returned as a dictionary keyed by radius.
+
+    checkpoint : string, optional
+      Path of a checkpoint file. The partial result and the finished sources
+      are saved there periodically, and a computation interrupted is resumed
+      from it.
+
+    shard : tuple (i, k), optional
+      Only process the i-th of k shards of the sources, e.g. on different
+      machines. The checkpoints of all the shards, combined with
+      `merge_checkpoints`, give the complete result.
+
+    queue : string, optional
+      Priority queue of the shortest-path searches: 'heap' (binary heap with
+      lazy deletion, the default) or 'dial' (Dial's bucket queue over
+      quantized lengths). Both settle the nodes in the same order and count
+      the shortest paths exactly alike.
+
     Returns
     -------
 
     nodes : dictionary
-       Dictionary of nodes with betweenness centrality as the value.
+       Dictionary of nodes with betweenness centrality as the value. If omega
+       is a list (dictionary) of weightings, a list (dictionary) of such
+       dictionaries.
 
     Notes
     -----
 
-    The algorithm is from Ulrik Brandes.
+    The algorithm is from Ulrik Brandes. The shortest paths are computed on
+    a CSR snapshot of the graph, with work arrays allocated once and reused
+    for every source.
     """
-    weight = 'length' # Keep as variable, more flexible
-
-    betweenness = dict.fromkeys(G, 0.0)  # b[v]=0 for v in G
-    nodes = G
-    for s in nodes:
-        # single source shortest paths
-        S, P, sigma = _single_source_dijkstra_path_basic(G, s, weight)
-        # accumulation
-        betweenness = _accumulate_generalized(betweenness, S, P, sigma, s, omega, G)
+    A, betweenness = _gbetweenness(G, omega, weight, False, n_jobs, cutoff,
+                                   checkpoint, shard, queue)
 
     # rescaling
-    betweenness = _rescale(betweenness, len(G),
-                           normalized=normalized,
-                           directed=G.is_directed())
+    betweenness = _rescale_all(betweenness, omega, cutoff, _rescale, len(A),
+                               normalized, A.is_directed())
     return betweenness
 
 
 
 
-def e_gbetweenness_centrality(G, omega, normalized=False):
-    """ Script to compute the generalised edge betweenness centrality
+def e_gbetweenness_centrality(G, omega, normalized=False, weight='length',
+                              n_jobs=1, cutoff=None, checkpoint=None,
+                              shard=None, queue='heap'):
+    r""" Script to compute the generalised edge betweenness centrality
 
     .. math::
 
-       c_B(v) =\sum_{s,t \in V} \frac{\sigma(s, t|e)}{\sigma(s, t)} \omega_{st}
+       c_B(e) =\sum_{s,t \in V} \frac{\sigma(s, t|e)}{\sigma(s, t)} \omega_{st}
 
     where `\sigma(s,t)` is the number of shortest paths between `s` and `t`, `\omega_{st}` is the weight 
     of the shortest path between `s` and `t`.
@@ -249,20 +664,59 @@ def e_gbetweenness_centrality(G, omega, normalized=False):
     ----------
 
     G: Networkx graph
+      A NetworkX graph, or a `CSRGraph` snapshot of one.
     
-    omega : function
-      Takes two nodes as an input and returns the weight associated with the
-      pair of nodes `s` and `t`.
+    omega : function or tuple
+      Called as `omega(G, s, t)`, returns the weight associated with the
+      pair of nodes `s` and `t`. Per-source functions (see `source_omega`)
+      and node-attribute tuples such as `('pop', 'pop', 'gravity')` compute
+      the weights of all the targets of a source at once; see
+      `spatialx.centrality.omega`. A list or dictionary of weightings
+      computes the betweenness for each of them from a single sweep of
+      shortest-path searches.
     
     normalized : bool, optional
       If True the betweenness values are normalized by `2/(n(n-1))`
       for graphs, and `1/(n(n-1))` for directed graphs where `n`
       is the number of nodes in G.
 
+    weight : string or None, optional
+      Edge attribute used as the length of the edges. If None, all edges have
+      length 1 (topological betweenness) and the shortest paths are found with
+      breadth-first searches. Ignored if G is already a `CSRGraph`.
+
+    n_jobs : int, optional
+      Number of worker processes the sources are distributed over (-1 for one
+      per CPU). The result does not depend on the number of processes.
+
+    cutoff : float or list of floats, optional
+      Only count the pairs of nodes within this network distance of each
+      other (local betweenness); the searches stop at the radius. With a list
+      of radii, the values for all radii are computed from a single search
+      per source and returned as a dictionary keyed by radius.
+
+    checkpoint : string, optional
+      Path of a checkpoint file. The partial result and the finished sources
+      are saved there periodically, and a computation interrupted is resumed
+      from it.
+
+    shard : tuple (i, k), optional
+      Only process the i-th of k shards of the sources, e.g. on different
+      machines. The checkpoints of all the shards, combined with
+      `merge_checkpoints`, give the complete result.
+
+    queue : string, optional
+      Priority queue of the shortest-path searches: 'heap' (binary heap with
+      lazy deletion, the default) or 'dial' (Dial's bucket queue over
+      quantized lengths). Both settle the nodes in the same order and count
+      the shortest paths exactly alike.
+
     Returns
     -------
     edges : dictionary
-       Dictionary of edges with betweenness centrality as the value.
+       Dictionary of edges with betweenness centrality as the value. If omega
+       is a list (dictionary) of weightings, a list (dictionary) of such
+       dictionaries.
 
 
     Notes
@@ -270,23 +724,10 @@ def e_gbetweenness_centrality(G, omega, normalized=False):
 
     Original algorithm by Ulrik Brandes, adapted for our own use.
     """
-    weight = 'length' # Keep as variable if design changes in future
-
-    betweenness = dict.fromkeys(G, 0.0)  # b[v]=0 for v in G
-    # b[e]=0 for e in G.edges()
-    betweenness.update(dict.fromkeys(G.edges(), 0.0))
-    for s in G:
-        # single source shortest paths
-        S, P, sigma = _single_source_dijkstra_path_basic(G, s, weight)
-        # accumulation
-        betweenness = _accumulate_edges_generalized(betweenness, S, P, sigma, s, omega, G)
+    A, betweenness = _gbetweenness(G, omega, weight, True, n_jobs, cutoff,
+                                   checkpoint, shard, queue)
 
     # rescaling
-    for n in G:  # remove nodes to only return edges
-        del betweenness[n]
-    betweenness = _rescale_e(betweenness, len(G),
-                             normalized=normalized,
-                             directed=G.is_directed())
+    betweenness = _rescale_all(betweenness, omega, cutoff, _rescale_e, len(A),
+                               normalized, A.is_directed())
     return betweenness
-
-
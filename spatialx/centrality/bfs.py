@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+"""bfs.py
+
+Breadth-first searches for the hop-count (topological) betweenness, used when
+the edges have no length (`weight=None`), e.g. on dual or line graphs.
+
+`_single_source_bfs_csr` is a plain BFS filling the same buffers as the
+Dijkstra searches. The list of the nodes reached, `S`, is also the queue.
+"""
+
+
+INF = float('inf')
+
+#
+# Helper functions
+#
+def _single_source_bfs_csr(adjacency, s, buf, target=None, cutoff=INF):
+    """Single-source shortest paths in number of hops on a CSR snapshot
+
+    Same output as `_single_source_dijkstra_csr` on a graph whose edges all
+    have length 1; the lengths of the snapshot are ignored.
+    """
+    offsets, neighbors, _, _ = adjacency
+    S = buf.S
+    D = buf.D
+    sigma = buf.sigma
+    touched = buf.touched
+
+    D[s] = 0.0
+    sigma[s] = 1.0
+    touched.append(s)
+    S.append(s)
+    i = 0
+    while i < len(S):   # S is the queue
+        v = S[i]
+        i += 1
+        if v == target:
+            del S[i:]   # nodes discovered but not searched
+            break
+        Dw = D[v] + 1
+        if Dw > cutoff:
+            break
+        sigmav = sigma[v]
+        for j in range(offsets[v], offsets[v + 1]):
+            w = neighbors[j]
+            Dcur = D[w]
+            if Dcur == INF:
+                touched.append(w)
+                S.append(w)
+                D[w] = Dw
+                sigma[w] = sigmav
+            elif Dcur == Dw:   # this is a shortest path, count paths
+                sigma[w] += sigmav
+    return S
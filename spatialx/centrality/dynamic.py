@@ -0,0 +1,224 @@
+# -*- coding: utf-8 -*-
+"""dynamic.py
+
+(Generalized) betweenness centrality of a graph whose edges change.
+
+After an edge is inserted, removed, or has its length changed, only the
+sources whose shortest-path DAG is affected by the change contribute
+differently to the betweenness. A source `s` is affected by a change of the
+edge `(u, v)` if and only if, before the change,
+
+    d(s, u) + l(u, v) <= d(s, v)
+
+where `l(u, v)` is the smaller of the old and new lengths (the new length for
+an insertion, the old one for a removal): either the edge was on a shortest
+path from `s` or it creates a shorter (or equally short) path. The distances
+`d(s, u)` and `d(s, v)` of all sources are given by two single-source
+searches from `u` and `v` on the reversed graph, so no per-source state needs
+to be stored. The contributions of the affected sources are recomputed on the
+graph before and after the change, and replace the old ones.
+"""
+from __future__ import division
+import numpy as np
+
+import spatialx.parallel
+from spatialx.classes.csrgraph import CSRGraph
+from spatialx.centrality.betweenness import (_Buffers,
+                                             _search,
+                                             _accumulate_edges_generalized,
+                                             _rescale,
+                                             _rescale_e)
+from spatialx.centrality.omega import _omega_weights
+
+
+__all__ = ['DynamicBetweenness']
+
+
+#
+# Helper functions
+#
+def _contributions(A, sources, omega, G):
+    """Node and edge accumulators of the given sources, indexed by id"""
+    adjacency = A.adjacency()
+    in_adjacency = A.in_adjacency()
+    buf = _Buffers(len(A))
+    betweenness = [0.0] * len(A)
+    e_betweenness = [0.0] * A.number_of_edges()
+    weights = _omega_weights(omega, G, A)
+    search = _search(A)
+    for s in sources:
+        search(adjacency, s, buf)
+        _accumulate_edges_generalized(betweenness, e_betweenness, buf,
+                                      in_adjacency, s, weights(s, buf))
+        buf.reset()
+    return np.array(betweenness), np.array(e_betweenness)
+
+
+def _contributions_chunk(state, sources):
+    return _contributions(state['A'], sources, state['omega'], state['G'])
+
+
+def _distances_to(A, v):
+    """Distances from all nodes to v, as an array indexed by node id"""
+    buf = _Buffers(len(A))
+    _search(A)(A.in_adjacency(), A.index[v], buf)
+    return np.array(buf.D)
+
+
+def _affected(A, u, v, length, rtol=1e-9):
+    """Boolean mask of the sources affected by a change of the edge (u, v)
+
+    The test is made with a small relative tolerance: the distances come from
+    searches rooted at the other end of the paths, and may differ from the
+    ones of the sources' own searches by rounding errors. A source wrongly
+    found affected only costs an unnecessary recomputation.
+    """
+    Du = _distances_to(A, u)
+    Dv = _distances_to(A, v)
+    with np.errstate(invalid='ignore'):
+        affected = np.isfinite(Du) & (Du + length <= Dv + rtol * Dv)
+        if not A.is_directed():
+            affected |= np.isfinite(Dv) & (Dv + length <= Du + rtol * Du)
+    return affected
+
+
+
+#
+# Callable functions
+#
+class DynamicBetweenness(object):
+    """ (Generalized) betweenness of nodes and edges under edge changes
+
+    Example
+    -------
+
+    >>> B = DynamicBetweenness(G)
+    >>> B.remove_edge(u, v)
+    >>> B.add_edge(u, w, length=120.)
+    >>> b = B.betweenness()
+    >>> eb = B.edge_betweenness()
+
+    Parameters
+    ----------
+
+    G: Networkx graph
+        The graph is copied; later changes must go through this object.
+
+    omega: function or tuple, optional
+        Weighting of the pairs of nodes, in any form accepted by
+        `gbetweenness_centrality`. If None, usual betweenness.
+
+    weight: string
+        Edge attribute used as the length of the edges.
+
+    n_jobs: int
+        Number of processes used for the initial computation.
+    """
+
+    def __init__(self, G, omega=None, weight='length', n_jobs=1):
+        self.G = G.copy()
+        self.omega = omega
+        self.weight = weight
+        self.affected = 0  # number of sources recomputed by the last update
+
+        A = self._snapshot()
+        state = {'A': A, 'omega': omega, 'G': self.G}
+        self._nodes = np.zeros(len(A))
+        edges = np.zeros(A.number_of_edges())
+        for b, eb in spatialx.parallel.imap(_contributions_chunk,
+                                            spatialx.parallel.partition(
+                                                range(len(A))),
+                                            state,
+                                            n_jobs):
+            self._nodes += b
+            edges += eb
+        self._edges = A.edge_dict(edges)
+
+    def _snapshot(self):
+        return CSRGraph(self.G, self.weight, attributes=())
+
+    def _key(self, u, v):
+        """Key of the edge (u, v) in the edge dictionary"""
+        if (u, v) not in self._edges and not self.G.is_directed():
+            return (v, u)
+        return (u, v)
+
+    def _length(self, data):
+        if self.weight is None:
+            return 1.0
+        return float(data.get(self.weight, 1))
+
+    def update(self, changes):
+        """ Applies a batch of edge changes
+
+        Parameters
+        ----------
+
+        changes: list of tuples
+            `(u, v, data)` sets the attributes of the edge (u, v) to the
+            dictionary `data`, inserting the edge if needed. `(u, v, None)`
+            removes the edge. The nodes must already be in the graph.
+        """
+        A = self._snapshot()
+        affected = np.zeros(len(A), dtype=bool)
+        for u, v, data in changes:
+            lengths = []
+            if self.G.has_edge(u, v):
+                lengths.append(self._length(self.G[u][v]))
+            if data is not None:
+                lengths.append(self._length(data))
+            if lengths:
+                affected |= _affected(A, u, v, min(lengths))
+        sources = np.flatnonzero(affected).tolist()
+        self.affected = len(sources)
+
+        # remove the old contributions
+        b, eb = _contributions(A, sources, self.omega, self.G)
+        self._nodes -= b
+        for (u, v), x in zip(A.edges, eb.tolist()):
+            self._edges[self._key(u, v)] -= x
+
+        # apply the changes
+        for u, v, data in changes:
+            if data is None:
+                if self.G.has_edge(u, v):
+                    del self._edges[self._key(u, v)]
+                    self.G.remove_edge(u, v)
+            else:
+                if not self.G.has_edge(u, v):
+                    self._edges[(u, v)] = 0.0
+                self.G.add_edge(u, v)
+                self.G[u][v].clear()
+                self.G[u][v].update(data)
+
+        # add the new ones
+        A = self._snapshot()
+        b, eb = _contributions(A, sources, self.omega, self.G)
+        self._nodes += b
+        for (u, v), x in zip(A.edges, eb.tolist()):
+            self._edges[self._key(u, v)] += x
+
+    def add_edge(self, u, v, **attr):
+        """Inserts the edge (u, v), or replaces its attributes"""
+        self.update([(u, v, attr)])
+
+    def remove_edge(self, u, v):
+        """Removes the edge (u, v)"""
+        self.update([(u, v, None)])
+
+    def set_length(self, u, v, length):
+        """Changes the length of the edge (u, v)"""
+        data = dict(self.G[u][v])
+        data[self.weight] = length
+        self.update([(u, v, data)])
+
+    def betweenness(self, normalized=True):
+        """Dictionary of nodes with (generalized) betweenness as value"""
+        betweenness = dict(zip(self.G, self._nodes.tolist()))
+        return _rescale(betweenness, len(self.G), normalized,
+                        self.G.is_directed())
+
+    def edge_betweenness(self, normalized=False):
+        """Dictionary of edges with (generalized) betweenness as value"""
+        return _rescale_e(dict(self._edges), len(self.G), normalized,
+                          self.G.is_directed())
@@ -3,82 +3,351 @@
 
 Algorithms to computhe the Greedy Navigator Centrality introduced in [1]_.
 
+The exact centralities sum the passage counts of the paths to every target;
+the targets are split between processes. `approximate_gsn_centralities`
+only sums them over a sample of targets, or of (source, target) pairs, and
+extrapolates to all of them with confidence intervals.
+
 .. [1] S.H. Lee and P. Holme 
        Physical Review Letters 108:128701 (2012)
 """
 from __future__ import division
-from heapq import heappush, heappop
-from itertools import count
+from statistics import NormalDist
 import numpy as np
 import networkx as nx
-import itertools
 
-__all__ = ['gsn_centrality']
+import spatialx.checkpoint
+from spatialx.classes.csrgraph import CSRGraph
+
+__all__ = ['gsn_centrality',
+           'e_gsn_centrality',
+           'approximate_gsn_centralities']
 
 
 #
 # Helper functions
 #
-def _angle(G, t, v, w):
-   v1 = np.array([G.node[t]['x']-G.node[v]['x'],
-                  G.node[t]['y']-G.node[v]['y']])
-   v2 = np.array([G.node[w]['x']-G.node[v]['x'],
-                  G.node[w]['y']-G.node[v]['y']])
-   cosang = np.dot(v1, v2)
-   sinang = np.norm(np.cross(v1, v2))
-   return np.arctan2(sinang, cosang) 
+def _half_edges(A):
+    """Offsets from each node to its neighbours, one entry per CSR entry
 
+    Computed once per snapshot and shared by all the targets: the tail of
+    each entry, its position, the offsets `dx`, `dy` from the tail to the
+    head, and the mask of the self-loops.
+    """
+    if ('x' not in A.node_data or 'y' not in A.node_data or
+            np.isnan(A.node_data['x']).any() or
+            np.isnan(A.node_data['y']).any()):
+        raise ValueError("The half-edge structure needs the x and y "
+                         "attributes of all the nodes")
+    x = A.node_data['x']
+    y = A.node_data['y']
+    tails = np.repeat(np.arange(len(A)), np.diff(A.offsets))
+    heads = A.neighbors
+    return {'tails': tails,
+            'x': x[tails],
+            'y': y[tails],
+            'dx': x[heads] - x[tails],
+            'dy': y[heads] - y[tails],
+            'loops': tails == heads}
+
+
+def _angles(A, half_edges, targets, entries=slice(None)):
+    """Angle between v->t and v->w for every target t and CSR entry (v, w)
+
+    Returns an array of shape `(len(targets), number of CSR entries)`, or
+    only of the given slice of entries. The self-loops get an infinite
+    angle, so that they are never chosen.
+    """
+    targets = np.asarray(targets)
+    x1 = A.node_data['x'][targets, None] - half_edges['x'][entries]
+    y1 = A.node_data['y'][targets, None] - half_edges['y'][entries]
+    dx = half_edges['dx'][entries]
+    dy = half_edges['dy'][entries]
+    angles = np.arctan2(np.abs(x1*dy - y1*dx), x1*dx + y1*dy)
+    angles[:, half_edges['loops'][entries]] = np.inf
+    return angles
 
 
-def _single_gsn_path(G, s, t, weight="length"):
+def _next_hops(A, angles):
+    """CSR entry of the neighbour of smallest angle of each node, or -1
+
+    `angles` has one row per target; so has the result. Ties are broken by
+    the order of the neighbours in the snapshot.
+    """
+    n = len(A)
+    k, m = angles.shape
+    offsets = A.offsets
+    degrees = np.diff(offsets)
+    rows = np.flatnonzero(degrees)
+    best = np.full((k, n), -1, dtype=np.int64)
+    if not len(rows):
+        return best
+    smallest = np.minimum.reduceat(angles, offsets[rows], axis=1)
+    candidates = np.where(angles == np.repeat(smallest, degrees[rows], axis=1),
+                          np.arange(m), m)
+    first = np.minimum.reduceat(candidates, offsets[rows], axis=1)
+    first[np.isinf(smallest)] = -1
+    best[:, rows] = first
+    return best
+
+
+def _batches(targets, m, size=2**22):
+    """Splits the targets so that the angles of a batch have `size` entries"""
+    k = max(1, size // max(m, 1))
+    return [targets[i:i + k] for i in range(0, len(targets), k)]
+
+
+def _greedy_tree(A, t, best):
+    """Nodes whose greedy next hops lead to t, with their subtree sizes
+
+    Following the best next hop from each node defines a forest; the tree
+    rooted at t holds the sources whose greedy path never needs to
+    backtrack. Returns the nodes of the tree, t excluded, and the number of
+    nodes of the tree in each of their subtrees (themselves included).
+    """
+    n = len(A)
+    hop = np.where(best >= 0, A.neighbors[np.maximum(best, 0)], -1)
+    hop[t] = -1
+    order = np.argsort(hop, kind='stable')
+    starts = np.searchsorted(hop[order], np.arange(n + 1))
+
+    levels = []
+    level = np.array([t])
+    while len(level):
+        first = starts[level]
+        counts = starts[level + 1] - first
+        shift = np.cumsum(counts) - counts
+        level = order[np.repeat(first - shift, counts) +
+                      np.arange(counts.sum())]
+        if len(level):
+            levels.append(level)
+
+    size = np.ones(n)
+    for level in reversed(levels):
+        np.add.at(size, hop[level], size[level])
+    if not levels:
+        return np.array([], dtype=np.int64), size
+    return np.concatenate(levels), size
+
+
+def _ranking(A, t, angles=None, half_edges=None):
+    """Function giving the CSR entries of a node sorted by angle to t
+
+    Ties are broken by position. Given the angles of all the entries, they
+    are all sorted at once; otherwise (for a few sources only) the entries
+    of a node are sorted when first needed, from the half-edges.
+    """
+    offsets = A.offsets
+    if angles is not None:
+        tails = np.repeat(np.arange(len(A)), np.diff(offsets))
+        order = np.lexsort((angles, tails)).tolist()
+        return lambda v: order[offsets[v]:offsets[v + 1]]
+
+    cache = {}
+    def ranked(v):
+        if v not in cache:
+            start = offsets[v]
+            entries = slice(start, offsets[v + 1])
+            local = _angles(A, half_edges, [t], entries)[0]
+            cache[v] = (start + np.argsort(local, kind='stable')).tolist()
+        return cache[v]
+    return ranked
+
+
+def _single_gsn_path(A, ranked, s, t):
     """ Perform GSN path between s and t
 
+    At each step the navigator goes to the unvisited neighbour whose
+    direction is closest to the direction of t. If all neighbours have been
+    visited it goes back to the node it came from.
+
     It is not clear from the paper whether we should take backtracking steps
     into account in the distance and centrality, I am choosing to do so. (Asked
     Sang-Hoon for what they used)
+
+    `ranked(v)` gives the CSR entries of v sorted by angle to t (see
+    `_ranking`). Self-loops lead to an already visited node and are never
+    followed.
+
+    Returns the sequence of node ids visited and the CSR entries of the edges
+    traversed, or (None, None) if t cannot be reached from s.
     """
-    visited = [] #Keep track of the sequence of nodes
+    neighbors = A.neighbors
+    visited = [s] #Keep track of the sequence of nodes
+    steps = []
+    seen = set([s])
     P = {}
     v = s
-    while True:
-        visited.append(v)
-
-        if v==t:
-            return visited, dist
-            
+    while v != t:
         # Iterate over nodes in angle order
-        found = False
-        for w, edgedata in sorted(G[v].items(), key=lambda x: _angle(G, t, v, x[0])):
-            if w in visited:
-                continue
-            else:
-                found = True
-                v = w
-                P[w] = v
-
-        # If all neighbours have been visited, go to predecessor
-        if not found:
-            v = P[v]
+        j = None
+        for k in ranked(v):
+            if neighbors[k] not in seen:
+                j = k
+                break
+
+        if j is not None:
+            w = neighbors[j]
+            P[w] = (v, j)
+            seen.add(w)
+        elif v == s:
+            return None, None
+        else: # If all neighbours have been visited, go to predecessor
+            w, j = P[v]
+
+        steps.append(j)
+        v = w
+        visited.append(v)
 
+    return visited, steps
 
 
-def _accumulate(betweenness, L):
-    """ Accumulate passage counts for node betweenness """
-    for v in L:
-        betweenness[v] += 1
-    return betweenness 
+def _gsn_target(A, t, angles, best, betweenness, e_betweenness):
+    """ Adds the passage counts of the GSN paths from all sources to t
 
+    The sources in the greedy tree of t go straight to t: each node of the
+    tree is passed by all the sources of its subtree, and so is the edge to
+    its next hop. The paths of the other sources are walked explicitly.
+    `angles` and `best` are the rows of `_angles` and `_next_hops` for t.
+    """
+    tree, size = _greedy_tree(A, t, best)
+
+    betweenness[tree] += size[tree]
+    betweenness[t] += len(tree)
+    np.add.at(e_betweenness, A.edge_index[best[tree]], size[tree])
+
+    outside = np.ones(len(A), dtype=bool)
+    outside[tree] = False
+    outside[t] = False
+    sources = np.flatnonzero(outside).tolist()
+    if sources:
+        ranked = _ranking(A, t, angles)
+    for s in sources:
+        L, steps = _single_gsn_path(A, ranked, s, t)
+        if L is not None:
+            np.add.at(betweenness, L, 1)
+            np.add.at(e_betweenness, A.edge_index[steps], 1)
+
+
+def _gsn_chunk(state, targets):
+    """ Passage counts of the GSN paths to a chunk of targets """
+    A = state['A']
+    half_edges = state['half_edges']
+    betweenness = np.zeros(len(A))
+    e_betweenness = np.zeros(A.number_of_edges())
+    for batch in _batches(list(targets), len(A.neighbors)):
+        angles = _angles(A, half_edges, batch)
+        best = _next_hops(A, angles)
+        for i, t in enumerate(batch):
+            _gsn_target(A, t, angles[i], best[i], betweenness, e_betweenness)
+    if state['edges']:
+        return e_betweenness
+    return betweenness
 
 
-def _accumulate_edge(betweenness, L):
-    """ Accumulate passage counts for edge betweenness """
-    for v,w in zip(L[:-1], L[1:]):
-        if (w,v) not in betweenness:
-            betweenness[(v,w)] += 1
-        else:
-            betweenness[(w,v)] += 1
+def _gsn(G, edges, n_jobs, checkpoint, shard, progress):
+    """ Unnormalized GSN passage counts, summed over targets """
+    A = CSRGraph(G, weight=None)
+    state = {'A': A, 'half_edges': _half_edges(A), 'edges': edges}
+    size = A.number_of_edges() if edges else len(A)
+    key = None
+    if checkpoint is not None:  # hashing the snapshot is linear in its size
+        key = spatialx.checkpoint.digest('gsn %s' % ('edges' if edges
+                                                     else 'nodes'), A)
+    betweenness = spatialx.checkpoint.sweep(_gsn_chunk,
+                                            range(len(A)),
+                                            state,
+                                            (size,),
+                                            key,
+                                            n_jobs,
+                                            checkpoint,
+                                            shard,
+                                            progress=progress)
+    if edges:
+        return A.edge_dict(betweenness)
+    return A.node_dict(betweenness)
+
+
+
+## Sampling
+def _sampled_chunk(state, targets):
+    """ Sums and sums of squares of the passage counts of sampled units
+
+    A unit is a target (all sources) if `state['pairs']` is None, otherwise
+    a sampled pair whose sources are listed for each target. Returns an
+    array of shape (2, n + m): the nodes, then the edges.
+    """
+    A = state['A']
+    half_edges = state['half_edges']
+    pairs = state['pairs']
+    n = len(A)
+    m = A.number_of_edges()
+    totals = np.zeros((2, n + m))
+    if pairs is None:
+        for batch in _batches(list(targets), len(A.neighbors)):
+            angles = _angles(A, half_edges, batch)
+            best = _next_hops(A, angles)
+            for i, t in enumerate(batch):
+                counts = np.zeros(n + m)
+                _gsn_target(A, t, angles[i], best[i], counts[:n], counts[n:])
+                totals[0] += counts
+                totals[1] += counts * counts
+        return totals
+
+    for t in targets:
+        ranked = _ranking(A, t, half_edges=half_edges)
+        for s in pairs[t]:
+            L, steps = _single_gsn_path(A, ranked, s, t)
+            if L is not None:
+                ids, counts = np.unique(
+                    np.concatenate([L, n + A.edge_index[steps]]),
+                    return_counts=True)
+                totals[0, ids] += counts
+                totals[1, ids] += counts * counts
+    return totals
+
+
+def _sample(A, mode, k, rng, n_jobs, progress):
+    """ Estimated passage counts and half-widths (for z=1), nodes then edges
+
+    The estimates are the sums over the units sampled times the number of
+    units over the size of the sample. Targets are drawn without
+    replacement (with a finite population correction of the variance),
+    pairs with replacement.
+    """
+    n = len(A)
+    if mode == 'targets':
+        units = n
+        k = min(k, n)
+        targets = sorted(rng.choice(n, size=k, replace=False).tolist())
+        pairs = None
+        correction = 1 - k / units
+    elif mode == 'pairs':
+        units = n * (n - 1)
+        sources = rng.integers(n, size=k)
+        targets = rng.integers(n - 1, size=k)
+        targets += targets >= sources
+        pairs = {}
+        for s, t in zip(sources.tolist(), targets.tolist()):
+            pairs.setdefault(t, []).append(s)
+        targets = sorted(pairs)
+        correction = 1.0
+    else:
+        raise ValueError("Unknown sampling mode %s" % mode)
 
-    return betweenness
+    state = {'A': A, 'half_edges': _half_edges(A), 'pairs': pairs}
+    # not checkpointed, so the sweep needs no key
+    total, squares = spatialx.checkpoint.sweep(_sampled_chunk,
+                                               targets,
+                                               state,
+                                               (2, n + A.number_of_edges()),
+                                               None,
+                                               n_jobs,
+                                               progress=progress)
+    mean = total / k
+    variance = np.maximum(squares - k * mean * mean, 0) / (k - 1)
+    return (units * mean,
+            units * np.sqrt(correction * variance / k))
 
 
 
@@ -117,7 +386,7 @@ def _rescale_e(betweenness, n, normalized=True, directed=False):
 
     if scale is not None:
         for v in betweenness:
-            betweenness[v] * scale
+            betweenness[v] *= scale
 
     return betweenness
 
@@ -126,23 +395,44 @@ def _rescale_e(betweenness, n, normalized=True, directed=False):
 #
 # Callable functions
 #
-def gsn_centrality(G, normalized=True):
+def gsn_centrality(G, normalized=True, n_jobs=1, checkpoint=None, shard=None,
+                   progress=None):
     """ Compute the Greedy Spatial Navigator centrality
 
     The GSN centrality is defined in [1]_
-    There is a way (not implemented yet) to improve the computation time on this
-    one. Indeed, going to t and starting from s, all nodes on the GSN path from
-    s to t will also follow this path when going to t. 
+    Going to t and starting from s, all nodes on the GSN path from s to t
+    also follow this path when going to t, as long as the navigator does not
+    have to backtrack. The paths to t are thus computed at once from the tree
+    of greedy next hops rooted at t, and only the sources outside of this
+    tree are walked explicitly.
 
     Parameter
     ---------
 
     G: Networkx graph
+        The navigator only uses the position `x`, `y` of the nodes; the
+        lengths of the edges play no role.
 
     normalized: bool
         If set to True, the betweenness values are renormalisez by the total
         number of paths between edges possibles.
 
+    n_jobs: int
+        Number of processes the targets are split between. -1 uses one
+        process per CPU.
+
+    checkpoint: string, optional
+        File where the partial sums are saved periodically. An interrupted
+        computation called again with the same file is resumed.
+
+    shard: tuple (i, k), optional
+        Only computes the i-th of k shards of the targets; the checkpoints of
+        the k shards can then be combined with `merge_checkpoints`.
+
+    progress: function, optional
+        Called as `progress(done, total)` with the number of targets done
+        each time a chunk of targets is finished.
+
     Output
     ------
 
@@ -156,10 +446,7 @@ def gsn_centrality(G, normalized=True):
     .. [1] S.H. Lee and P. Holme
            Physical Review Letter 108:128701 (2012).
     """
-    betweenness = dict.fromkeys(G, 0.0)
-    for s,t in itertools.permutations(G, 2):
-         L, d = gsn_path(G,s,t)
-         betweenness = _accumulate(betweenness, L)
+    betweenness = _gsn(G, False, n_jobs, checkpoint, shard, progress)
 
     betweenness = _rescale(betweenness,
                            len(G),
@@ -170,23 +457,44 @@ def gsn_centrality(G, normalized=True):
 
 
 
-def e_gsn_centrality(G, normalized=True):
+def e_gsn_centrality(G, normalized=True, n_jobs=1, checkpoint=None,
+                     shard=None, progress=None):
     """ Compute the Greedy Spatial Navigator centrality
 
     The GSN centrality is defined in [1]_
-    There is a way (not implemented yet) to improve the computation time on this
-    one. Indeed, going to t and starting from s, all nodes on the GSN path from
-    s to t will also follow this path when going to t. 
+    Going to t and starting from s, all nodes on the GSN path from s to t
+    also follow this path when going to t, as long as the navigator does not
+    have to backtrack. The paths to t are thus computed at once from the tree
+    of greedy next hops rooted at t, and only the sources outside of this
+    tree are walked explicitly.
     
     Parameter
     ---------
 
     G: Networkx graph
+        The navigator only uses the position `x`, `y` of the nodes; the
+        lengths of the edges play no role.
 
     normalized: bool
         If set to True, the betweenness values are renormalisez by the total
         number of paths between edges possibles.
 
+    n_jobs: int
+        Number of processes the targets are split between. -1 uses one
+        process per CPU.
+
+    checkpoint: string, optional
+        File where the partial sums are saved periodically. An interrupted
+        computation called again with the same file is resumed.
+
+    shard: tuple (i, k), optional
+        Only computes the i-th of k shards of the targets; the checkpoints of
+        the k shards can then be combined with `merge_checkpoints`.
+
+    progress: function, optional
+        Called as `progress(done, total)` with the number of targets done
+        each time a chunk of targets is finished.
+
     Output
     ------
 
@@ -199,18 +507,82 @@ def e_gsn_centrality(G, normalized=True):
     .. [1] S.H. Lee and P. Holme
            Physical Review Letter 108:128701 (2012).
     """
-    betweenness = dict.fromkeys(G, 0.0) # b[v] = 0.0
-    betweenness.update(dict.fromkeys(G.edges(), 0.0)) # b[e] = 0.0
-    for s,t in itertools.permutations(G, 2):
-         L, d = gsn_path(G,s,t)
-         betweenness = _accumulate_edges(betweenness, L)
-    
-    ## rescaling
-    for n in G:
-        del betweenness[n]
+    betweenness = _gsn(G, True, n_jobs, checkpoint, shard, progress)
     betweenness = _rescale_e(betweenness,
                              len(G),
                              normalized,
                              directed=G.is_directed())
 
     return betweenness
+
+
+
+def approximate_gsn_centralities(G, mode='targets', k=None, confidence=0.95,
+                                 normalized=True, seed=None,
+                                 n_jobs=1, progress=None):
+    """ Approximate the GSN centrality of nodes and edges by sampling
+
+    The GSN paths are only computed for a random sample of targets, or of
+    (source, target) pairs, and the passage counts of all the paths are
+    extrapolated from them.
+
+    Parameters
+    ----------
+
+    G: Networkx graph
+
+    mode: string
+        'targets' draws `k` distinct targets and computes the paths from all
+        the sources to them, with one greedy tree per target. 'pairs' draws
+        `k` ordered pairs of distinct nodes, with replacement, and walks their
+        paths only; it is cheaper per sample but the estimates vary more.
+
+    k: int
+        Number of targets or pairs sampled, at least 2.
+
+    confidence: float
+        Confidence level of the intervals, computed from the sample variance
+        of the passage counts with a normal approximation. They can be too
+        narrow for small samples, especially with 'targets'.
+
+    normalized, n_jobs, progress:
+        See `gsn_centrality`. The progress is counted in sampled targets.
+
+    seed: int, optional
+        Seed of the random number generator.
+
+    Returns
+    -------
+
+    nodes: dictionary
+        Dictionary of nodes with the estimated GSN centrality as value
+
+    edges: dictionary
+        Dictionary of edges with the estimated GSN centrality as value
+
+    intervals: tuple of dictionaries
+        Dictionaries of nodes and edges with the (low, high) bounds of the
+        confidence intervals as value
+    """
+    if k is None or k < 2:
+        raise ValueError("At least two targets or pairs must be sampled")
+    A = CSRGraph(G, weight=None)
+    n = len(A)
+    if n < 2:
+        raise ValueError("The graph must have at least two nodes")
+    rng = np.random.default_rng(seed)
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+    values, halfwidths = _sample(A, mode, k, rng, n_jobs, progress)
+    halfwidths *= z
+
+    results = []
+    for part, rescale, to_dict in [(slice(None, n), _rescale, A.node_dict),
+                                   (slice(n, None), _rescale_e, A.edge_dict)]:
+        value = rescale(to_dict(values[part]), n, normalized, A.is_directed())
+        width = rescale(to_dict(halfwidths[part]), n, normalized,
+                        A.is_directed())
+        results.append((value,
+                        dict((v, (b - width[v], b + width[v]))
+                             for v, b in value.items())))
+    (nodes, intervals), (edges, e_intervals) = results
+    return nodes, edges, (intervals, e_intervals)
@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+"""multi.py
+
+Several shortest-path centralities of the nodes from a single sweep of
+single-source searches. Each search is followed by the accumulation of the
+betweenness and by the sums, over the targets reached, needed by the
+distance-based metrics:
+
+* closeness: `(r - 1) / sum_t d(s, t)`, scaled by `(r - 1) / (n - 1)` where
+  `r` is the number of nodes reached from `s` (Wasserman and Faust's
+  correction, as in NetworkX);
+* straightness: `1/(n-1) sum_t d_E(s, t) / d(s, t)`, where `d_E` is the
+  Euclidean distance between the positions `x`, `y` of the nodes [1]_;
+* efficiency: `1/(n-1) sum_t 1 / d(s, t)`.
+
+Pairs of nodes that are not connected contribute 0 to the sums. In directed
+graphs the distances are measured from the node (NetworkX's closeness uses
+the distances to it).
+
+.. [1] P. Crucitti, V. Latora and S. Porta
+       Physical Review E 73:036125 (2006).
+"""
+from __future__ import division
+import numpy as np
+
+import spatialx.checkpoint
+from spatialx.centrality.betweenness import (INF,
+                                             _Buffers,
+                                             _snapshot,
+                                             _search,
+                                             _searches,
+                                             _accumulate_generalized,
+                                             _rescale)
+
+
+__all__ = ['centralities']
+
+
+METRICS = ('betweenness', 'closeness', 'straightness', 'efficiency')
+
+#
+# Rows of the accumulator
+#
+BETWEENNESS, DISTANCES, REACHED, STRAIGHTNESS, EFFICIENCY = range(5)
+
+
+#
+# Helper functions
+#
+def _metrics_sweep(A, sources, metrics, cutoff=INF, queue='heap'):
+    """Sums over the targets of each source id, and betweenness
+
+    Returns an array with one row per quantity (see the rows above) and one
+    column per node id.
+    """
+    n = len(A)
+    in_adjacency = A.in_adjacency()
+    buf = _Buffers(n)
+    totals = np.zeros((5, n))
+    betweenness = [0.0] * n
+    ones = [1.0] * n
+    x = A.node_data.get('x')
+    y = A.node_data.get('y')
+    for s in _searches(A, list(sources), buf, cutoff, queue):
+        if 'betweenness' in metrics:
+            _accumulate_generalized(betweenness, buf, in_adjacency, s, ones)
+        # distances of the nodes reached only, in time independent of n
+        distances = buf.D
+        targets = np.array(buf.S[1:], dtype=np.int64)
+        D = np.array([distances[v] for v in buf.S[1:]], dtype=np.float64)
+        positive = D > 0
+        totals[DISTANCES, s] = D.sum()
+        totals[REACHED, s] = len(targets)
+        if 'efficiency' in metrics:
+            totals[EFFICIENCY, s] = (1 / D[positive]).sum()
+        if 'straightness' in metrics:
+            targets = targets[positive]
+            euclidean = np.hypot(x[targets] - x[s], y[targets] - y[s])
+            totals[STRAIGHTNESS, s] = (euclidean / D[positive]).sum()
+        buf.reset()
+    totals[BETWEENNESS] = betweenness
+    return totals
+
+
+def _metrics_chunk(state, sources):
+    """Sweep over a chunk of sources, run in the worker processes"""
+    return _metrics_sweep(state['A'],
+                          sources,
+                          state['metrics'],
+                          state['cutoff'],
+                          state['queue'])
+
+
+
+#
+# Callable functions
+#
+def centralities(G, metrics=METRICS, normalized=True, weight='length',
+                 n_jobs=1, cutoff=None, checkpoint=None, shard=None,
+                 queue='heap'):
+    """ Computes several centralities of the nodes from a single sweep
+
+    Each single-source shortest-path search is run once, and used for all
+    the requested metrics, instead of once per metric.
+
+    Parameters
+    ----------
+
+    G: Networkx graph
+        Or a `CSRGraph` snapshot of one. The straightness needs the position
+        `x`, `y` of all the nodes.
+
+    metrics: list of strings
+        Among 'betweenness', 'closeness', 'straightness' and 'efficiency'. All
+        by default.
+
+    normalized: bool
+        Normalization of the betweenness, as in `betweenness_centrality`.
+
+    weight: string or None
+        Edge attribute used as the length of the edges. If None, all edges
+        have length 1.
+
+    n_jobs, checkpoint, shard, queue:
+        See `betweenness_centrality`.
+
+    cutoff: float, optional
+        Only count the pairs of nodes within this network distance of each
+        other (local centralities).
+
+    Returns
+    -------
+
+    table: dictionary
+        Dictionary of nodes with, as value, the dictionary of their value for
+        each metric.
+
+    Example
+    -------
+
+    >>> table = sx.centralities(G, ['closeness', 'straightness'])
+    >>> table[v]['straightness']
+    """
+    metrics = list(metrics)
+    for metric in metrics:
+        if metric not in METRICS:
+            raise ValueError("Unknown metric %s" % metric)
+
+    A = _snapshot(G, weight)
+    _search(A, queue)  # fail early on an unknown queue
+    if 'straightness' in metrics:
+        if ('x' not in A.node_data or 'y' not in A.node_data or
+                np.isnan(A.node_data['x']).any() or
+                np.isnan(A.node_data['y']).any()):
+            raise ValueError("The straightness needs the x and y attributes "
+                             "of all the nodes")
+
+    n = len(A)
+    state = {'A': A, 'metrics': metrics, 'queue': queue,
+             'cutoff': INF if cutoff is None else cutoff}
+    key = None
+    if checkpoint is not None:  # hashing the snapshot is linear in its size
+        key = spatialx.checkpoint.digest('centralities',
+                                         A,
+                                         metrics=sorted(metrics),
+                                         cutoff=state['cutoff'],
+                                         queue=queue)
+    totals = spatialx.checkpoint.sweep(_metrics_chunk,
+                                       range(n),
+                                       state,
+                                       (5, n),
+                                       key,
+                                       n_jobs,
+                                       checkpoint,
+                                       shard)
+
+    columns = {}
+    if 'betweenness' in metrics:
+        columns['betweenness'] = _rescale(A.node_dict(totals[BETWEENNESS]), n,
+                                          normalized, A.is_directed())
+    if 'closeness' in metrics:
+        reached = totals[REACHED]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            closeness = reached / totals[DISTANCES]
+        closeness[totals[DISTANCES] == 0] = 0.0
+        if n > 1:
+            closeness *= reached / (n - 1)
+        columns['closeness'] = A.node_dict(closeness)
+    for metric, row in [('straightness', STRAIGHTNESS),
+                        ('efficiency', EFFICIENCY)]:
+        if metric in metrics:
+            columns[metric] = A.node_dict(totals[row] / max(n - 1, 1))
+
+    return dict((v, dict((metric, columns[metric][v]) for metric in metrics))
+                for v in A.nodes)
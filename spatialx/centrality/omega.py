@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+"""omega.py
+
+Weightings `omega_st` of the pairs of nodes for the generalized betweenness.
+
+The weighting can be given as
+
+* a function `omega(G, s, t)`, called for every pair of nodes;
+* a per-source function wrapped with `source_omega`, called once per source
+  as `omega(G, s, D)` where `D` is the array of the network distances from
+  `s` to all the nodes, in the order of `list(G)` (`inf` for the nodes that
+  are not reached). It returns the array of the weights in the same order;
+* a tuple `(source_attribute, target_attribute, model)` of node attributes,
+  with `model` either 'product' (`a_s b_t`) or 'gravity'
+  (`a_s b_t / d_st`). `(source_attribute, target_attribute, 'gravity', beta)`
+  gives `a_s b_t / d_st^beta`. Missing attributes count as 0.
+
+With the last two forms the weights of all the targets of a source are
+computed at once with NumPy, instead of one interpreted call per pair.
+"""
+from __future__ import division
+import numpy as np
+import networkx as nx
+
+from spatialx.classes.csrgraph import CSRGraph
+
+
+__all__ = ['source_omega']
+
+
+#
+# Helper functions
+#
+class _SourceOmega(object):
+    """Per-source weighting, see `source_omega`"""
+
+    def __init__(self, func):
+        self.func = func
+
+    def __call__(self, G, s, D):
+        return self.func(G, s, D)
+
+
+def _node_attribute(G, A, name):
+    """Array of a node attribute, in the order of the snapshot's node ids
+
+    Read from the snapshot if it holds the attribute, otherwise from G,
+    which cannot be a snapshot itself.
+    """
+    if name in A.node_data:
+        values = A.node_data[name]
+    elif G is None or isinstance(G, CSRGraph):
+        raise ValueError("The snapshot has no node attribute %s, take it "
+                         "with CSRGraph(G, attributes=[...])" % name)
+    else:
+        attribute = nx.get_node_attributes(G, name)
+        values = np.array([attribute.get(v, 0.0) for v in A.nodes],
+                          dtype=np.float64)
+    return np.nan_to_num(values)
+
+
+def _distances(buf):
+    """Distances from the current source as an array indexed by node id"""
+    return np.array(buf.D)
+
+
+def _settled(buf, values):
+    """Weight buffer, indexed by node id, set for the nodes reached
+
+    `values` are the weights of the nodes of `buf.S`, in the same order.
+    """
+    weights = buf.omega
+    for w, x in zip(buf.S, values):
+        weights[w] = x
+    return weights
+
+
+def _omega_pairs(omega, G, nodes, s, buf):
+    """Evaluates omega(G, s, t) for all the nodes t reached from s"""
+    weights = buf.omega
+    source = nodes[s]
+    for w in buf.S:
+        weights[w] = omega(G, source, nodes[w])
+    return weights
+
+
+def _omega_attributes(omegas):
+    """Node attributes read by the tuple weightings"""
+    names = []
+    for omega in omegas:
+        if isinstance(omega, tuple):
+            names.extend(name for name in omega[:2] if name not in names)
+    return names
+
+
+def _needs_graph(omegas):
+    """True if a weighting is a function, called with the graph"""
+    return any(omega is not None and not isinstance(omega, tuple)
+               for omega in omegas)
+
+
+def _omega_weights(omega, G, A):
+    """Weights of the pairs (s, t) for a given source s
+
+    Returns a function `weights(s, buf)`, to be called once the shortest
+    paths from `s` are in the buffers `buf`, which returns a sequence of
+    weights indexed by target id. Only the weights of the nodes reached,
+    `buf.S`, are set: the other entries are left over from earlier sources.
+    Except for the per-source functions, which get all the distances, the
+    weights cost time proportional to the number of nodes reached.
+    """
+    n = len(A)
+
+    if omega is None:
+        ones = [1.0] * n
+        return lambda s, buf: ones
+
+    if isinstance(omega, _SourceOmega):
+        nodes = A.nodes
+        return lambda s, buf: np.asarray(omega(G, nodes[s],
+                                                _distances(buf)),
+                                         dtype=np.float64).tolist()
+
+    if isinstance(omega, tuple):
+        if len(omega) == 3:
+            source, target, model = omega
+            beta = 1
+        else:
+            source, target, model, beta = omega
+        a = _node_attribute(G, A, source)
+        b = _node_attribute(G, A, target)
+        if model == 'product':
+            return lambda s, buf: _settled(buf, (a[s] * b[buf.S]).tolist())
+        if model == 'gravity':
+            def gravity(s, buf):
+                S = buf.S
+                D = np.array([buf.D[w] for w in S])
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    weights = a[s] * b[S] / D ** beta
+                weights[D == 0] = 0.0
+                return _settled(buf, np.nan_to_num(weights,
+                                                   posinf=0.0).tolist())
+            return gravity
+        raise ValueError("Unknown omega model %s" % model)
+
+    return lambda s, buf: _omega_pairs(omega, G, A.nodes, s, buf)
+
+
+
+#
+# Callable functions
+#
+def source_omega(func):
+    """ Marks a weighting as computing the weights of a source at once
+
+    Parameters
+    ----------
+
+    func: function
+        Called as `func(G, s, D)` for each source `s`, with `D` the array of
+        network distances from `s` to all nodes in the order of `list(G)`.
+        Returns an array with the weights of the pairs `(s, t)` in the same
+        order.
+
+    Returns
+    -------
+
+    omega: weighting to pass to the generalized betweenness functions
+
+    Example
+    -------
+
+    >>> omega = source_omega(lambda G, s, D: np.exp(-D / 1000.))
+    >>> sx.gbetweenness_centrality(G, omega)
+    """
+    return _SourceOmega(func)
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""queues.py
+
+Single-source shortest-path search on a CSR snapshot with another priority
+queue than the default binary heap with lazy deletion (`heapq`), which
+pushes a new entry at every improvement of a tentative distance and pops the
+stale ones later.
+
+* 'dial': Dial's bucket queue. Tentative distances are quantized in buckets
+  of width `quantum`, kept in a circular array of lists, so that pushing an
+  entry is a list append. Since edge lengths are non-negative, an entry is
+  never pushed in a bucket before the current one. The bucket being emptied
+  is sorted by exact distance (entries pushed in it, with edges shorter than
+  the quantum, are inserted in order): the nodes are settled in exactly the
+  same order as with a binary heap, whatever the quantum, and the number of
+  shortest paths `sigma` is counted with the same exact comparisons.
+
+The search has the signature of
+`spatialx.centrality.betweenness._single_source_dijkstra_csr`, and fills the
+same buffers.
+"""
+from bisect import insort
+
+
+INF = float('inf')
+
+
+#
+# Helper functions
+#
+
+## Dial's bucket queue
+def _quantum(lengths, buckets=1024):
+    """Default bucket width and number of buckets for the given lengths
+
+    The width is the shortest positive edge length, so that a node is never
+    pushed in the bucket being emptied, enlarged if needed so that the
+    circular array does not need more than `buckets` lists.
+    """
+    positive = [l for l in lengths if l > 0]
+    if not positive:
+        return 1.0, 2
+    longest = max(positive)
+    quantum = max(min(positive), longest / (buckets - 2))
+    return quantum, int(longest / quantum) + 2
+
+
+def _single_source_dial_csr(adjacency, s, buf, target=None, cutoff=INF,
+                            quantum=1.0, size=2):
+    """Single-source shortest paths with Dial's bucket queue
+
+    `size` must be larger than `max(lengths) / quantum + 1`, so that all the
+    pending entries fit in the circular array of buckets.
+    """
+    offsets, neighbors, lengths, _ = adjacency
+    S = buf.S
+    D = buf.D
+    seen = buf.seen
+    sigma = buf.sigma
+    touched = buf.touched
+    if len(buf.buckets) != size:
+        buf.buckets = [[] for i in range(size)]
+    buckets = buf.buckets
+    scale = 1.0 / quantum
+
+    seen[s] = 0.0
+    sigma[s] = 1.0
+    touched.append(s)
+    buckets[0].append((0.0, s))
+    pending = 1  # number of entries in the buckets
+    b = 0        # current bucket
+    while pending:
+        Q = buckets[b % size]
+        if not Q:
+            b += 1
+            continue
+        buckets[b % size] = []
+        Q.sort()
+        i = 0
+        while i < len(Q):
+            (dist, v) = Q[i]
+            i += 1
+            pending -= 1
+            if D[v] != INF:
+                continue  # already searched this node.
+            D[v] = dist
+            S.append(v)
+            if v == target:
+                for bucket in buckets:
+                    del bucket[:]
+                return S
+            sigmav = sigma[v]
+            for j in range(offsets[v], offsets[v + 1]):
+                w = neighbors[j]
+                vw_dist = dist + lengths[j]
+                if vw_dist > cutoff:
+                    continue
+                seenw = seen[w]
+                if vw_dist < seenw:
+                    if seenw == INF:
+                        touched.append(w)
+                    seen[w] = vw_dist
+                    sigma[w] = sigmav
+                    k = int(vw_dist * scale)
+                    if k == b:  # only with lengths shorter than the quantum
+                        insort(Q, (vw_dist, w), i)
+                    else:
+                        buckets[k % size].append((vw_dist, w))
+                    pending += 1
+                elif vw_dist == seenw:  # handle equal paths
+                    sigma[w] += sigmav
+        b += 1
+    return S
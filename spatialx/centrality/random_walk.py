@@ -2,25 +2,406 @@
 """random_walk.py
 
 Algorithms to compute the random walk centrality on spatial networks.
-We directly use the implementation in NetworkX.
+
+The random walk (current-flow) betweenness [1]_ of an edge is the current
+flowing through it, summed over all pairs of nodes `(s, t)` when a unit
+current enters the network at `s` and leaves it at `t`; the edges are
+resistors whose conductance is their `weight` attribute, as in NetworkX.
+
+Once one node of a connected component is grounded, the Laplacian of the
+component restricted to the other nodes is invertible, and for an edge
+`e = (u, v)` of conductance `c` the vector
+
+    F_e = c L^{-1} (1_u - 1_v)
+
+gives the current through `e` for every pair as `|F_e[s] - F_e[t]|`. The sum
+over all pairs is obtained by sorting `F_e`, and the throughput of the nodes
+`u` and `v` from the same vector. A single sparse factorization of the
+Laplacian is reused for the solves of all the edges, which are done in
+blocks of right-hand sides whose size is set by a memory budget; the
+components are processed one after the other.
+
+.. [1] M.E.J. Newman
+       Social Networks 27:39 (2005).
 """
+from __future__ import division
+from statistics import NormalDist
 import numpy as np
 import networkx as nx
 
+from spatialx.classes.csrgraph import CSRGraph
+
 
 __all__ = ['randomwalk_centrality',
-            'e_randomwalk_centrality']
+           'e_randomwalk_centrality',
+           'randomwalk_centralities',
+           'approximate_randomwalk_centralities']
 
 
 #
 # Helper functions
 #
+def _components(A):
+    """Node ids of the connected components of an undirected snapshot"""
+    import scipy.sparse
+    import scipy.sparse.csgraph
+
+    n = len(A)
+    adjacency = scipy.sparse.csr_matrix((np.ones(len(A.neighbors)),
+                                         A.neighbors, A.offsets),
+                                        shape=(n, n))
+    k, labels = scipy.sparse.csgraph.connected_components(adjacency,
+                                                          directed=False)
+    order = np.argsort(labels, kind='stable')
+    bounds = np.searchsorted(labels[order], np.arange(k + 1))
+    return [order[bounds[i]:bounds[i + 1]] for i in range(k)]
+
+
+def _factorize(nodes, tails, heads, conductances, solver):
+    """Grounded Laplacian of a component, returns a function solving it
+
+    The last node of the component is grounded: the returned function maps
+    a `(len(nodes), k)` array of currents to the potentials of the nodes,
+    the one of the grounded node being 0.
+    """
+    import scipy.sparse
+    import scipy.sparse.linalg
+
+    n = len(nodes) - 1
+    keep = (tails < n) & (heads < n)
+    degrees = np.bincount(tails, weights=conductances, minlength=n + 1)[:n]
+    L = scipy.sparse.csc_matrix(
+        (np.concatenate([-conductances[keep], degrees]),
+         (np.concatenate([tails[keep], np.arange(n)]),
+          np.concatenate([heads[keep], np.arange(n)]))),
+        shape=(n, n))
+
+    if solver == 'lu':
+        lu = scipy.sparse.linalg.splu(L)
+        solve = lu.solve
+    elif solver == 'cg':
+        M = scipy.sparse.diags(1 / degrees)
+
+        def solve(B):
+            X = np.empty_like(B)
+            for j in range(B.shape[1]):
+                X[:, j], info = scipy.sparse.linalg.cg(L, B[:, j], M=M,
+                                                       rtol=1e-10)
+                if info > 0:
+                    raise nx.NetworkXError("The conjugate gradient did not "
+                                           "converge")
+            return X
+    else:
+        raise ValueError("Unknown solver %s" % solver)
+
+    def potentials(B):
+        X = np.zeros_like(B)
+        X[:n] = solve(np.ascontiguousarray(B[:n]))
+        return X
+    return potentials
+
+
+def _pair_sums(F, u, v):
+    """Sums over the pairs of nodes of the currents of a block of edges
+
+    `F` holds one column per edge. Returns, for each edge, the sum of
+    `|F[s] - F[t]|` over the pairs `s < t`, and the sums over the pairs
+    that contain the end nodes `u` and `v` of the edge.
+    """
+    n = F.shape[0]
+    ranks = 2 * np.arange(n) - (n - 1)
+    total = np.dot(ranks, np.sort(F, axis=0))
+    columns = np.arange(F.shape[1])
+    through_u = np.abs(F - F[u, columns]).sum(axis=0)
+    through_v = np.abs(F - F[v, columns]).sum(axis=0)
+    return total, through_u, through_v
+
+
+def _snapshot(G, weight):
+    if G.is_directed():
+        raise nx.NetworkXError("Random walk centrality is only defined for "
+                               "undirected graphs")
+    return CSRGraph(G, weight, attributes=())
+
+
+def _parts(A):
+    """Components of at least two nodes and their edges
+
+    Yields the node ids of each component, and its CSR entries as arrays of
+    local tail and head ids, conductances and edge ids.
+    """
+    n = len(A)
+    tails = np.repeat(np.arange(n), np.diff(A.offsets))
+    heads = A.neighbors
+    for component in _components(A):
+        if len(component) < 2:
+            continue
+        local = np.full(n, -1, dtype=np.int64)
+        local[component] = np.arange(len(component))
+        inside = local[tails] >= 0
+        yield (component,
+               local[tails[inside]],
+               local[heads[inside]],
+               A.lengths[inside],
+               A.edge_index[inside])
+
+
+def _sizes(A):
+    """Size of the component of each node id"""
+    sizes = np.ones(len(A), dtype=np.int64)
+    for component in _components(A):
+        sizes[component] = len(component)
+    return sizes
+
+
+def _current_flow(G, weight, solver, memory):
+    """Node and edge current-flow betweenness, summed over unordered pairs
+
+    Returns the snapshot, the arrays of node and edge values indexed by id,
+    and the size of the component of each node.
+    """
+    A = _snapshot(G, weight)
+    nodes = np.zeros(len(A))
+    edges = np.zeros(A.number_of_edges())
+
+    for component, t, h, c, e in _parts(A):
+        size = len(component)
+        potentials = _factorize(component, t, h, c, solver)
+
+        # one entry per edge, the self-loops carry no current
+        once = t < h
+        t, h, c, e = t[once], h[once], c[once], e[once]
+        block = max(1, int(memory // (32 * size)))
+        for i in range(0, len(e), block):
+            k = min(block, len(e) - i)
+            B = np.zeros((size, k))
+            B[t[i:i + k], np.arange(k)] = c[i:i + k]
+            B[h[i:i + k], np.arange(k)] -= c[i:i + k]
+            total, through_t, through_h = _pair_sums(potentials(B),
+                                                     t[i:i + k], h[i:i + k])
+            edges[e[i:i + k]] += total
+            np.add.at(nodes, component[t[i:i + k]], (total - through_t) / 2)
+            np.add.at(nodes, component[h[i:i + k]], (total - through_h) / 2)
+    return A, nodes, edges, _sizes(A)
+
+
+## Approximation
+def _pair_currents(potentials, size, t, h, c, sources, targets):
+    """Currents through the edges for sampled pairs, from potential solves
+
+    Returns the absolute currents as an array with one row per edge and one
+    column per pair.
+    """
+    k = len(sources)
+    B = np.zeros((size, k))
+    B[sources, np.arange(k)] = 1.0
+    B[targets, np.arange(k)] -= 1.0
+    P = potentials(B)
+    return np.abs(c[:, None] * (P[t] - P[h]))
+
+
+def _walk_currents(A, walk, edge_local, m, sources, targets, walkers, rng):
+    """Currents through the edges for sampled pairs, from random walkers
+
+    `walkers` walkers start from each source and move to a neighbour with a
+    probability proportional to the conductance of the edge, until they are
+    absorbed by the target. The net number of crossings of an edge, divided
+    by the number of walkers, is an unbiased estimate of its signed current
+    [1]_, but its absolute value is biased upwards, by about the standard
+    deviation of the mean on the edges that carry little current.
+    """
+    offsets, neighbors, edge_index, cum, tails = walk
+    k = len(sources)
+    pair = np.repeat(np.arange(k), walkers)
+    position = np.repeat(sources, walkers)
+    target = np.repeat(targets, walkers)
+    net = np.zeros(k * m)
+    while len(position):
+        start = offsets[position]
+        x = cum[start] + rng.random(len(position)) * (cum[offsets[position + 1]]
+                                                      - cum[start])
+        j = np.searchsorted(cum, x, side='right') - 1
+        j = np.clip(j, start, offsets[position + 1] - 1)
+        following = neighbors[j]
+        e = edge_index[j]
+        sign = np.where(position == tails[e], 1.0, -1.0)
+        sign[following == position] = 0.0
+        np.add.at(net, pair * m + edge_local[e], sign)
+        position = following
+        walking = position != target
+        pair = pair[walking]
+        position = position[walking]
+        target = target[walking]
+    return np.abs(net.reshape(k, m).T) / walkers
+
+
+def _sample(A, mode, k, epsilon, walkers, z, solver, memory, rng,
+            batch=64):
+    """Sampled (s, t) pairs, returns the estimates and half-widths
+
+    The pairs are drawn uniformly among the pairs of nodes of the same
+    component. The estimates are the sums over these pairs, the half-widths
+    those of the confidence intervals from the sample variance. With `k`
+    None, batches of pairs are drawn until all the half-widths, divided by
+    the number of pairs of the component, are below `epsilon` (or as many
+    pairs as there are in the graph have been drawn).
+    """
+    import scipy.sparse
+
+    n = len(A)
+    m = A.number_of_edges()
+    parts = []
+    for component, t, h, c, e in _parts(A):
+        once = t < h
+        parts.append((component, t, h, c, e, once))
+    sizes = np.array([len(part[0]) for part in parts], dtype=np.float64)
+    pairs = sizes * (sizes - 1) / 2
+    total = pairs.sum()
+
+    sums = [np.zeros(n), np.zeros(m)]
+    squares = [np.zeros(n), np.zeros(m)]
+    per_pair = np.zeros(n)
+    e_per_pair = np.zeros(m)
+    for i, part in enumerate(parts):
+        per_pair[part[0]] = pairs[i]
+        e_per_pair[part[4]] = pairs[i]
+    if total == 0:
+        return sums[0], sums[1], squares[0], squares[1]
+
+    if mode == 'walks':
+        cum = np.concatenate([[0.0], np.cumsum(A.lengths)])
+        tails = np.array([A.index[u] for u, v in A.edges], dtype=np.int64)
+        walk = (A.offsets, A.neighbors, A.edge_index, cum, tails)
+    elif mode != 'pairs':
+        raise ValueError("Unknown approximation mode %s" % mode)
+    solvers = {}
+
+    drawn = 0
+    while True:
+        size = k - drawn if k is not None else batch
+        if size <= 0:
+            break
+        chosen = rng.choice(len(parts), size=size, p=pairs / total)
+        for i in np.unique(chosen):
+            component, t, h, c, e, once = parts[i]
+            number = int((chosen == i).sum())
+            sources = rng.integers(len(component), size=number)
+            targets = rng.integers(len(component) - 1, size=number)
+            targets += targets >= sources
+            t1, h1, c1, e1 = t[once], h[once], c[once], e[once]
+            block = max(1, int(memory // (32 * max(len(component),
+                                                   len(e1)))))
+            for j in range(0, number, block):
+                S = sources[j:j + block]
+                T = targets[j:j + block]
+                if mode == 'pairs':
+                    if i not in solvers:
+                        solvers[i] = _factorize(component, t, h, c, solver)
+                    currents = _pair_currents(solvers[i], len(component),
+                                              t1, h1, c1, S, T)
+                else:
+                    edge_local = np.zeros(m, dtype=np.int64)
+                    edge_local[e1] = np.arange(len(e1))
+                    currents = _walk_currents(A, walk, edge_local, len(e1),
+                                              component[S], component[T],
+                                              walkers, rng)
+                # throughput of the nodes, except the source and target
+                incidence = scipy.sparse.csr_matrix(
+                    (np.ones(2 * len(e1)),
+                     (np.concatenate([t1, h1]),
+                      np.tile(np.arange(len(e1)), 2))),
+                    shape=(len(component), len(e1)))
+                throughput = incidence.dot(currents) / 2
+                throughput[S, np.arange(len(S))] = 0.0
+                throughput[T, np.arange(len(S))] = 0.0
+                sums[0][component] += throughput.sum(axis=1)
+                squares[0][component] += (throughput ** 2).sum(axis=1)
+                sums[1][e1] += currents.sum(axis=1)
+                squares[1][e1] += (currents ** 2).sum(axis=1)
+        drawn += size
+
+        if drawn > 1:
+            estimates = [total * x / drawn for x in sums]
+            halfwidths = []
+            for x, x2 in zip(sums, squares):
+                mean = x / drawn
+                variance = np.maximum(x2 / drawn - mean ** 2, 0) * (
+                    drawn / (drawn - 1))
+                halfwidths.append(z * total * np.sqrt(variance / drawn))
+            if k is None:
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    error = max(np.nanmax(halfwidths[0] / per_pair),
+                                np.nanmax(halfwidths[1] / e_per_pair))
+                if error <= epsilon or drawn >= total:
+                    break
+    return estimates[0], estimates[1], halfwidths[0], halfwidths[1]
+
+
+def _scale(values, sizes, normalized, factor=2.0):
+    """Normalizes by the number of pairs of the component of each value
+
+    The factors are those of NetworkX, which halves the edge values.
+    """
+    if not normalized:
+        return values * factor / 2.0
+    scale = (sizes - 1.0) * (sizes - 2.0)
+    scale[scale == 0] = 1.0
+    return values * factor / scale
+
 
 
 #
 # Callable functions
 #
-def randomwalk_centrality(G, normalized=True):
+def randomwalk_centralities(G, normalized=True, weight='length', solver='lu',
+                            memory=2**27):
+    """ Compute the random walk centrality of nodes and edges
+
+    Both are computed from the same solves, which is about twice as fast as
+    calling `randomwalk_centrality` and `e_randomwalk_centrality`.
+
+    Parameters
+    ----------
+
+    G: Networkx graph
+        Undirected graph, possibly disconnected: the centralities are
+        computed on each connected component.
+
+    normalized: bool
+        If True, the values are normalised as in NetworkX, with `n` the
+        number of nodes of the component.
+
+    weight: string
+        Edge attribute used as the conductance of the edges, as in NetworkX.
+        Missing values count as 1.
+
+    solver: string
+        'lu' factorizes the Laplacian of each component once, 'cg' solves
+        the systems with a Jacobi-preconditioned conjugate gradient, slower
+        but without fill-in.
+
+    memory: int
+        Approximate size, in bytes, of the blocks of solutions held in
+        memory at once (besides the factorization).
+
+    Returns
+    -------
+
+    nodes: dictionary
+        Dictionary of nodes with RW centrality as values
+
+    edges: dictionary
+        Dictionary of edges with RW centrality as values
+    """
+    A, nodes, edges, sizes = _current_flow(G, weight, solver, memory)
+    nodes = _scale(nodes, sizes, normalized)
+    ends = np.array([A.index[u] for u, v in A.edges], dtype=np.int64)
+    edges = _scale(edges, sizes[ends], normalized, factor=1.0)
+    return A.node_dict(nodes), A.edge_dict(edges)
+
+
+def randomwalk_centrality(G, normalized=True, weight='length', solver='lu',
+                          memory=2**27):
     """ Compute the random walk centrality of nodes
 
     Parameters
@@ -33,18 +414,20 @@ def randomwalk_centrality(G, normalized=True):
         If True, we normalise the total betweenness value by the total number of
         pair of nodes in the graph `n(n-1)/2`
 
+    weight, solver, memory:
+        See `randomwalk_centralities`.
+
     Returns
     -------
 
     nodes: dictionary
         Dictionary of nodes with RW centrality as values
     """
-    return nx.current_flow_betweenness_centrality(G, 
-                                                  normalized, 
-                                                  weight='length')
+    return randomwalk_centralities(G, normalized, weight, solver, memory)[0]
 
 
-def e_randomwalk_centrality(G, normalized=True):
+def e_randomwalk_centrality(G, normalized=True, weight='length', solver='lu',
+                            memory=2**27):
     """ Compute the random walk centrality of edges
 
     Parameters
@@ -57,14 +440,100 @@ def e_randomwalk_centrality(G, normalized=True):
         If True, we normalise the total betweenness value by the total number of
         pair of nodes in the graph `n(n-1)/2`
 
+    weight, solver, memory:
+        See `randomwalk_centralities`.
+
     Returns
     -------
 
     edges: dictionary
         Dictionary of edges with RW centrality as values
     """
-    return nx.edge_current_flow_betweenness_centrality(G, 
-                                                  normalized, 
-                                                  weight='length')
+    return randomwalk_centralities(G, normalized, weight, solver, memory)[1]
+
+
+def approximate_randomwalk_centralities(G, mode='pairs', k=None,
+                                        epsilon=0.01, walkers=100,
+                                        confidence=0.95, normalized=True,
+                                        weight='length', seed=None,
+                                        solver='lu', memory=2**27):
+    """ Approximate the random walk centrality of nodes and edges by sampling
+
+    The currents are only computed for a random sample of pairs of nodes,
+    drawn uniformly among the pairs of nodes of the same component, and the
+    sums over all pairs are extrapolated from them.
+
+    Parameters
+    ----------
+
+    G: Networkx graph
+        Undirected graph, possibly disconnected.
+
+    mode: string
+        'pairs' solves for the potentials of each sampled pair, using the
+        factorization of the Laplacian of its component. 'walks' simulates,
+        for each pair, `walkers` random walkers from s absorbed at t, whose
+        net numbers of crossings of the edges estimate the currents; it does
+        not need any linear solve but is biased upwards, noticeably so even
+        with hundreds of walkers, and has no confidence intervals.
+
+    k: int, optional
+        Number of pairs sampled. If None, pairs are drawn by batches until
+        the half-widths of all the intervals, divided by the number of pairs
+        of the component, are below `epsilon`. Required in the 'walks'
+        mode, whose bias the half-widths do not bound.
 
+    epsilon: float
+        Error tolerance when k is None ('pairs' mode).
 
+    walkers: int
+        Number of walkers per pair ('walks' mode).
+
+    confidence: float
+        Confidence level of the intervals.
+
+    normalized, weight, solver, memory:
+        See `randomwalk_centralities`.
+
+    seed: int, optional
+        Seed of the random number generator.
+
+    Returns
+    -------
+
+    nodes: dictionary
+        Dictionary of nodes with the estimated RW centrality as value
+
+    edges: dictionary
+        Dictionary of edges with the estimated RW centrality as value
+
+    intervals: tuple of dictionaries
+        Dictionaries of nodes and edges with the (low, high) bounds of the
+        confidence intervals as value. None in the 'walks' mode, whose bias
+        is not covered by intervals from the sample variance.
+    """
+    if k is not None and k < 2:
+        raise ValueError("At least two pairs must be sampled")
+    if k is None and mode == 'walks':
+        raise ValueError("The number of pairs k is needed in the walks mode")
+    A = _snapshot(G, weight)
+    rng = np.random.default_rng(seed)
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+    nodes, edges, halfwidths, e_halfwidths = _sample(A, mode, k, epsilon,
+                                                     walkers, z, solver,
+                                                     memory, rng)
+    sizes = _sizes(A)
+    ends = sizes[[A.index[u] for u, v in A.edges]]
+    results = []
+    for values, width, size, factor, to_dict in [
+            (nodes, halfwidths, sizes, 2.0, A.node_dict),
+            (edges, e_halfwidths, ends, 1.0, A.edge_dict)]:
+        values = _scale(values, size, normalized, factor)
+        width = _scale(width, size, normalized, factor)
+        results.append((to_dict(values),
+                        to_dict(np.array([values - width,
+                                          values + width]).T.tolist())))
+    (nodes, intervals), (edges, e_intervals) = results
+    if mode == 'walks':
+        return nodes, edges, None
+    return nodes, edges, (intervals, e_intervals)
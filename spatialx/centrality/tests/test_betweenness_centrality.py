@@ -1,6 +1,11 @@
 from nose.tools import *
+import os
+import random
+import tempfile
+import numpy as np
 import networkx as nx
 import spatialx as sx
+from spatialx.centrality.approximate import _vertex_diameter
 
 class TestBetweennessCentrality(object):
 
@@ -30,3 +35,319 @@ class TestWeightedBetweennessCentrality(object):
                                     normalized=False)
         for n in sorted(G):
             assert_almost_equal(b[n],b_answer[n])
+
+
+def _uniform(G, s, t):
+    return 1.0
+
+
+def _weighted_graph():
+    G = nx.Graph()
+    G.add_weighted_edges_from([(0,2,2), (0,3,6), (0,4,4),
+                               (1,3,5), (1,5,5), (2,4,1),
+                               (3,4,2), (3,5,1), (4,5,4),
+                               (0,1,3)], weight='length')
+    return G
+
+
+class TestGeneralizedBetweennessCentrality(object):
+
+    def test_uniform_omega(self):
+        """Generalized betweenness: uniform omega is the usual betweenness"""
+        G = _weighted_graph()
+        b = sx.gbetweenness_centrality(G, _uniform, normalized=False)
+        b_answer={0: 2.0, 1: 0.0, 2: 4.0, 3: 3.0, 4: 4.0, 5: 0.0}
+        for n in sorted(G):
+            assert_almost_equal(b[n],b_answer[n])
+
+    def test_edges_uniform_omega(self):
+        """Generalized edge betweenness: uniform omega is the usual one"""
+        G = _weighted_graph()
+        b = sx.e_gbetweenness_centrality(G, _uniform, normalized=False)
+        b_answer = nx.edge_betweenness_centrality(G, normalized=False,
+                                                  weight='length')
+        for e in b_answer:
+            assert_almost_equal(b[e],b_answer[e])
+
+    def test_snapshot(self):
+        """Generalized betweenness: same result on a CSR snapshot"""
+        G = _weighted_graph()
+        A = sx.CSRGraph(G)
+        omega = lambda G, s, t: s + t
+        assert_equal(sx.gbetweenness_centrality(A, omega),
+                     sx.gbetweenness_centrality(G, omega))
+        assert_equal(sx.e_gbetweenness_centrality(A, omega),
+                     sx.e_gbetweenness_centrality(G, omega))
+
+    def test_parallel(self):
+        """Generalized betweenness: same result whatever the number of jobs"""
+        G = nx.grid_2d_graph(6, 6)
+        for u, v in G.edges():
+            G[u][v]['length'] = 1.0 + 0.1 * (u[0] + v[1])
+        b = sx.e_gbetweenness_centrality(G, _uniform)
+        for n_jobs in [2, 3]:
+            assert_equal(sx.e_gbetweenness_centrality(G, _uniform,
+                                                      n_jobs=n_jobs), b)
+        assert_equal(sx.betweenness_centrality(G, n_jobs=2),
+                     sx.betweenness_centrality(G))
+
+
+class TestApproximateBetweennessCentrality(object):
+
+    def test_all_pivots(self):
+        """Approximate betweenness: exact when all nodes are pivots"""
+        G = _weighted_graph()
+        b, ci = sx.approximate_gbetweenness_centrality(G, k=len(G), seed=1)
+        b_answer = sx.betweenness_centrality(G)
+        for n in sorted(G):
+            assert_almost_equal(b[n],b_answer[n])
+            assert_almost_equal(ci[n][0],b_answer[n])
+            assert_almost_equal(ci[n][1],b_answer[n])
+
+    def test_coverage(self):
+        """Approximate betweenness: coverage of the pivot intervals"""
+        G = nx.grid_2d_graph(10, 10)
+        b_answer = sx.betweenness_centrality(G)
+        e_answer = sx.e_betweenness_centrality(G, normalized=True)
+        inside = []
+        e_inside = []
+        for seed in range(5):
+            b, ci = sx.approximate_gbetweenness_centrality(G, k=30, seed=seed)
+            inside += [ci[n][0] <= b_answer[n] <= ci[n][1] for n in G]
+            b, ci = sx.e_approximate_gbetweenness_centrality(
+                G, k=30, normalized=True, seed=seed)
+            e_inside += [ci[e][0] <= e_answer[e] <= ci[e][1]
+                         for e in e_answer]
+        # the intervals are heuristic, below their nominal 95%
+        assert_true(sum(inside) >= 0.7 * len(inside))
+        assert_true(sum(e_inside) >= 0.65 * len(e_inside))
+
+    def test_unseen(self):
+        """Approximate betweenness: nodes no pivot contributes to"""
+        G = nx.grid_2d_graph(10, 10)
+        nx.set_edge_attributes(G, 1.0, 'length')
+        # 'v' is only on the shortest paths between 'x' and 'y'
+        for u, v, l in [('x', 'v', 1.0), ('v', 'y', 1.0), ('x', 'u', 1.0),
+                        ('u', 'y', 1.5), ('u', (0, 0), 1.0)]:
+            G.add_edge(u, v, length=l)
+        b_answer = sx.betweenness_centrality(G)
+        assert_true(b_answer['v'] > 0)
+        unseen = 0
+        for seed in range(5):
+            b, ci = sx.approximate_gbetweenness_centrality(G, k=10, seed=seed)
+            if b['v'] == 0:
+                unseen += 1
+                assert_true(ci['v'][1] >= b_answer['v'])
+        assert_true(unseen > 0)
+
+    def test_vertex_diameter(self):
+        """Approximate betweenness: vertex diameter of a disconnected graph"""
+        G = nx.path_graph(20)
+        G.add_nodes_from(range(20, 40))   # isolated nodes
+        G.add_edge(40, 41)
+        A = sx.CSRGraph(G, weight=None)
+        for seed in range(10):
+            vd = _vertex_diameter(A, A.adjacency(), A.in_adjacency(),
+                                  random.Random(seed))
+            assert_true(vd >= 20)
+
+    def test_paths(self):
+        """Approximate betweenness: path sampling within epsilon"""
+        G = nx.grid_2d_graph(8, 8)
+        b, ci = sx.e_approximate_gbetweenness_centrality(G, mode='paths',
+                                                         epsilon=0.02,
+                                                         normalized=True,
+                                                         seed=1)
+        b_answer = sx.e_betweenness_centrality(G)
+        for e in b_answer:
+            assert_true(abs(b[e] - b_answer[e]) <= 0.02)
+            assert_true(ci[e][0] <= b_answer[e] <= ci[e][1])
+
+
+class TestOmega(object):
+
+    def test_gravity(self):
+        """Generalized betweenness: vectorized gravity omega"""
+        G = _weighted_graph()
+        for v in G:
+            G.nodes[v]['pop'] = 1.0 + v
+        D = dict(nx.all_pairs_dijkstra_path_length(G, weight='length'))
+        def gravity(G, s, t):
+            if s == t:
+                return 0.0
+            return G.nodes[s]['pop'] * G.nodes[t]['pop'] / D[s][t]
+        b_answer = sx.e_gbetweenness_centrality(G, gravity)
+        b = sx.e_gbetweenness_centrality(G, ('pop', 'pop', 'gravity'))
+        for e in b_answer:
+            assert_almost_equal(b[e],b_answer[e])
+
+    def test_snapshot_attributes(self):
+        """Generalized betweenness: attributes read from a snapshot"""
+        G = _weighted_graph()
+        for v in G:
+            G.nodes[v]['pop'] = 1.0 + v
+        b_answer = sx.gbetweenness_centrality(G, ('pop', 'pop', 'product'))
+        A = sx.CSRGraph(G, attributes=('pop',))
+        b = sx.gbetweenness_centrality(A, ('pop', 'pop', 'product'))
+        for v in b_answer:
+            assert_almost_equal(b[v],b_answer[v])
+        assert_raises(ValueError, sx.gbetweenness_centrality, sx.CSRGraph(G),
+                      ('pop', 'pop', 'product'))
+
+    def test_source_omega(self):
+        """Generalized betweenness: per-source omega"""
+        G = _weighted_graph()
+        D = dict(nx.all_pairs_dijkstra_path_length(G, weight='length'))
+        omega = sx.source_omega(lambda G, s, D: np.exp(-D))
+        b_answer = sx.gbetweenness_centrality(G,
+                                              lambda G, s, t: np.exp(-D[s][t]))
+        b = sx.gbetweenness_centrality(G, omega)
+        for n in G:
+            assert_almost_equal(b[n],b_answer[n])
+
+    def test_multiple_omegas(self):
+        """Generalized betweenness: several omegas in one sweep"""
+        G = _weighted_graph()
+        for v in G:
+            G.nodes[v]['pop'] = 1.0 + v
+        omegas = {'uniform': _uniform,
+                  'gravity': ('pop', 'pop', 'gravity'),
+                  'product': ('pop', 'pop', 'product')}
+        b = sx.e_gbetweenness_centrality(G, omegas)
+        for name, omega in omegas.items():
+            b_answer = sx.e_gbetweenness_centrality(G, omega)
+            for e in b_answer:
+                assert_almost_equal(b[name][e],b_answer[e])
+        b = sx.gbetweenness_centrality(G, list(omegas.values()), n_jobs=2)
+        for i, omega in enumerate(omegas.values()):
+            b_answer = sx.gbetweenness_centrality(G, omega)
+            for n in G:
+                assert_almost_equal(b[i][n],b_answer[n])
+
+
+class TestLocalBetweennessCentrality(object):
+
+    def test_path(self):
+        """Local betweenness: path graph"""
+        G = nx.path_graph(5)
+        b = sx.betweenness_centrality(G, normalized=False, cutoff=2)
+        b_answer = {0: 0.0, 1: 1.0, 2: 1.0, 3: 1.0, 4: 0.0}
+        for n in sorted(G):
+            assert_almost_equal(b[n],b_answer[n])
+
+    def test_radii(self):
+        """Local betweenness: several radii from one search per source"""
+        G = _weighted_graph()
+        b = sx.e_gbetweenness_centrality(G, _uniform, cutoff=[3, 5, 100])
+        for r in [3, 5]:
+            b_answer = sx.e_gbetweenness_centrality(G, _uniform, cutoff=r)
+            for e in b_answer:
+                assert_almost_equal(b[r][e],b_answer[e])
+        b_answer = sx.e_gbetweenness_centrality(G, _uniform)
+        for e in b_answer:
+            assert_almost_equal(b[100][e],b_answer[e])
+
+
+class TestDynamicBetweennessCentrality(object):
+
+    def test_updates(self):
+        """Dynamic betweenness: same as a full recomputation"""
+        G = _weighted_graph()
+        B = sx.DynamicBetweenness(G)
+        B.remove_edge(2, 4)
+        B.add_edge(1, 2, length=1.5)
+        B.set_length(3, 5, 4)
+        G.remove_edge(2, 4)
+        G.add_edge(1, 2, length=1.5)
+        G[3][5]['length'] = 4
+        b = B.betweenness()
+        b_answer = sx.betweenness_centrality(G)
+        for n in G:
+            assert_almost_equal(b[n],b_answer[n])
+        b = B.edge_betweenness()
+        b_answer = sx.e_betweenness_centrality(G, normalized=False)
+        assert_equal(len(b), len(b_answer))
+        for u, v in b_answer:
+            assert_almost_equal(b.get((u, v), b.get((v, u))),b_answer[(u, v)])
+
+
+class TestHopCountBetweennessCentrality(object):
+
+    def test_directed(self):
+        """Hop-count betweenness: same as NetworkX on a directed graph"""
+        G = nx.gnp_random_graph(150, 0.03, seed=1, directed=True)
+        b = sx.betweenness_centrality(G, weight=None)
+        b_answer = nx.betweenness_centrality(G)
+        for n in sorted(G):
+            assert_almost_equal(b[n],b_answer[n])
+        b = sx.e_betweenness_centrality(G, weight=None)
+        b_answer = nx.edge_betweenness_centrality(G)
+        for e in b_answer:
+            assert_almost_equal(b[e],b_answer[e])
+
+    def test_cutoff(self):
+        """Hop-count betweenness: same as with unit lengths"""
+        G = nx.gnp_random_graph(100, 0.05, seed=2)
+        b = sx.betweenness_centrality(G, weight=None, cutoff=[2, 3])
+        nx.set_edge_attributes(G, 1.0, 'length')
+        for r in [2, 3]:
+            b_answer = sx.betweenness_centrality(G, cutoff=r)
+            for n in sorted(G):
+                assert_almost_equal(b[r][n],b_answer[n])
+
+
+class TestPriorityQueues(object):
+
+    def test_queues(self):
+        """Priority queues: same betweenness with the bucket queue"""
+        G = _weighted_graph()
+        G.add_edge(2, 5, length=0.0)
+        b_answer = sx.e_betweenness_centrality(G)
+        assert_equal(sx.e_betweenness_centrality(G, queue='dial'), b_answer)
+        assert_raises(ValueError, sx.betweenness_centrality, G,
+                      queue='fibonacci')
+
+
+class TestCheckpoint(object):
+
+    def test_resume(self):
+        """Checkpoint: a finished checkpoint gives the same result"""
+        G = _weighted_graph()
+        path = os.path.join(tempfile.mkdtemp(), 'b.npz')
+        b_answer = sx.betweenness_centrality(G)
+        b = sx.betweenness_centrality(G, checkpoint=path)
+        assert_equal(b, b_answer)
+        b = sx.betweenness_centrality(G, checkpoint=path)
+        assert_equal(b, b_answer)
+        assert_raises(ValueError, sx.e_betweenness_centrality, G,
+                      checkpoint=path)
+
+    def test_other_computation(self):
+        """Checkpoint: resuming another computation is refused"""
+        G = _weighted_graph()
+        path = os.path.join(tempfile.mkdtemp(), 'b.npz')
+        sx.gbetweenness_centrality(G, _uniform, checkpoint=path)
+        assert_raises(ValueError, sx.gbetweenness_centrality, G,
+                      lambda G, s, t: 2.0, checkpoint=path)
+        assert_raises(ValueError, sx.gbetweenness_centrality, G, _uniform,
+                      cutoff=2.0, checkpoint=path)
+        assert_raises(ValueError, sx.gbetweenness_centrality, G, _uniform,
+                      weight=None, checkpoint=path)
+        assert_raises(ValueError, sx.betweenness_centrality, G,
+                      checkpoint=path)
+        sx.gbetweenness_centrality(G, _uniform, checkpoint=path)
+
+    def test_shards(self):
+        """Checkpoint: merged shards give the full result"""
+        G = _weighted_graph()
+        directory = tempfile.mkdtemp()
+        paths = [os.path.join(directory, '%d.npz' % i) for i in range(3)]
+        for i, path in enumerate(paths):
+            sx.e_gbetweenness_centrality(G, _uniform, checkpoint=path,
+                                         shard=(i, 3))
+        merged = os.path.join(directory, 'merged.npz')
+        sx.merge_checkpoints(paths, merged)
+        b = sx.e_gbetweenness_centrality(G, _uniform, checkpoint=merged)
+        b_answer = sx.e_gbetweenness_centrality(G, _uniform)
+        for e in b_answer:
+            assert_almost_equal(b[e],b_answer[e])
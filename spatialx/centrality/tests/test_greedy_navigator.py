@@ -0,0 +1,121 @@
+from nose.tools import *
+import numpy as np
+import networkx as nx
+import spatialx as sx
+from spatialx.centrality.greedy_navigator import (_half_edges,
+                                                  _ranking,
+                                                  _single_gsn_path)
+
+
+def _grid():
+    G = nx.grid_2d_graph(4, 4)
+    for v in G:
+        G.nodes[v]['x'], G.nodes[v]['y'] = v
+    for u, v in G.edges():
+        G[u][v]['length'] = 1.0
+    return G
+
+
+class TestGSNCentrality(object):
+
+    def test_path(self):
+        """GSN centrality: on a path the navigator follows the path"""
+        G = nx.path_graph(4)
+        for v in G:
+            G.nodes[v]['x'], G.nodes[v]['y'] = v, 0.0
+        b = sx.gsn_centrality(G, normalized=False)
+        b_answer = {0: 3.0, 1: 5.0, 2: 5.0, 3: 3.0}
+        for n in sorted(G):
+            assert_almost_equal(b[n],b_answer[n])
+
+    def test_parallel(self):
+        """GSN centrality: same result with several processes"""
+        G = _grid()
+        G.remove_edge((1, 1), (1, 2))
+        assert_equal(sx.gsn_centrality(G, n_jobs=2), sx.gsn_centrality(G))
+        assert_equal(sx.e_gsn_centrality(G, n_jobs=2), sx.e_gsn_centrality(G))
+
+    def test_walks(self):
+        """GSN centrality: same counts as walking every path"""
+        G = nx.random_geometric_graph(40, 0.25, seed=3)
+        for v in G:
+            G.nodes[v]['x'], G.nodes[v]['y'] = G.nodes[v]['pos']
+        A = sx.CSRGraph(G)
+        b_answer = np.zeros(len(A))
+        half_edges = _half_edges(A)
+        for t in range(len(A)):
+            ranked = _ranking(A, t, half_edges=half_edges)
+            for s in range(len(A)):
+                if s != t:
+                    L, steps = _single_gsn_path(A, ranked, s, t)
+                    if L is not None:
+                        np.add.at(b_answer, L, 1)
+        b = sx.gsn_centrality(G, normalized=False)
+        for n in G:
+            assert_almost_equal(b[n],b_answer[A.index[n]] / 2)
+
+    def test_progress(self):
+        """GSN centrality: progress reported up to the number of targets"""
+        G = _grid()
+        calls = []
+        sx.gsn_centrality(G, progress=lambda done, total:
+                          calls.append((done, total)))
+        assert_equal(calls[-1], (16, 16))
+        assert_equal(calls, sorted(calls))
+
+
+class TestApproximateGSNCentrality(object):
+
+    def test_all_targets(self):
+        """Approximate GSN centrality: exact when all targets are drawn"""
+        G = _grid()
+        G.remove_edge((1, 1), (1, 2))
+        nodes, edges, (intervals, e_intervals) = \
+            sx.approximate_gsn_centralities(G, 'targets', k=16, seed=1)
+        b = sx.gsn_centrality(G)
+        e = sx.e_gsn_centrality(G)
+        for n in G:
+            assert_almost_equal(nodes[n], b[n])
+            assert_almost_equal(intervals[n][0], intervals[n][1])
+        for edge in e:
+            assert_almost_equal(edges[edge], e[edge])
+
+    def test_pairs(self):
+        """Approximate GSN centrality: sampled pairs, any number of jobs"""
+        G = _grid()
+        b = sx.gsn_centrality(G)
+        nodes, edges, intervals = \
+            sx.approximate_gsn_centralities(G, 'pairs', k=2000, seed=1)
+        again = sx.approximate_gsn_centralities(G, 'pairs', k=2000, seed=1,
+                                                n_jobs=2)
+        assert_equal(nodes, again[0])
+        assert_equal(edges, again[1])
+        for n in G:
+            assert_true(abs(nodes[n] - b[n]) < 0.1)
+
+    def test_coverage(self):
+        """Approximate GSN centrality: the intervals cover the exact values"""
+        G = _grid()
+        b = sx.gsn_centrality(G)
+        e = sx.e_gsn_centrality(G)
+        inside = []
+        e_inside = []
+        for seed in range(5):
+            intervals, e_intervals = sx.approximate_gsn_centralities(
+                G, 'pairs', k=2000, confidence=0.95, seed=seed)[2]
+            inside += [intervals[n][0] <= b[n] <= intervals[n][1] for n in G]
+            e_inside += [e_intervals[x][0] <= e[x] <= e_intervals[x][1]
+                         for x in e]
+        assert_true(sum(inside) >= 0.85 * len(inside))
+        assert_true(sum(e_inside) >= 0.85 * len(e_inside))
+
+    def test_errors(self):
+        G = _grid()
+        assert_raises(ValueError, sx.approximate_gsn_centralities, G)
+        assert_raises(ValueError, sx.approximate_gsn_centralities, G,
+                      'edges', 10)
+        G = nx.cycle_graph(6)
+        assert_raises(ValueError, sx.gsn_centrality, G)
+        assert_raises(ValueError, sx.approximate_gsn_centralities, G, k=5)
+        G.nodes[0]['x'] = G.nodes[0]['y'] = 0.0
+        assert_raises(ValueError, sx.e_gsn_centrality, G)
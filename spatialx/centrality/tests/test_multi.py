@@ -0,0 +1,60 @@
+from nose.tools import *
+import os
+import tempfile
+import networkx as nx
+import spatialx as sx
+
+
+def _path():
+    G = nx.path_graph(4)
+    for v in G:
+        G.nodes[v]['x'], G.nodes[v]['y'] = 2.0 * v, 0.0
+    for u, v in G.edges():
+        G[u][v]['length'] = 2.0
+    return G
+
+
+class TestCentralities(object):
+
+    def test_path(self):
+        """Centralities: straight path"""
+        G = _path()
+        table = sx.centralities(G, normalized=False)
+        b_answer = sx.betweenness_centrality(G, normalized=False)
+        c_answer = nx.closeness_centrality(G, distance='length')
+        for n in sorted(G):
+            assert_almost_equal(table[n]['betweenness'],b_answer[n])
+            assert_almost_equal(table[n]['closeness'],c_answer[n])
+            assert_almost_equal(table[n]['straightness'],1.0)
+        assert_almost_equal(table[0]['efficiency'],(1/2. + 1/4. + 1/6.)/3)
+
+    def test_disconnected(self):
+        """Centralities: components and subset of metrics"""
+        G = _path()
+        G.add_edge(10, 11, length=1.0)
+        G.nodes[10].update(x=0.0, y=5.0)
+        G.nodes[11].update(x=1.0, y=5.0)
+        table = sx.centralities(G, ['closeness', 'efficiency'])
+        c_answer = nx.closeness_centrality(G, distance='length')
+        for n in sorted(G):
+            assert_equal(sorted(table[n]), ['closeness', 'efficiency'])
+            assert_almost_equal(table[n]['closeness'],c_answer[n])
+        assert_almost_equal(table[10]['efficiency'],1/5.)
+
+    def test_missing_positions(self):
+        """Centralities: straightness needs the positions"""
+        G = nx.path_graph(3)
+        assert_raises(ValueError, sx.centralities, G, ['straightness'])
+        assert_raises(ValueError, sx.centralities, G, ['pagerank'])
+
+    def test_checkpoint(self):
+        """Centralities: a checkpoint of another cutoff or weight is refused"""
+        G = _path()
+        path = os.path.join(tempfile.mkdtemp(), 'c.npz')
+        sx.centralities(G, cutoff=5.0, checkpoint=path)
+        assert_raises(ValueError, sx.centralities, G, cutoff=10.0,
+                      checkpoint=path)
+        assert_raises(ValueError, sx.centralities, G, cutoff=5.0,
+                      weight=None, checkpoint=path)
+        table = sx.centralities(G, cutoff=5.0, checkpoint=path)
+        assert_equal(table, sx.centralities(G, cutoff=5.0))
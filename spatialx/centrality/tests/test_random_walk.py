@@ -0,0 +1,87 @@
+from nose.tools import *
+import networkx as nx
+import spatialx as sx
+
+
+def _graph():
+    G = nx.connected_watts_strogatz_graph(30, 4, 0.3, seed=1)
+    for k, (u, v) in enumerate(G.edges()):
+        G[u][v]['length'] = 1.0 + (k % 3) / 2.
+    return G
+
+
+class TestRandomWalkCentrality(object):
+
+    def test_networkx(self):
+        """Random walk centrality: same as NetworkX"""
+        G = _graph()
+        for normalized in [True, False]:
+            b, eb = sx.randomwalk_centralities(G, normalized, memory=1000)
+            b_answer = nx.current_flow_betweenness_centrality(G, normalized,
+                                                              weight='length')
+            for n in sorted(G):
+                assert_almost_equal(b[n],b_answer[n])
+            b_answer = nx.edge_current_flow_betweenness_centrality(
+                G, normalized, weight='length')
+            for (u, v), x in b_answer.items():
+                assert_almost_equal(eb.get((u, v), eb.get((v, u))),x)
+
+    def test_components(self):
+        """Random walk centrality: each component on its own"""
+        G = _graph()
+        H = nx.disjoint_union(G, nx.path_graph(3))
+        H.add_node('isolated')
+        b = sx.randomwalk_centrality(H, solver='cg')
+        b_answer = sx.randomwalk_centrality(G)
+        for n in sorted(G):
+            assert_almost_equal(b[n],b_answer[n])
+        assert_almost_equal(b[31],1.0)
+        assert_equal(b['isolated'],0.0)
+
+
+class TestApproximateRandomWalkCentrality(object):
+
+    def test_pairs(self):
+        """Approximate random walk centrality: intervals and seed"""
+        G = _graph()
+        b, eb = sx.randomwalk_centralities(G)
+        nodes, edges, (intervals, e_intervals) = \
+            sx.approximate_randomwalk_centralities(G, k=300, seed=1)
+        inside = [intervals[n][0] <= b[n] <= intervals[n][1] for n in G]
+        assert_true(sum(inside) >= 0.8 * len(G))
+        inside = [e_intervals[e][0] <= eb[e] <= e_intervals[e][1]
+                  for e in eb]
+        assert_true(sum(inside) >= 0.8 * len(eb))
+        again = sx.approximate_randomwalk_centralities(G, k=300, seed=1)
+        assert_equal(again[0], nodes)
+
+    def test_coverage(self):
+        """Approximate random walk centrality: coverage of the intervals"""
+        G = _graph()
+        b, eb = sx.randomwalk_centralities(G)
+        for confidence, low, high in [(0.95, 0.9, 1.0), (0.5, 0.35, 0.65)]:
+            inside = []
+            e_inside = []
+            for seed in range(10):
+                intervals, e_intervals = sx.approximate_randomwalk_centralities(
+                    G, k=200, confidence=confidence, seed=seed)[2]
+                inside += [intervals[n][0] <= b[n] <= intervals[n][1]
+                           for n in G]
+                e_inside += [e_intervals[e][0] <= eb[e] <= e_intervals[e][1]
+                             for e in eb]
+            assert_true(low <= sum(inside) / len(inside) <= high)
+            assert_true(low <= sum(e_inside) / len(e_inside) <= high)
+
+    def test_walks_tree(self):
+        """Approximate random walk centrality: walkers on a tree"""
+        G = nx.path_graph(4)
+        nodes, edges, intervals = sx.approximate_randomwalk_centralities(
+            G, mode='walks', k=2000, walkers=3, seed=2, normalized=False)
+        assert_true(intervals is None)
+        b, eb = sx.randomwalk_centralities(G, normalized=False)
+        for n in G:
+            assert_true(abs(nodes[n] - b[n]) < 0.3)
+        assert_raises(ValueError, sx.approximate_randomwalk_centralities, G,
+                      mode='jumps', k=10)
+        assert_raises(ValueError, sx.approximate_randomwalk_centralities, G,
+                      mode='walks')
@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+"""checkpoint.py
+
+Resumable sweeps for long-running computations.
+
+Centralities are sums over sources (or targets) of independent
+contributions. The sources are split in chunks (see
+`spatialx.parallel.partition`) and, when a checkpoint file is given, the sum
+of the contributions of the finished chunks is saved periodically together
+with the list of the finished sources. An interrupted computation started
+again with the same checkpoint file only processes the remaining sources.
+
+The sources can also be split in shards run on different machines, each with
+its own checkpoint file; `merge_checkpoints` then combines the files, and the
+computation started with the merged file returns the complete result.
+"""
+import os
+import time
+import hashlib
+import numpy as np
+
+import spatialx.parallel
+
+
+__all__ = ['merge_checkpoints']
+
+
+#
+# Helper functions
+#
+def _load(path, key, shape):
+    """Reads a checkpoint, returns the partial sum and the finished sources"""
+    with np.load(path) as data:
+        if str(data['key']) != key or data['total'].shape != shape:
+            raise ValueError("Checkpoint %s was written by another "
+                             "computation (%s)" % (path, data['key']))
+        return data['total'].copy(), set(data['finished'].tolist())
+
+
+def _save(path, key, total, finished):
+    """Writes a checkpoint, atomically replacing the previous one"""
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        np.savez(f,
+                 key=np.array(key),
+                 total=total,
+                 finished=np.array(sorted(finished), dtype=np.int64))
+    os.replace(tmp, path)
+
+
+def digest(kind, A, **params):
+    """Key of a computation on the snapshot A, from all its parameters
+
+    The key holds the kind of computation, the size of the graph and a hash
+    of its adjacency, edge lengths, node attributes (the positions) and of
+    the `repr` of the parameters, so that a checkpoint cannot be resumed by
+    a computation that would give a different result.
+    """
+    h = hashlib.sha1()
+    for array in (A.offsets, A.neighbors, A.lengths, A.edge_index):
+        h.update(np.ascontiguousarray(array).tobytes())
+    for name in sorted(A.node_data):
+        h.update(name.encode('utf-8'))
+        h.update(np.ascontiguousarray(A.node_data[name]).tobytes())
+    h.update(repr(A.weight).encode('utf-8'))
+    for name in sorted(params):
+        h.update(('%s=%r;' % (name, params[name])).encode('utf-8'))
+    return '%s n=%d m=%d %s' % (kind, len(A), A.number_of_edges(),
+                                h.hexdigest())
+
+
+def sweep(func, sources, state, shape, key, n_jobs=1, checkpoint=None,
+          shard=None, every=300, progress=None):
+    """Sums `func(state, chunk)` over the chunks of sources
+
+    Parameters
+    ----------
+
+    func: function
+        Module-level function returning the contribution of a list of sources
+        as an array of the given shape.
+
+    sources: list
+        Ids of all the sources of the computation.
+
+    state: dictionary
+        Data shared by all chunks, see `spatialx.parallel.imap`.
+
+    shape: tuple
+        Shape of the result.
+
+    key: string
+        Identifies the computation, so that a checkpoint file cannot be
+        resumed by a different one. Only used with a checkpoint.
+
+    n_jobs: int
+        Number of worker processes.
+
+    checkpoint: string, optional
+        Path of the checkpoint file. If it exists the computation is resumed
+        from it; it is updated every `every` seconds and at the end.
+
+    shard: tuple (i, k), optional
+        Only process the i-th of k shards of the chunks (0 <= i < k).
+
+    progress: function, optional
+        Called as `progress(done, total)` after each chunk, with the number
+        of sources finished (resumed ones included) and to process.
+
+    Returns
+    -------
+
+    total: numpy array
+        Sum of the contributions of the sources processed (all of them unless
+        a shard is given).
+    """
+    chunks = spatialx.parallel.partition(sources)
+    if shard is not None:
+        i, k = shard
+        chunks = chunks[i::k]
+
+    total = np.zeros(shape)
+    finished = set()
+    if checkpoint is not None and os.path.exists(checkpoint):
+        total, finished = _load(checkpoint, key, shape)
+
+    todo = [[s for s in chunk if s not in finished] for chunk in chunks]
+    todo = [chunk for chunk in todo if chunk]
+    count = sum(len(chunk) for chunk in chunks)
+    done = count - sum(len(chunk) for chunk in todo)
+
+    last = time.time()
+    for chunk, partial in zip(todo, spatialx.parallel.imap(func, todo, state,
+                                                          n_jobs)):
+        total += partial
+        finished.update(chunk)
+        done += len(chunk)
+        if progress is not None:
+            progress(done, count)
+        if checkpoint is not None and time.time() - last > every:
+            _save(checkpoint, key, total, finished)
+            last = time.time()
+
+    if checkpoint is not None:
+        _save(checkpoint, key, total, finished)
+
+    return total
+
+
+
+#
+# Callable functions
+#
+def merge_checkpoints(paths, path):
+    """ Merges the checkpoints of shards of the same computation
+
+    Parameters
+    ----------
+
+    paths: list of strings
+        Checkpoint files written by the different shards.
+
+    path: string
+        Path of the merged checkpoint file. Running the computation again with
+        it as checkpoint returns the result.
+    """
+    total = None
+    finished = set()
+    for p in paths:
+        with np.load(p) as data:
+            key = str(data['key'])
+            shard_finished = set(data['finished'].tolist())
+            if total is None:
+                first = key
+                total = np.zeros(data['total'].shape)
+            elif key != first or data['total'].shape != total.shape:
+                raise ValueError("Checkpoint %s was written by another "
+                                 "computation (%s)" % (p, key))
+            if shard_finished & finished:
+                raise ValueError("Checkpoint %s overlaps with the other "
+                                 "shards" % p)
+            total += data['total']
+            finished |= shard_finished
+    _save(path, first, total, finished)
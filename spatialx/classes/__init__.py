@@ -2,3 +2,5 @@
 
 import spatialx.classes
 from spatialx.classes import unionfind
+from spatialx.classes.csrgraph import *
+from spatialx.classes.dcel import *
@@ -0,0 +1,197 @@
+"""csrgraph.py
+
+Frozen, array-backed snapshot of a spatial network.
+
+The snapshot stores the adjacency of the graph in compressed sparse row (CSR)
+form: nodes are relabelled with consecutive integers and the neighbours of
+node `i` are `neighbors[offsets[i]:offsets[i+1]]`. Each of these half-edges
+carries its length and the index of the edge of the original graph it comes
+from, so that results computed on the snapshot can be mapped back to the
+original node and edge keys.
+"""
+import numpy as np
+import networkx as nx
+
+
+__all__ = ['CSRGraph']
+
+
+
+#
+# Helper functions
+#
+def _compress(tails, heads, lengths, eids, n):
+    """Sort half-edges by tail and return the CSR arrays"""
+    order = np.argsort(tails, kind='mergesort')
+    offsets = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(tails, minlength=n), out=offsets[1:])
+    return offsets, heads[order], lengths[order], eids[order]
+
+
+
+class CSRGraph(object):
+    """Compressed sparse row snapshot of a (spatial) NetworkX graph.
+
+    Attributes
+    ----------
+
+    nodes: list
+        Original node keys, `nodes[i]` is the key of node `i`.
+
+    index: dictionary
+        Inverse of `nodes`, maps node keys to integer ids.
+
+    edges: list
+        Original edge keys, in the order of `G.edges()`.
+
+    offsets, neighbors, lengths, edge_index: numpy arrays
+        Outgoing half-edges in CSR form. For undirected graphs every edge is
+        stored twice, once in each direction, with the same edge index.
+
+    in_offsets, in_neighbors, in_lengths, in_edge_index: numpy arrays
+        Incoming half-edges in CSR form. For undirected graphs these are the
+        same arrays as the outgoing ones.
+
+    node_data: dictionary
+        Node attributes captured with the snapshot, as arrays indexed by node
+        id (NaN where the attribute is missing).
+    """
+
+    def __init__(self, G, weight='length', attributes=('x', 'y')):
+        """Take a snapshot of G
+
+        Parameters
+        ----------
+
+        G: Networkx graph
+
+        weight: string or None
+            Edge attribute holding the length of the edges. If None, or if an
+            edge does not have this attribute, the edge has length 1.
+
+        attributes: list of strings
+            Numerical node attributes to copy in the snapshot. By default the
+            position of the nodes.
+        """
+        self.weight = weight
+        self.directed = G.is_directed()
+        self.nodes = list(G)
+        self.index = dict((v, i) for i, v in enumerate(self.nodes))
+        self.edges = []
+
+        self.node_data = {}
+        for name in attributes:
+            values = nx.get_node_attributes(G, name)
+            self.node_data[name] = np.array([values.get(v, np.nan)
+                                             for v in self.nodes],
+                                            dtype=np.float64)
+
+        tails = []
+        heads = []
+        lengths = []
+        eids = []
+        for k, (u, v, data) in enumerate(G.edges(data=True)):
+            self.edges.append((u, v))
+            if weight is None:
+                l = 1.0
+            else:
+                l = float(data.get(weight, 1))
+            i = self.index[u]
+            j = self.index[v]
+            tails.append(i)
+            heads.append(j)
+            lengths.append(l)
+            eids.append(k)
+            if not self.directed and i != j:
+                tails.append(j)
+                heads.append(i)
+                lengths.append(l)
+                eids.append(k)
+
+        n = len(self.nodes)
+        tails = np.array(tails, dtype=np.int64)
+        heads = np.array(heads, dtype=np.int64)
+        lengths = np.array(lengths, dtype=np.float64)
+        eids = np.array(eids, dtype=np.int64)
+
+        (self.offsets,
+         self.neighbors,
+         self.lengths,
+         self.edge_index) = _compress(tails, heads, lengths, eids, n)
+
+        if self.directed:
+            (self.in_offsets,
+             self.in_neighbors,
+             self.in_lengths,
+             self.in_edge_index) = _compress(heads, tails, lengths, eids, n)
+        else:
+            self.in_offsets = self.offsets
+            self.in_neighbors = self.neighbors
+            self.in_lengths = self.lengths
+            self.in_edge_index = self.edge_index
+
+        self._adjacency = None
+        self._in_adjacency = None
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def __iter__(self):
+        return iter(self.nodes)
+
+    def __contains__(self, v):
+        return v in self.index
+
+    def __getstate__(self):
+        """Do not pickle the list caches, they are rebuilt on demand"""
+        state = self.__dict__.copy()
+        state['_adjacency'] = None
+        state['_in_adjacency'] = None
+        return state
+
+    def is_directed(self):
+        return self.directed
+
+    def number_of_nodes(self):
+        return len(self.nodes)
+
+    def number_of_edges(self):
+        return len(self.edges)
+
+    def adjacency(self):
+        """Outgoing CSR arrays as Python lists
+
+        Element access on lists is much faster than on NumPy arrays, which
+        matters for the interpreted shortest-path kernels. The lists are built
+        once and cached.
+        """
+        if self._adjacency is None:
+            self._adjacency = (self.offsets.tolist(),
+                               self.neighbors.tolist(),
+                               self.lengths.tolist(),
+                               self.edge_index.tolist())
+        return self._adjacency
+
+    def in_adjacency(self):
+        """Incoming CSR arrays as Python lists (see `adjacency`)"""
+        if not self.directed:
+            return self.adjacency()
+        if self._in_adjacency is None:
+            self._in_adjacency = (self.in_offsets.tolist(),
+                                  self.in_neighbors.tolist(),
+                                  self.in_lengths.tolist(),
+                                  self.in_edge_index.tolist())
+        return self._in_adjacency
+
+    def node_dict(self, values):
+        """Map an array indexed by node id back to a node-keyed dictionary"""
+        if isinstance(values, np.ndarray):
+            values = values.tolist()
+        return dict(zip(self.nodes, values))
+
+    def edge_dict(self, values):
+        """Map an array indexed by edge id back to an edge-keyed dictionary"""
+        if isinstance(values, np.ndarray):
+            values = values.tolist()
+        return dict(zip(self.edges, values))
+
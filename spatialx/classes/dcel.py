@@ -0,0 +1,327 @@
+"""dcel.py
+
+Half-edge (doubly-connected edge list) representation of a planar embedding.
+
+Every edge `e` of the graph is split in two half-edges of opposite
+directions, `2e` (from the first node of the edge to the second) and
+`2e + 1`, so that the twin of the half-edge `h` is `h ^ 1`. The half-edges
+leaving each node are sorted counter-clockwise by angle, all nodes at once,
+which gives the rotation system of the embedding. The half-edge following
+`h = (u, v)` along its face is the one leaving `v` just clockwise of the
+twin `(v, u)`: the bounded faces are traversed counter-clockwise, with the
+face on the left of its half-edges, and the outer face of each connected
+component clockwise. The faces are the cycles of this `next` permutation,
+found in a single pass over the half-edges.
+
+For very large networks the walk along the faces can be split in square
+tiles of the plane, run in worker processes. Each half-edge belongs to the
+tile of its tail; the walk in a tile gives the faces contained in the tile,
+and chains of half-edges that leave it. The chains are then stitched along
+`next` into the faces that cross the tiles. The faces, and their numbering,
+are the same whatever the tiling.
+"""
+import numpy as np
+import networkx as nx
+
+import spatialx.parallel
+
+
+__all__ = ['DCEL']
+
+
+
+#
+# Helper functions
+#
+def _rotation(tails, dx, dy, n):
+    """Half-edges sorted counter-clockwise around their tail
+
+    Returns the sorted half-edges, the offsets of the block of each node,
+    and the position of each half-edge in the sorted array.
+    """
+    order = np.lexsort((np.arctan2(dy, dx), tails))
+    offsets = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(tails, minlength=n), out=offsets[1:])
+    position = np.empty_like(order)
+    position[order] = np.arange(len(order))
+    return order, offsets, position
+
+
+def _cycles(nxt):
+    """Cycles of a permutation, as a face id per element and face CSR arrays"""
+    nxt = nxt.tolist()
+    face = [-1] * len(nxt)
+    cycles = []
+    offsets = [0]
+    for h in range(len(nxt)):
+        if face[h] != -1:
+            continue
+        f = len(offsets) - 1
+        while face[h] == -1:
+            face[h] = f
+            cycles.append(h)
+            h = nxt[h]
+        offsets.append(len(cycles))
+    return (np.array(face, dtype=np.int64),
+            np.array(offsets, dtype=np.int64),
+            np.array(cycles, dtype=np.int64))
+
+
+def _tiles(x, y, tiles):
+    """Id of the square tile of each node, on a `tiles` x `tiles` grid"""
+    def cell(c):
+        low, high = c.min(), c.max()
+        if high == low:
+            return np.zeros(len(c), dtype=np.int64)
+        return np.minimum(((c - low) * tiles / (high - low)).astype(np.int64),
+                          tiles - 1)
+    return cell(x) * tiles + cell(y)
+
+
+def _walk_tile(state, task):
+    """Walks the faces along the half-edges of a tile
+
+    The task holds the sorted half-edges of the tile and their `next`.
+    Returns the chains (open walks, from a half-edge entering the tile to one
+    leaving it) and the cycles contained in the tile, each as offsets and
+    half-edges. Every cycle starts at its smallest half-edge.
+    """
+    half_edges, nxt = task
+    n = len(half_edges)
+    local = np.minimum(np.searchsorted(half_edges, nxt), n - 1)
+    local = np.where(half_edges[local] == nxt, local, -1)
+    entering = np.ones(n, dtype=bool)
+    entering[local[local >= 0]] = False
+
+    local = local.tolist()
+    seen = [False] * n
+    walks = [[], []]
+    offsets = [[0], [0]]
+    for kind, starts in enumerate([np.flatnonzero(entering).tolist(),
+                                   range(n)]):
+        for h in starts:
+            if seen[h]:
+                continue
+            while h != -1 and not seen[h]:
+                seen[h] = True
+                walks[kind].append(h)
+                h = local[h]
+            offsets[kind].append(len(walks[kind]))
+    return [(np.array(o, dtype=np.int64),
+             half_edges[np.array(w, dtype=np.int64)])
+            for o, w in zip(offsets, walks)]
+
+
+def _tiled_cycles(nxt, tile, tiles, n_jobs):
+    """Cycles of `next`, walked per tile and stitched across the tiles"""
+    order = np.argsort(tile, kind='stable')
+    bounds = np.searchsorted(tile[order], np.arange(tiles * tiles + 1))
+    tasks = [(order[bounds[t]:bounds[t + 1]],
+              nxt[order[bounds[t]:bounds[t + 1]]])
+             for t in range(tiles * tiles) if bounds[t + 1] > bounds[t]]
+
+    faces = []
+    chains = []
+    for (chain_offsets, chain_half_edges), (cycle_offsets, cycle_half_edges) \
+            in spatialx.parallel.imap(_walk_tile, tasks, {}, n_jobs):
+        chains.extend(np.split(chain_half_edges, chain_offsets[1:-1])
+                      if len(chain_half_edges) else [])
+        faces.extend(np.split(cycle_half_edges, cycle_offsets[1:-1])
+                     if len(cycle_half_edges) else [])
+
+    ## Stitch the chains: the half-edge after the last of a chain is the
+    ## first of the next chain of the face, in another tile
+    first = dict((int(c[0]), i) for i, c in enumerate(chains))
+    following = [first[n] for n in nxt[[c[-1] for c in chains]].tolist()] \
+        if chains else []
+    seen = [False] * len(chains)
+    for i in range(len(chains)):
+        if seen[i]:
+            continue
+        parts = []
+        while not seen[i]:
+            seen[i] = True
+            parts.append(chains[i])
+            i = following[i]
+        cycle = np.concatenate(parts)
+        faces.append(np.roll(cycle, -int(np.argmin(cycle))))
+
+    ## Number the faces by their smallest half-edge, as `_cycles` does
+    faces.sort(key=lambda c: c[0])
+    sizes = np.array([len(c) for c in faces], dtype=np.int64)
+    offsets = np.zeros(len(faces) + 1, dtype=np.int64)
+    np.cumsum(sizes, out=offsets[1:])
+    cycles = np.concatenate(faces) if faces else np.zeros(0, dtype=np.int64)
+    face = np.empty(len(nxt), dtype=np.int64)
+    face[cycles] = np.repeat(np.arange(len(faces)), sizes)
+    return face, offsets, cycles
+
+
+
+class DCEL(object):
+    """Half-edge structure of a planar, undirected spatial network.
+
+    Attributes
+    ----------
+
+    nodes: list
+        Original node keys, `nodes[i]` is the key of node `i`.
+
+    index: dictionary
+        Inverse of `nodes`, maps node keys to integer ids.
+
+    edges: list
+        Original edge keys, in the order of `G.edges()`, self-loops excluded.
+
+    x, y: numpy arrays
+        Position of the nodes.
+
+    lengths: numpy array
+        Length of each edge.
+
+    tail: numpy array
+        Node id the half-edge `h` leaves from; it points to `tail[h ^ 1]`.
+
+    next: numpy array
+        Half-edge following `h` along its face.
+
+    face: numpy array
+        Face id of each half-edge.
+
+    face_offsets, face_half_edges: numpy arrays
+        Half-edges of the face `f`, in traversal order, are
+        `face_half_edges[face_offsets[f]:face_offsets[f+1]]`.
+    """
+
+    def __init__(self, G, weight='length', tiles=None, n_jobs=1):
+        """Build the half-edge structure of G
+
+        Parameters
+        ----------
+
+        G: Networkx graph
+            Undirected planar graph whose nodes all have a position `x`, `y`.
+            Self-loops are ignored.
+
+        weight: string or None
+            Edge attribute holding the length of the edges. Edges without it
+            have their Euclidean length.
+
+        tiles: int, optional
+            Walk the faces in `tiles` x `tiles` square tiles of the bounding
+            box of the nodes, and stitch the faces that cross the tiles. The
+            faces do not depend on the tiling. Defaults to no tiling, or to 8
+            x 8 tiles with several processes.
+
+        n_jobs: int, optional
+            Number of worker processes the tiles are distributed over (-1 for
+            one per CPU).
+        """
+        if G.is_directed():
+            raise ValueError("The half-edge structure needs an undirected "
+                             "graph")
+        self.nodes = list(G)
+        self.index = dict((v, i) for i, v in enumerate(self.nodes))
+        n = len(self.nodes)
+
+        x = nx.get_node_attributes(G, 'x')
+        y = nx.get_node_attributes(G, 'y')
+        if len(x) != n or len(y) != n:
+            raise ValueError("The half-edge structure needs the x and y "
+                             "attributes of all the nodes")
+        self.x = np.array([x[v] for v in self.nodes], dtype=np.float64)
+        self.y = np.array([y[v] for v in self.nodes], dtype=np.float64)
+
+        self.edges = []
+        ends = []
+        lengths = []
+        for u, v, data in G.edges(data=True):
+            if u == v:
+                continue
+            self.edges.append((u, v))
+            ends.append((self.index[u], self.index[v]))
+            lengths.append(np.nan if weight is None
+                           else float(data.get(weight, np.nan)))
+        ends = np.array(ends, dtype=np.int64).reshape(-1, 2)
+        self.tail = ends.ravel()
+        head = ends[:, ::-1].ravel()
+
+        dx = self.x[head] - self.x[self.tail]
+        dy = self.y[head] - self.y[self.tail]
+        self.lengths = np.array(lengths, dtype=np.float64)
+        missing = np.isnan(self.lengths)
+        self.lengths[missing] = np.hypot(dx[::2], dy[::2])[missing]
+
+        # next(h) is the half-edge leaving head(h) clockwise of the twin
+        order, offsets, position = _rotation(self.tail, dx, dy, n)
+        p = position[np.arange(len(self.tail)) ^ 1]
+        p = np.where(p == offsets[head], offsets[head + 1], p) - 1
+        self.next = order[p]
+
+        if tiles is None and spatialx.parallel._n_processes(n_jobs) > 1:
+            tiles = 8
+        if tiles is None or len(self.next) == 0:
+            cycles = _cycles(self.next)
+        else:
+            tile = _tiles(self.x, self.y, tiles)[self.tail]
+            cycles = _tiled_cycles(self.next, tile, tiles, n_jobs)
+        self.face, self.face_offsets, self.face_half_edges = cycles
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def number_of_nodes(self):
+        return len(self.nodes)
+
+    def number_of_edges(self):
+        return len(self.edges)
+
+    def number_of_faces(self):
+        return len(self.face_offsets) - 1
+
+    def head(self, h):
+        """Node id(s) the half-edge(s) h point to"""
+        return self.tail[np.asarray(h) ^ 1]
+
+    def half_edges(self, f):
+        """Half-edges of the face f, in traversal order"""
+        return self.face_half_edges[self.face_offsets[f]:
+                                    self.face_offsets[f + 1]]
+
+    def face_nodes(self, f):
+        """Keys of the nodes met along the face f, in traversal order"""
+        return [self.nodes[i] for i in self.tail[self.half_edges(f)]]
+
+    def face_edges(self, f):
+        """Edges of the face f, as (from, to) node keys in traversal order"""
+        h = self.half_edges(f)
+        return [(self.nodes[i], self.nodes[j])
+                for i, j in zip(self.tail[h].tolist(),
+                                self.head(h).tolist())]
+
+    def signed_areas(self):
+        """Signed area of all the faces, from the shoelace formula
+
+        Positive for the bounded faces, traversed counter-clockwise; the outer
+        face of each connected component is traversed clockwise and has a
+        negative area, or zero for a tree.
+        """
+        h = self.face_half_edges
+        faces = np.repeat(np.arange(self.number_of_faces()),
+                          np.diff(self.face_offsets))
+        # coordinates relative to the first vertex of each face, for precision
+        first = self.tail[h[self.face_offsets[:-1]]][faces]
+        x0 = self.x[self.tail[h]] - self.x[first]
+        y0 = self.y[self.tail[h]] - self.y[first]
+        x1 = self.x[self.tail[h ^ 1]] - self.x[first]
+        y1 = self.y[self.tail[h ^ 1]] - self.y[first]
+        return np.bincount(faces, x0 * y1 - x1 * y0,
+                           self.number_of_faces()) / 2
+
+    def outer_faces(self):
+        """Ids of the outer faces, one per connected component"""
+        return np.flatnonzero(self.signed_areas() <= 0)
+
+    def faces(self):
+        """Edges of all the faces, see `face_edges`"""
+        return [self.face_edges(f) for f in range(self.number_of_faces())]
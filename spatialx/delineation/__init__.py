@@ -1,2 +1,4 @@
 # -*- coding: utf-8 -*-
 """Import delineations algorithms""" 
+
+from spatialx.delineation.percolation import *
@@ -1,18 +1,152 @@
 # -*- coding: utf-8 -*-
-"""Algorithms necessary for percolation of the street network"""
+"""Algorithms necessary for percolation of the street network
 
+The nodes are percolated by adding the edges in order of increasing length:
+at the threshold `d` the clusters are the connected components of the graph
+of the edges of length at most `d`. The edges are sorted once and swept
+through a union-find structure, and every merge of two clusters is recorded
+as in a single-linkage dendrogram. The clusters at any threshold, their
+sizes and the size of the largest cluster as a function of the threshold
+are all read from this hierarchy.
+"""
+from __future__ import division
+import numpy as np
+import networkx as nx
 
+from spatialx.classes.unionfind import UnionFind
+from spatialx.simplify import simplify as _simplify
 
 
-def percolate(G):
+__all__ = ["percolate",
+           "Percolation"]
+
+
+#
+# Helper functions
+#
+def _simple(G, weight):
+    """Undirected simple graph keeping the shortest of the parallel edges"""
+    def length(edge):
+        return 1.0 if weight is None else float(edge[2].get(weight, 1))
+    H = nx.Graph()
+    H.graph.update(G.graph)
+    H.add_nodes_from(G.nodes(data=True))
+    # the shortest edges are added last, and set the length
+    H.add_edges_from(sorted(G.edges(data=True), key=length, reverse=True))
+    return H
+
+
+
+#
+# Callable functions
+#
+class Percolation(object):
+    """Merge hierarchy of the clusters of nodes, see `percolate`
+
+    The nodes are the clusters `0` to `n-1`, and the `k`-th merge creates the
+    cluster `n+k`, made of the clusters `left[k]` and `right[k]`.
+
+    Attributes
+    ----------
+
+    nodes: list
+        Nodes of the graph, `nodes[i]` is the cluster `i`.
+
+    heights: numpy array
+        Length of the edge that triggered each merge, in increasing order.
+
+    left, right: numpy arrays
+        Clusters merged by each merge.
+
+    sizes: numpy array
+        Number of nodes of the cluster created by each merge.
+    """
+
+    def __init__(self, nodes, heights, left, right, sizes):
+        self.nodes = nodes
+        self.heights = heights
+        self.left = left
+        self.right = right
+        self.sizes = sizes
+
+        n = len(nodes)
+        self.parent = np.full(n + len(heights), -1, dtype=np.int64)
+        self.parent[left] = n + np.arange(len(heights))
+        self.parent[right] = n + np.arange(len(heights))
+
+    def _merges(self, threshold):
+        """Number of merges made with the edges of length <= threshold"""
+        return int(np.searchsorted(self.heights, threshold, side='right'))
+
+    def number_of_clusters(self, threshold):
+        """Number of clusters at the threshold"""
+        return len(self.nodes) - self._merges(threshold)
+
+    def clusters(self, threshold):
+        """Cluster of every node at the threshold
+
+        Returns a dictionary of nodes with their cluster label as value; the
+        labels are the consecutive integers `0, 1, ...`, the largest
+        clusters first.
+        """
+        n = len(self.nodes)
+        m = self._merges(threshold)
+        left = self.left[:m].tolist()
+        right = self.right[:m].tolist()
+
+        ## Top-down: the clusters of the roots, then their descendants
+        root = self.cluster_sizes(threshold, ids=True)[1]
+        label = [-1] * (n + m)
+        for i, r in enumerate(root.tolist()):
+            label[r] = i
+        for k in range(m - 1, -1, -1):
+            label[left[k]] = label[right[k]] = label[n + k]
+        return dict(zip(self.nodes, label[:n]))
+
+    def cluster_sizes(self, threshold, ids=False):
+        """Sizes of the clusters at the threshold, in decreasing order
+
+        With `ids`, also returns the ids of the clusters in the hierarchy.
+        """
+        n = len(self.nodes)
+        m = self._merges(threshold)
+        size = np.concatenate([np.ones(n, dtype=np.int64), self.sizes[:m]])
+        parent = self.parent[:n + m]
+        root = np.flatnonzero((parent == -1) | (parent >= n + m))
+        order = np.argsort(-size[root], kind='stable')
+        if ids:
+            return size[root][order], root[order]
+        return size[root][order]
+
+    def largest_cluster(self, thresholds=None):
+        """Size of the largest cluster as a function of the threshold
+
+        Returns the thresholds (by default, the heights of the merges) and
+        the size of the largest cluster at each of them.
+        """
+        largest = np.maximum.accumulate(
+            np.concatenate([[min(1, len(self.nodes))], self.sizes]))
+        if thresholds is None:
+            return self.heights.copy(), largest[1:]
+        thresholds = np.asarray(thresholds, dtype=np.float64)
+        return thresholds, largest[np.searchsorted(self.heights, thresholds,
+                                                   side='right')]
+
+
+
+def percolate(G, weight='length', simplify=True):
     """Percolate the nodes based on their relative network distance
 
     1. Simplify the network to eliminate k=2 nodes
     2. Iterate over edges in length order
     3. Union/Find algorithm to build clusters
 
+    The edges are sorted once, and all the merges are recorded in a single
+    O(E log E) pass: the clusters at every threshold can then be queried
+    from the returned hierarchy.
+
     The algorithm is inspired by the works of [Tao2010]_, [Jiang2011]_ and
-    [Masucci2013]_. 
+    [Masucci2013]_.
 
     .. [Tao2010] Tao J. & Jiang B. (2010) Measuring urban sprawl based on
         massive street nodes and the concept of natural cities, Arxiv preprint,
@@ -22,16 +156,72 @@ def percolate(G):
         Journal of Geographical Information Science, 25(8):1269-1281.
     .. [Masucci2013] Masucci A.P., Stanilov K., Arcaute E., Hatna E., & Batty M.
         (2013) Ergodic Properties of Urban Street Networks in the UK, International
-        Conference on SITIS, pp. 634-640. 
+        Conference on SITIS, pp. 634-640.
+
+    Input
+    -----
+        * G: Networkx graph. The direction of the edges is ignored, and
+          of parallel edges only the shortest counts.
+        * weight: edge attribute holding the length of the edges. Edges
+          without it have length 1.
+        * simplify: if True, the degree 2 nodes are removed first, and the
+          chains of edges replaced by edges of the total length (see
+          `spatialx.simplify`)
+
+    Returns
+    -------
+        * P: `Percolation` hierarchy. For instance `P.clusters(d)` gives the
+          clusters at the threshold d, `P.cluster_sizes(d)` their sizes, and
+          `P.largest_cluster()` the size of the largest cluster as a function
+          of the threshold.
     """
 
     #
     # Simplify the network, remove degree 2 nodes
     #
-    sG = rz.simplify(G)
+    if simplify:
+        if G.is_directed() or G.is_multigraph():
+            G = _simple(G, weight)
+        G = _simplify(G, weight=weight)
+    nodes = list(G)
+    index = dict((v, i) for i, v in enumerate(nodes))
+    n = len(nodes)
 
+    #
+    # Sort the edges by length
+    #
+    ends = []
+    lengths = []
+    for u, v, data in G.edges(data=True):
+        ends.append((index[u], index[v]))
+        lengths.append(1.0 if weight is None else float(data.get(weight, 1)))
+    order = np.argsort(np.array(lengths, dtype=np.float64), kind='stable')
 
     #
-    # Initialise the Union/Find structure
+    # Initialise the Union/Find structure, and record the merges
     #
+    clusters = UnionFind()
+    cluster = list(range(n))   # id in the hierarchy of the cluster of a root
+    size = [1] * n
+    heights = []
+    left = []
+    right = []
+    sizes = []
+    for e in order.tolist():
+        a, b = (clusters[i] for i in ends[e])
+        if a == b:
+            continue
+        left.append(cluster[a])
+        right.append(cluster[b])
+        heights.append(lengths[e])
+        sizes.append(size[a] + size[b])
+        clusters.union(a, b)
+        r = clusters[a]
+        cluster[r] = n + len(heights) - 1
+        size[r] = sizes[-1]
 
+    return Percolation(nodes,
+                       np.array(heights, dtype=np.float64),
+                       np.array(left, dtype=np.int64),
+                       np.array(right, dtype=np.int64),
+                       np.array(sizes, dtype=np.int64))
@@ -0,0 +1,73 @@
+from nose.tools import *
+import numpy as np
+import networkx as nx
+import spatialx as sx
+
+
+class TestPercolation(object):
+
+    def test_path(self):
+        """Percolation: merges along a path"""
+        G = nx.Graph()
+        for (u, v), l in zip([(0, 1), (1, 2), (2, 3), (3, 4)],
+                             [1.0, 3.0, 2.0, 1.0]):
+            G.add_edge(u, v, length=l)
+        P = sx.percolate(G, simplify=False)
+        assert_equal(P.heights.tolist(), [1.0, 1.0, 2.0, 3.0])
+        assert_equal(P.sizes.tolist(), [2, 2, 3, 5])
+        assert_equal(P.number_of_clusters(0.5), 5)
+        assert_equal(P.number_of_clusters(2.0), 2)
+        assert_equal(P.cluster_sizes(2.0).tolist(), [3, 2])
+        clusters = P.clusters(2.0)
+        assert_equal(clusters, {0: 1, 1: 1, 2: 0, 3: 0, 4: 0})
+        thresholds, largest = P.largest_cluster([0, 1, 1.5, 2, 10])
+        assert_equal(largest.tolist(), [1, 2, 2, 3, 5])
+
+    def test_components(self):
+        """Percolation: clusters are the components below the threshold"""
+        rng = np.random.RandomState(5)
+        G = nx.gnm_random_graph(200, 300, seed=5)
+        for u, v in G.edges():
+            G[u][v]['length'] = float(rng.randint(1, 20))
+        P = sx.percolate(G, simplify=False)
+        for d in [0, 3, 7.5, 12, 25]:
+            H = nx.Graph()
+            H.add_nodes_from(G)
+            H.add_edges_from((u, v) for u, v, l in G.edges(data='length')
+                             if l <= d)
+            components = list(nx.connected_components(H))
+            clusters = P.clusters(d)
+            assert_equal(len(set(clusters.values())), len(components))
+            for c in components:
+                assert_equal(len(set(clusters[v] for v in c)), 1)
+            assert_equal(P.cluster_sizes(d).tolist(),
+                         sorted((len(c) for c in components), reverse=True))
+            assert_equal(P.largest_cluster([d])[1][0],
+                         max(len(c) for c in components))
+
+    def test_simplify(self):
+        """Percolation: chains of degree 2 nodes are simplified"""
+        G = nx.star_graph(3)
+        nx.add_path(G, [1, 10, 11], length=1.0)
+        for u, v in G.edges():
+            G[u][v].setdefault('length', 1.0)
+        P = sx.percolate(G)
+        assert_equal(sorted(P.nodes), [0, 2, 3, 11])
+        assert_equal(P.cluster_sizes(1.0).tolist(), [3, 1])
+        assert_equal(P.cluster_sizes(3.0).tolist(), [4])
+
+    def test_multigraph(self):
+        """Percolation: parallel edges count with their shortest length"""
+        G = nx.MultiDiGraph()
+        for u, v, l in [(0, 1, 4.0), (1, 0, 1.0), (1, 2, 2.0), (2, 3, 5.0),
+                        (2, 3, 3.0), (3, 4, 1.0), (4, 2, 6.0)]:
+            G.add_edge(u, v, length=l)
+        H = nx.Graph()
+        for u, v, l in [(0, 1, 1.0), (1, 2, 2.0), (2, 3, 3.0), (3, 4, 1.0),
+                        (4, 2, 6.0)]:
+            H.add_edge(u, v, length=l)
+        for simplify in [True, False]:
+            P = sx.percolate(G, simplify=simplify)
+            Q = sx.percolate(H, simplify=simplify)
+            assert_equal(P.heights.tolist(), Q.heights.tolist())
+            assert_equal(P.sizes.tolist(), Q.sizes.tolist())
@@ -2,3 +2,5 @@
 """Import functions related to the dual representation"""
 
 from spatialx.dual.faces import *
+from spatialx.dual.metrics import *
+from spatialx.dual.dynamic import *
@@ -0,0 +1,363 @@
+# -*- coding: utf-8 -*-
+"""dynamic.py
+
+Faces, face metrics and dual graph of a planar network whose edges change.
+
+The half-edge structure of `spatialx.classes.dcel` is kept in a mutable
+form: the neighbours of each node sorted counter-clockwise, and the face of
+each half-edge `(u, v)`. The half-edge following `(u, v)` along its face is
+found from the rotation at `v` when needed.
+
+An edge change only modifies the faces on the two sides of the edge:
+
+* an edge inserted between two nodes of the same face splits it in two, an
+  edge between two components merges their faces;
+* a removed edge merges the faces on its two sides, or splits the face of a
+  bridge.
+
+The half-edges of these faces are walked again, their metrics and dual
+adjacency recomputed, and the rest of the structure is left untouched: an
+update costs time proportional to the size of the faces it touches.
+"""
+from __future__ import division
+import math
+from bisect import bisect_left
+import numpy as np
+import networkx as nx
+
+from spatialx.classes.dcel import DCEL
+from spatialx.dual.faces import centers_of_gravity, shared_boundaries
+from spatialx.dual.metrics import face_metrics, _diameter
+
+
+__all__ = ['DynamicDual']
+
+
+#
+# Helper functions
+#
+def _crosses(p, q, r, s):
+    """True if the segments pq and rs cross at a point inside both"""
+    def side(a, b, c):
+        return (b[0] - a[0]) * (c[1] - a[1]) - (b[1] - a[1]) * (c[0] - a[0])
+    return (side(p, q, r) * side(p, q, s) < 0 and
+            side(r, s, p) * side(r, s, q) < 0)
+
+
+
+#
+# Callable functions
+#
+class DynamicDual(object):
+    """ Faces, face metrics and dual graph of a planar network under edits
+
+    Example
+    -------
+
+    >>> P = DynamicDual(G)
+    >>> P.add_edge(u, v)          # splits a block with a new street
+    >>> P.remove_edge(u, w)       # merges two blocks
+    >>> P.dual                    # dual graph of the bounded faces
+    >>> P.metrics[f]['area']
+
+    Faces are identified by integers. The faces touched by an update are
+    replaced by faces with new ids, listed in `created` (and the old ones in
+    `deleted`); the other faces keep their ids.
+
+    Parameters
+    ----------
+
+    G: Networkx graph
+        Undirected planar graph whose nodes all have a position `x`, `y`.
+        The graph is copied; later changes must go through this object.
+
+    weight: string or None
+        Edge attribute used as the length of the edges. Edges without it
+        have their Euclidean length.
+
+    Attributes
+    ----------
+
+    dual: Networkx graph
+        Dual graph of the bounded faces. Its nodes are the face ids
+        themselves, with the center of gravity `x`, `y` of their boundary,
+        and its edges hold the shared `edges`, their `length` and the shared
+        `boundary`. The dual of `to_dual` has the same attributes but numbers
+        its nodes consecutively, with the face id in their `face` attribute.
+
+    metrics: dictionary
+        Metrics of every face (see `face_metrics`), as a dictionary
+        `{'area', 'perimeter', 'x', 'y', 'shape_factor', 'outer'}`.
+    """
+
+    def __init__(self, G, weight='length'):
+        self.G = G.copy()
+        self.weight = weight
+        self.created = []
+        self.deleted = []
+
+        D = DCEL(self.G, weight)
+        nodes = D.nodes
+        self._pos = dict((v, (x, y)) for v, x, y in
+                         zip(nodes, D.x.tolist(), D.y.tolist()))
+
+        ## Rotation system, with the angles computed as for the new edges
+        tail = D.tail
+        head = D.head(np.arange(len(tail)))
+        angles = np.array([self._angle(nodes[u], nodes[v])
+                           for u, v in zip(tail.tolist(), head.tolist())])
+        order = np.lexsort((angles, tail))
+        self._angles = dict((v, []) for v in nodes)
+        self._out = dict((v, []) for v in nodes)
+        for h, a in zip(order.tolist(), angles[order].tolist()):
+            self._angles[nodes[tail[h]]].append(a)
+            self._out[nodes[tail[h]]].append(nodes[head[h]])
+
+        ## Faces
+        keys = [(nodes[u], nodes[v])
+                for u, v in zip(tail.tolist(), head.tolist())]
+        self._faces = {}
+        self._face = {}
+        offsets = D.face_offsets.tolist()
+        half_edges = D.face_half_edges.tolist()
+        for f in range(D.number_of_faces()):
+            self._faces[f] = [keys[h] for h in half_edges[offsets[f]:
+                                                          offsets[f + 1]]]
+            for h in self._faces[f]:
+                self._face[h] = f
+        self._next_id = D.number_of_faces()
+
+        metrics = face_metrics(D)
+        self.metrics = dict(
+            (f, dict((k, metrics[k][f].item()) for k in metrics))
+            for f in range(D.number_of_faces()))
+
+        ## Dual graph
+        self.dual = nx.Graph()
+        bounded = ~metrics['outer']
+        x, y = (c.tolist() for c in centers_of_gravity(D))
+        self.dual.add_nodes_from((f, {'x': x[f], 'y': y[f]})
+                                 for f in np.flatnonzero(bounded).tolist())
+        dual_id = np.where(bounded, np.arange(D.number_of_faces()), -1)
+        for (i, j), data in shared_boundaries(D, dual_id.tolist()).items():
+            self.dual.add_edge(i, j, **data)
+
+    #
+    # Half-edge structure
+    #
+    def _angle(self, u, v):
+        (xu, yu), (xv, yv) = self._pos[u], self._pos[v]
+        return math.atan2(yv - yu, xv - xu)
+
+    def _index(self, u, v):
+        """Position of v in the rotation around u"""
+        i = bisect_left(self._angles[u], self._angle(u, v))
+        while self._out[u][i] != v:
+            i += 1
+        return i
+
+    def _next(self, h):
+        """Half-edge following h along its face"""
+        u, v = h
+        return (v, self._out[v][self._index(v, u) - 1])
+
+    def _wedge_face(self, u, v):
+        """Face around u in which the direction of v falls, None if isolated"""
+        if not self._out[u]:
+            return None
+        i = bisect_left(self._angles[u], self._angle(u, v))
+        return self._face[(u, self._out[u][i - 1])]
+
+    def _length(self, u, v):
+        data = self.G[u][v]
+        if self.weight is not None and self.weight in data:
+            return float(data[self.weight])
+        (xu, yu), (xv, yv) = self._pos[u], self._pos[v]
+        return math.hypot(xv - xu, yv - yu)
+
+    def _detach(self, faces):
+        """Removes faces, returns their half-edges"""
+        half_edges = []
+        for f in faces:
+            for h in self._faces.pop(f):
+                del self._face[h]
+                half_edges.append(h)
+            if f in self._created:
+                self._created.remove(f)
+            else:
+                self._deleted.add(f)
+        return half_edges
+
+    def _walk(self, half_edges):
+        """Walks the faces of the half-edges that have none"""
+        for h in half_edges:
+            if h in self._face or not self.G.has_edge(*h):
+                continue
+            f = self._next_id
+            self._next_id += 1
+            cycle = []
+            while h not in self._face:
+                self._face[h] = f
+                cycle.append(h)
+                h = self._next(h)
+            self._faces[f] = cycle
+            self._created.add(f)
+
+    def _insert(self, u, v, data):
+        faces = set(f for f in (self._wedge_face(u, v), self._wedge_face(v, u))
+                    if f is not None)
+        p, q = self._pos[u], self._pos[v]
+        for f in faces:
+            for a, b in self._faces[f]:
+                if (a not in (u, v) and b not in (u, v) and
+                        _crosses(p, q, self._pos[a], self._pos[b])):
+                    raise ValueError("The edge (%s, %s) crosses the edge "
+                                     "(%s, %s)" % (u, v, a, b))
+        half_edges = self._detach(faces)
+        self.G.add_edge(u, v, **data)
+        for a, b in ((u, v), (v, u)):
+            angle = self._angle(a, b)
+            i = bisect_left(self._angles[a], angle)
+            self._angles[a].insert(i, angle)
+            self._out[a].insert(i, b)
+        self._walk([(u, v), (v, u)] + half_edges)
+
+    def _remove(self, u, v):
+        half_edges = self._detach(set([self._face[(u, v)],
+                                       self._face[(v, u)]]))
+        for a, b in ((u, v), (v, u)):
+            i = self._index(a, b)
+            del self._angles[a][i]
+            del self._out[a][i]
+        self.G.remove_edge(u, v)
+        self._walk(half_edges)
+
+    def _update_face(self, f):
+        """Metrics and dual node of a new face"""
+        cycle = self._faces[f]
+        x = np.array([self._pos[a][0] for a, b in cycle])
+        y = np.array([self._pos[a][1] for a, b in cycle])
+        x0, y0 = x - x[0], y - y[0]
+        x1, y1 = np.roll(x0, -1), np.roll(y0, -1)
+        cross = x0 * y1 - x1 * y0
+        signed = cross.sum() / 2
+        border = [h for h in cycle if self._face[(h[1], h[0])] != f]
+        diameter = _diameter(x, y)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            self.metrics[f] = {
+                'area': abs(signed),
+                'perimeter': sum(self._length(*h) for h in border),
+                'x': ((x0 + x1) * cross).sum() / (6 * signed) + x[0],
+                'y': ((y0 + y1) * cross).sum() / (6 * signed) + y[0],
+                'shape_factor': abs(signed) / (np.pi * diameter ** 2 / 4),
+                'outer': bool(signed <= 0)}
+        if signed > 0:
+            nodes = set(a for a, b in border)
+            self.dual.add_node(f,
+                               x=sum(self._pos[a][0] for a in nodes) /
+                               len(nodes),
+                               y=sum(self._pos[a][1] for a in nodes) /
+                               len(nodes))
+
+    def _update_dual_edges(self, f):
+        """Dual edges of a new face, in runs along the same neighbour"""
+        cycle = self._faces[f]
+        others = [self._face[(b, a)] for a, b in cycle]
+        k = len(cycle)
+        start = next((p for p in range(k) if others[p] != others[p - 1]), 0)
+        run = None
+        for p in range(start, start + k):
+            a, b = cycle[p % k]
+            g = others[p % k]
+            # pairs of new faces are recorded from the lower one
+            if (g == f or g not in self.dual or
+                    (g in self._created and g < f)):
+                run = None
+                continue
+            if run is None or run[0] != g:
+                if not self.dual.has_edge(f, g):
+                    self.dual.add_edge(f, g, edges=[], length=0.0,
+                                       boundary=[])
+                data = self.dual[f][g]
+                run = (g, [a])
+                data['boundary'].append(run[1])
+            run[1].append(b)
+            data['edges'].append((a, b))
+            data['length'] += self._length(a, b)
+
+    #
+    # Edits
+    #
+    def update(self, changes):
+        """ Applies a batch of edge changes
+
+        Parameters
+        ----------
+
+        changes: list of tuples
+            `(u, v, data)` sets the attributes of the edge (u, v) to the
+            dictionary `data`, inserting the edge if needed. `(u, v, None)`
+            removes the edge. The nodes must already be in the graph.
+        """
+        self._created = set()
+        self._deleted = set()
+        for u, v, data in changes:
+            if u == v:
+                continue
+            if data is None:
+                if self.G.has_edge(u, v):
+                    self._remove(u, v)
+            elif self.G.has_edge(u, v):
+                self.G[u][v].clear()
+                self.G[u][v].update(data)
+                half_edges = self._detach(set([self._face[(u, v)],
+                                               self._face[(v, u)]]))
+                self._walk(half_edges)
+            else:
+                self._insert(u, v, data)
+
+        for f in self._deleted:
+            del self.metrics[f]
+            if f in self.dual:
+                self.dual.remove_node(f)
+        self.created = sorted(self._created)
+        self.deleted = sorted(self._deleted)
+        for f in self.created:
+            self._update_face(f)
+        for f in self.created:
+            if f in self.dual:
+                self._update_dual_edges(f)
+
+    def add_node(self, v, x, y, **attr):
+        """Adds an isolated node at the position (x, y)"""
+        self.G.add_node(v, x=x, y=y, **attr)
+        self._pos[v] = (float(x), float(y))
+        self._angles.setdefault(v, [])
+        self._out.setdefault(v, [])
+
+    def add_edge(self, u, v, **attr):
+        """Inserts the edge (u, v), or replaces its attributes"""
+        self.update([(u, v, attr)])
+
+    def remove_edge(self, u, v):
+        """Removes the edge (u, v)"""
+        self.update([(u, v, None)])
+
+    #
+    # Faces
+    #
+    def faces(self):
+        """Ids of all the faces"""
+        return list(self._faces)
+
+    def face_edges(self, f):
+        """Edges of the face f, as (from, to) node keys in traversal order"""
+        return list(self._faces[f])
+
+    def face_nodes(self, f):
+        """Keys of the nodes met along the face f, in traversal order"""
+        return [a for a, b in self._faces[f]]
+
+    def face(self, u, v):
+        """Face on the left of the half-edge (u, v)"""
+        return self._face[(u, v)]
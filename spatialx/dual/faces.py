@@ -7,7 +7,8 @@ from __future__ import division
 import numpy as np
 import networkx as nx
 
-from spatialx.simplify import simplify
+from spatialx.classes.csrgraph import CSRGraph
+from spatialx.classes.dcel import DCEL
 
 
 __authors__ = """\n""".join(["Rémi Louf <remilouf@sciti.es"])
@@ -22,62 +23,127 @@ __all__ = ["prune",
 #
 # Helper functions
 #
-def find_most_clockwise(previous,current, choices):
-    """Returns the most clockwise edge coming from previous to current
+def center_of_gravity(G,nodes):
+    """Returns the center of gravity of a list of nodes
 
     Input
     -----
-        * previous : vertex (with position) from which we come
-        * current: vertex (with position) at which we are
-        * choices : list of possible next vertices (with position) 
-    
+        * G: Networkx graph containing nodes with their position
+        * nodes: List of nodes id
+
     Returns
     -------
-        * edge : most clockwise edge
+        * x,y: position of the center of gravity of all the nodes (with equal weight on each node)
     """
-    v = np.array([current[1][0] - previous[1][0],
-                  current[1][1] - previous[1][1],
-                  0])
-    v = v / np.linalg.norm(v)
-
-    m = []
-    l = []
-    for p in choice:
-        vp = np.array([p[1][0] - current[1][0],
-                       p[1][1] - current[1][1],
-                       0])
-        vp = vp / np.linalg.norm(vp)
-
-        m.append( np.cross(vp,v)[2] )
-        l.append( np.dot(vp,v) )
-
-    if len(choice) == 1:
-        return (current[0], choice[0][0])
-    else:
-        negatives = [i for i,val in enumerate(m) if val<0]
-
-        if len(negatives) > 0:
-            return (current[0], choice[l.index(min([val for i,val in enumerate(l) if m[i]<0]))][0])
-        else:
-            return (current[0], choice[l.index(max(l))][0])
+    x = sum([G.nodes[n]['x'] for n in nodes])/len(nodes)
+    y = sum([G.nodes[n]['y'] for n in nodes])/len(nodes)
+    return x,y
 
 
 
-def center_of_gravity(G,nodes):
-    """Returns the center of gravity of a list of nodes
+def centers_of_gravity(D):
+    """Center of gravity of the nodes on the boundary of each face
+
+    Computed for all the faces at once, NaN for the faces without boundary.
+    """
+    h = np.flatnonzero(D.face != D.face[np.arange(len(D.face)) ^ 1])
+    n = len(D)
+    pairs = np.unique(D.face[h] * n + D.tail[h])
+    faces, nodes = np.divmod(pairs, n)
+    count = np.bincount(faces, minlength=D.number_of_faces())
+    with np.errstate(divide='ignore', invalid='ignore'):
+        x = np.bincount(faces, D.x[nodes], D.number_of_faces()) / count
+        y = np.bincount(faces, D.y[nodes], D.number_of_faces()) / count
+    return x, y
+
+
+
+def boundary(D, f):
+    """Half-edges of the face f that separate it from another face
+
+    The branches, whose two sides are on the face f, are left out.
+    """
+    h = D.half_edges(f)
+    return h[D.face[h ^ 1] != f]
+
+
+
+def shared_boundaries(D, dual_id):
+    """Boundaries shared by the pairs of faces, from the edge-to-faces index
+
+    Each edge `e` separates the faces of its half-edges `2e` and `2e + 1`.
+    The half-edges of each face are scanned once, in traversal order, and
+    split in runs along the same neighbouring face.
 
     Input
     -----
-        * G: Networkx graph containing nodes with their position
-        * nodes: List of nodes id
+        * D: DCEL
+        * dual_id: array of the dual node of each face, -1 for the faces
+          left out of the dual
 
     Returns
     -------
-        * x,y: position of the center of gravity of all the nodes (with equal weight on each node)
+        * shared = {(i, j): {'edges': [...], 'length': ..., 'boundary': [...]}}
+          for the dual nodes i < j that share at least one edge. 'boundary'
+          lists the runs of consecutive shared edges as sequences of node
+          keys.
     """
-    x = sum([G.node[n]['x'] for n in nodes])/len(nodes)
-    y = sum([G.node[n]['y'] for n in nodes])/len(nodes)
-    return x,y
+    shared = {}
+    tail = D.tail.tolist()
+    face = D.face.tolist()
+    lengths = D.lengths.tolist()
+    offsets = D.face_offsets.tolist()
+    all_half_edges = D.face_half_edges.tolist()
+    nodes = D.nodes
+    edges = D.edges
+    for f in range(D.number_of_faces()):
+        i = dual_id[f]
+        if i < 0:
+            continue
+        half_edges = all_half_edges[offsets[f]:offsets[f + 1]]
+        others = [dual_id[face[h ^ 1]] for h in half_edges]
+        # start the scan where the neighbouring face changes
+        k = len(half_edges)
+        start = next((p for p in range(k) if others[p] != others[p - 1]), 0)
+        run = None
+        for p in range(start, start + k):
+            h = half_edges[p % k]
+            j = others[p % k]
+            if j <= i:   # each pair is recorded from its lower face
+                run = None
+                continue
+            if run is None or run[0] != j:
+                data = shared.setdefault((i, j), {'edges': [],
+                                                  'length': 0.0,
+                                                  'boundary': []})
+                run = (j, [nodes[tail[h]]])
+                data['boundary'].append(run[1])
+            run[1].append(nodes[tail[h ^ 1]])
+            data['edges'].append(edges[h >> 1])
+            data['length'] += lengths[h >> 1]
+    return shared
+
+
+
+class _FaceGraphs(object):
+    """Sequence of the subgraphs of G along the faces, built when accessed"""
+
+    def __init__(self, G, D, faces):
+        self.G = G
+        self.D = D
+        self.faces = faces
+
+    def __len__(self):
+        return len(self.faces)
+
+    def __iter__(self):
+        for i in range(len(self.faces)):
+            yield self[i]
+
+    def __getitem__(self, i):
+        edges = [self.D.edges[h >> 1]
+                 for h in boundary(self.D, self.faces[i]).tolist()]
+        return self.G.edge_subgraph(edges).copy()
 
 
 
@@ -89,170 +155,164 @@ def center_of_gravity(G,nodes):
 #
 
 
-def prune(G):
+def prune(G, view=False, branches=False):
     """ Burns the branches from the graph
 
+    The nodes of degree 1 are peeled off one after the other, as for the
+    2-core of the graph: a queue of the nodes of degree 1 and an array of
+    degrees are maintained, and the removal of a node decrements the degree
+    of its only remaining neighbour, which joins the queue if it is left
+    with degree 1. All the branches are removed in a single O(N+E) pass.
+
     Input
     ----
         * G : NetworkX graph
+        * view : if True, returns a read-only subgraph view of G instead of a
+          copy
+        * branches : if True, also returns the branches removed
 
     Returns
     -------
         * S : Networkx graph which only contains the loops in G (no node of degree 1)
+        * removed : (only if `branches` is True) list of branches, as tuples
+          (attachment, nodes, edges). Each branch is a tree hanging from the
+          node `attachment` of S, joined to it by the first of its `edges`;
+          the trees of G that are not attached to any loop have `None` as
+          attachment. Each edge goes from a removed node to its parent,
+          the next node towards the attachment.
     """
-    F = G.copy()
-
-    ## Identify degree 1 nodes, burn the graph from there
-    for n in F.nodes_iter():
-
-        if F.degree(n) == 1:
-            n0 = n
-            for e in list(nx.dfs_edges(F,n)): ## Using the list because iterator does not like graph changing?
-                F.remove_edge(e[0],e[1])
-
-                # Find the next node
-                if e[0] != n0:
-                    n1 = e[0]
-                else:
-                    n1 = e[1]
-                
-                # if next node is of degree > 1 after edge removal, stop
-                if F.degree(n1) > 1:
-                    break
-                n0 = n1
-
-
-    ## Remove the degree 0 nodes
-    deg = F.degree()
-    to_remove = [n for n in deg if deg[n]==0]
-    F.remove_nodes_from(to_remove)
-
-    return F
+    A = CSRGraph(G, weight=None, attributes=())
+    offsets, neighbors, _, edge_index = A.adjacency()
+    n = len(A)
+    degree = np.diff(A.offsets)
+    loops = A.neighbors == np.repeat(np.arange(n), degree)
+    degree = (degree + np.bincount(np.repeat(np.arange(n), degree)[loops],
+                                   minlength=n)).tolist()
+
+    ## Peel the degree 1 nodes
+    removed = [False] * n
+    parent = [-1] * n
+    queue = [v for v in range(n) if degree[v] <= 1]
+    for v in queue:   # the queue grows while it is read
+        removed[v] = True
+        for j in range(offsets[v], offsets[v + 1]):
+            w = neighbors[j]
+            if not removed[w]:
+                parent[v] = w
+                degree[w] -= 1
+                if degree[w] == 1:
+                    queue.append(w)
+
+    kept = [A.nodes[v] for v in range(n) if not removed[v]]
+    S = G.subgraph(kept)
+    if not view:
+        S = S.copy()
+    if not branches:
+        return S
+
+    ## Group the removed nodes by branch, from the attachments down
+    top = [-1] * n
+    groups = {}
+    for v in reversed(queue):
+        p = parent[v]
+        if p == -1 or not removed[p]:
+            top[v] = v
+            groups[v] = ([A.nodes[v]], [])
+        else:
+            top[v] = top[p]
+            groups[top[v]][0].append(A.nodes[v])
+    for v in queue:
+        if parent[v] != -1:
+            groups[top[v]][1].append((A.nodes[v], A.nodes[parent[v]]))
+    removed_branches = []
+    for v in reversed(queue):
+        if top[v] == v:
+            nodes, edges = groups[v]
+            edges.reverse()
+            attachment = None if parent[v] == -1 else A.nodes[parent[v]]
+            removed_branches.append((attachment, nodes, edges))
+    return S, removed_branches
 
 
 
 
 
-def extract_faces(G):
+def extract_faces(G, tiles=None, n_jobs=1):
     """Extracts the faces of a planar, pruned graph
 
+    The faces are the cycles of the half-edge structure of the graph (see
+    `spatialx.classes.dcel`), found in a single pass over the edges. Every
+    edge is on two faces, or twice on the same face. The bounded faces are
+    traversed counter-clockwise; the outer face of each connected component
+    is included, traversed clockwise.
+
     Input
     -----
-        * G: Networkx graph, pruned
+        * G: Networkx graph, pruned, with the position `x`, `y` of the nodes.
+          Or its `DCEL`, to reuse it.
+        * tiles: walk the faces in `tiles` x `tiles` square tiles of the
+          plane, stitched together (see `spatialx.classes.dcel`)
+        * n_jobs: number of worker processes the tiles are distributed over
 
     Returns
     -------
-        * faces = [[edges in f] for f in faces]
+        * faces = [[edges in f] for f in faces], each edge as a (from, to)
+          tuple in traversal order
     """
-    # First we need a dictionary recording visited edges
-    visited = {e:0 for e in G.edges_iter()}
-
-    faces = []
-    for e in G.edges_iter():
-        if visited[e]==0: # If the edge has not been visited, start exploration from there
-            temp_loops = [e]
-            n_prev = e[0]
-            n_curr = e[1]
-
-            looped = False
-            while not looped:
-                ## explore following clockwise until next edge already in current_loops
-                neighbours = [( n, (G.node[n]['x'], G.node[n]['y']) ) 
-                              for n in G.neighbors(n_curr) 
-                              if n!=n_prev]
-            
-                next_e = find_most_clockwise((n_prev, (G.node[n_prev]['x'],G.node[n_prev]['y'])),
-                                             (n_curr,(G.node[n_curr]['x'],G.node[n_curr]['y'])),
-                                             neighbours)
-
-                if next_e in temp_loops: # If the next move is an edge already visited, we have a loop
-                    loops.append(temp_loops)
-                    looped = True
-                else: # Else we continue to move
-                    visited[next_e] = 1
-                    temp_loops.append(next_e)
-
-                n_prev = n_curr
-                if next_e[0] != n_curr:
-                    n_curr = next_e[0]
-                else:
-                    n_curr = next_e[1]
-
-    return faces
-
-
-
-
-def to_dual(G):
+    if not isinstance(G, DCEL):
+        G = DCEL(G, tiles=tiles, n_jobs=n_jobs)
+    return G.faces()
+
+
+
+
+def to_dual(G, tiles=None, n_jobs=1):
     """ Extracts the dual of a planar graph
 
+    The faces are extracted from the half-edge structure of G, and two
+    faces are neighbours in the dual if an edge has one of them on each
+    side: the dual is built from the two faces of every edge, in linear time.
+    The branches of G are not part of the boundary of any face, and do not
+    need to be pruned beforehand. The outer face of each connected
+    component, traversed clockwise, is left out of the dual.
+
     Input
     -----
-        * G: Networkx graph
+        * G: Networkx graph, planar, with the position `x`, `y` of the nodes
+        * tiles: walk the faces in `tiles` x `tiles` square tiles of the
+          plane, stitched together (see `spatialx.classes.dcel`)
+        * n_jobs: number of worker processes the tiles are distributed over
 
     Returns
     -------
-        * faces: List of Networkx graphs - G's faces
-        * dual: Networkx Graph - dual graph of G, nodes are G's faces, edges indicate neighbouring relation
+        * faces: List of Networkx graphs - G's faces, built when accessed
+        * dual: Networkx Graph - dual graph of G, nodes are G's faces (with
+          their center of gravity `x`, `y` and their id `face` in the
+          half-edge structure), edges indicate neighbouring relation. Dual
+          edges hold the list of shared `edges`, their total `length`, and
+          the shared `boundary` as lists of consecutive nodes.
 
     """
-   
-    #
-    # Graph preparation and extraction
-    #
+    D = DCEL(G, tiles=tiles, n_jobs=n_jobs)
 
-    # Simplify the graph
-    simplified = simplify(G)
-    # Prune the graph
-    pruned = prune(G)
-    # Extract faces
-    faces = extract_faces(pruned)
-    faces = sorted(faces,key=lambda x:len(x),reverse=1)[1:] # The longest face separates outside/inside
-    
+    # The outer faces are traversed clockwise
+    ids = np.flatnonzero(D.signed_areas() > 0).tolist()
+    dual_id = np.full(D.number_of_faces(), -1, dtype=np.int64)
+    dual_id[ids] = np.arange(len(ids))
+    dual_id = dual_id.tolist()
 
     #
-    # Build faces and add as nodes to dual network
+    # Faces as nodes of the dual network
     #
     dual = nx.Graph()
-
-    ## Build faces and add as nodes to dual graph
-    faces_graphs = []
-    for i,face in enumerate(faces):
-        face_g = nx.Graph()		
-
-        ## Rebuild (de-simplify) the faces
-        edges_face = []
-        for se in face:
-            if 'in_edge' in pruned[se[0]][se[1]]:
-                edges_face += [(e[0],e[1]) for e in e in pruned[se[0]][se[1]]['in_edges']]
-            else:
-                edges_face.append(se)
-        nodes_face = list(set([e[0] for e in edges_face]+[e[1] for e in edges_face]))
-
-        ## Build graph
-        for n in nodes_face:
-            face_g.add_nodes_from([(n,G.node[n])])
-        for n1,n2 in edges_face:
-            face_g.add_edge(n1,n2)	
-        faces_graphs.append(face_g)
-
-        ## Add face to graph
-        x,y = center_of_gravity(G,nodes_face) 
-        dual.add_node(i, x=x, y=y)
-
+    x, y = (c.tolist() for c in centers_of_gravity(D))
+    dual.add_nodes_from((i, {'x': x[f], 'y': y[f], 'face': f})
+                        for i, f in enumerate(ids))
 
     #
-    # Build dual network adjacency matrix 
+    # Dual adjacency from the faces on each side of the edges
     #
-    for i,face1 in enumerate(faces):
-        for j,face2 in enumerate(faces):
-            if i!=j:
-                ## Compare edge by edge
-                for e1 in face1:
-                    for e2 in face2:
-                        if e1 == e2 or e1[::-1] ==e2:
-                            if not dual.has_edge(i,j):
-                                dual.add_edge(i,j)
-                                continue # link found, explore other pairs
-
-    return faces_graphs,dual
+    for (i, j), data in shared_boundaries(D, dual_id).items():
+        dual.add_edge(i, j, **data)
+
+    return _FaceGraphs(G, D, ids), dual
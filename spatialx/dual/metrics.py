@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+"""metrics.py
+
+Morphological descriptors of the faces (blocks) of a planar network, as used
+for the typology of street patterns [1]_:
+
+* the area `A` of the faces, from the shoelace formula;
+* their perimeter and the position of their centroid;
+* their shape factor `phi = A / C`, where `C` is the area of the circle whose
+  diameter is the largest distance between two vertices of the face;
+* the distribution of the areas, and of the shape factor in each class of
+  area.
+
+All faces are processed at once from the half-edge structure of the network:
+the coordinates of the half-edges are flat arrays, with the offsets of each
+face, and the sums over the faces are `bincount`s.
+
+.. [1] R. Louf and M. Barthelemy
+       Journal of The Royal Society Interface 11:20140924 (2014).
+"""
+from __future__ import division
+import numpy as np
+
+from spatialx.classes.dcel import DCEL
+
+
+__all__ = ["face_metrics",
+           "face_histograms"]
+
+
+#
+# Largest number of vertices of the faces whose diameter is computed from all
+# the pairs of vertices; the larger faces use their convex hull.
+#
+SMALL = 64
+
+
+#
+# Helper functions
+#
+def _diameters(D, size=2**22):
+    """Largest distance between two vertices of each face"""
+    offsets = D.face_offsets
+    sizes = np.diff(offsets)
+    x = D.x[D.tail[D.face_half_edges]]
+    y = D.y[D.tail[D.face_half_edges]]
+    diameters = np.zeros(len(sizes))
+
+    for L in np.unique(sizes[sizes <= SMALL]).tolist():
+        faces = np.flatnonzero(sizes == L)
+        step = max(1, size // (L * L))
+        for i in range(0, len(faces), step):
+            batch = faces[i:i + step]
+            positions = offsets[batch, None] + np.arange(L)
+            dx = x[positions][:, :, None] - x[positions][:, None, :]
+            dy = y[positions][:, :, None] - y[positions][:, None, :]
+            diameters[batch] = np.sqrt((dx * dx + dy * dy).max(axis=(1, 2)))
+
+    for f in np.flatnonzero(sizes > SMALL).tolist():
+        diameters[f] = _diameter(x[offsets[f]:offsets[f + 1]],
+                                 y[offsets[f]:offsets[f + 1]])
+    return diameters
+
+
+def _diameter(x, y):
+    """Largest distance between two of the points, from their convex hull"""
+    points = np.unique(np.column_stack([x, y]), axis=0)
+    if len(points) > SMALL:
+        from scipy.spatial import ConvexHull, QhullError
+        try:
+            points = points[ConvexHull(points).vertices]
+        except (QhullError, ValueError):  # aligned points
+            pass
+    d = points[:, None, :] - points[None, :, :]
+    return np.sqrt((d * d).sum(axis=2).max())
+
+
+
+#
+# Callable functions
+#
+def face_metrics(G, weight='length'):
+    """ Computes the area, perimeter, centroid and shape factor of all faces
+
+    Input
+    -----
+        * G: Networkx graph, planar, with the position `x`, `y` of the nodes.
+          Or its `DCEL`, to reuse it.
+        * weight: edge attribute used as the length of the edges for the
+          perimeter; edges without it have their Euclidean length.
+
+    Returns
+    -------
+        * metrics: dictionary of arrays indexed by the face ids of the DCEL
+          (see `spatialx.classes.dcel`, and the `face` attribute of the
+          nodes of `to_dual`):
+
+            - 'area': area of the face
+            - 'perimeter': total length of the edges between the face and
+              another one (the branches inside the face are left out)
+            - 'x', 'y': centroid of the face
+            - 'shape_factor': area over the area of the circle whose diameter
+              is the largest distance between two vertices of the face
+            - 'outer': True for the outer faces of the connected components,
+              traversed clockwise (negative signed area)
+    """
+    D = G if isinstance(G, DCEL) else DCEL(G, weight)
+    F = D.number_of_faces()
+    h = D.face_half_edges
+    faces = np.repeat(np.arange(F), np.diff(D.face_offsets))
+
+    # coordinates relative to the first vertex of each face, for precision
+    first = D.tail[h[D.face_offsets[:-1]]]
+    x0 = D.x[D.tail[h]] - D.x[first][faces]
+    y0 = D.y[D.tail[h]] - D.y[first][faces]
+    x1 = D.x[D.tail[h ^ 1]] - D.x[first][faces]
+    y1 = D.y[D.tail[h ^ 1]] - D.y[first][faces]
+    cross = x0 * y1 - x1 * y0
+
+    signed = np.bincount(faces, cross, F) / 2
+    with np.errstate(divide='ignore', invalid='ignore'):
+        x = np.bincount(faces, (x0 + x1) * cross, F) / (6 * signed)
+        y = np.bincount(faces, (y0 + y1) * cross, F) / (6 * signed)
+    x += D.x[first]
+    y += D.y[first]
+
+    border = D.face[h] != D.face[h ^ 1]
+    perimeter = np.bincount(faces[border], D.lengths[h[border] >> 1], F)
+
+    area = np.abs(signed)
+    diameters = _diameters(D)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        shape_factor = area / (np.pi * diameters * diameters / 4)
+
+    return {'area': area,
+            'perimeter': perimeter,
+            'x': x,
+            'y': y,
+            'shape_factor': shape_factor,
+            'outer': signed <= 0}
+
+
+
+def face_histograms(metrics, area_bins=20, shape_bins=20):
+    """ Distributions of the area and shape factor of the bounded faces
+
+    Input
+    -----
+        * metrics: output of `face_metrics`
+        * area_bins: number of bins, logarithmically spaced between the
+          smallest and largest area, or their edges
+        * shape_bins: number of bins of the shape factor, between 0 and 1, or
+          their edges
+
+    Returns
+    -------
+        * area: (counts, edges) of the areas
+        * shape_factor: (counts, edges) of the shape factors
+        * joint: array of counts with one row per area bin and one column per
+          shape factor bin, from which the distribution of the shape factor
+          in each class of area follows
+    """
+    bounded = ~metrics['outer'] & (metrics['area'] > 0)
+    area = metrics['area'][bounded]
+    phi = metrics['shape_factor'][bounded]
+    if np.isscalar(area_bins):
+        if len(area):
+            area_bins = np.logspace(np.log10(area.min()),
+                                    np.log10(area.max()),
+                                    area_bins + 1)
+            area_bins[[0, -1]] = area.min(), area.max()
+        else:
+            area_bins = np.logspace(0, 1, area_bins + 1)
+    if np.isscalar(shape_bins):
+        shape_bins = np.linspace(0, 1, shape_bins + 1)
+
+    joint, area_bins, shape_bins = np.histogram2d(area, phi,
+                                                  [area_bins, shape_bins])
+    return ((joint.sum(axis=1), area_bins),
+            (joint.sum(axis=0), shape_bins),
+            joint)
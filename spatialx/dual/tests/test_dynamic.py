@@ -0,0 +1,113 @@
+from nose.tools import *
+import numpy as np
+import networkx as nx
+import spatialx as sx
+
+
+def _grid(n=3):
+    G = nx.grid_2d_graph(n, n)
+    for v in G:
+        G.nodes[v]['x'], G.nodes[v]['y'] = v
+    return G
+
+
+def _delaunay(n, seed):
+    from scipy.spatial import Delaunay
+    G = nx.Graph()
+    points = np.random.RandomState(seed).rand(n, 2)
+    for i, (x, y) in enumerate(points):
+        G.add_node(i, x=x, y=y)
+    for simplex in Delaunay(points).simplices:
+        nx.add_cycle(G, simplex.tolist())
+    return G
+
+
+def _compare(P):
+    """The faces and dual match the ones computed from scratch"""
+    faces, dual = sx.to_dual(P.G)
+    assert_equal(len(P.dual), len(dual))
+    assert_equal(P.dual.number_of_edges(), dual.number_of_edges())
+    metrics = sx.face_metrics(P.G)
+    for key in ['area', 'perimeter', 'shape_factor']:
+        assert_true(np.allclose(
+            sorted(m[key] for m in P.metrics.values()),
+            sorted(metrics[key])))
+    assert_equal(sorted(len(P.face_edges(f)) for f in P.faces()),
+                 sorted(len(f) for f in sx.extract_faces(P.G)))
+    lengths = sorted(data['length'] for i, j, data in dual.edges(data=True))
+    assert_true(np.allclose(
+        sorted(data['length'] for i, j, data in P.dual.edges(data=True)),
+        lengths))
+
+
+class TestDynamicDual(object):
+
+    def test_to_dual(self):
+        """Dynamic dual: same dual as to_dual, keyed by face id"""
+        G = _delaunay(30, 2)
+        P = sx.DynamicDual(G)
+        faces, dual = sx.to_dual(G)
+        ids = dict((i, data['face']) for i, data in dual.nodes(data=True))
+        assert_equal(sorted(P.dual), sorted(ids.values()))
+        for i, f in ids.items():
+            assert_almost_equal(P.dual.nodes[f]['x'], dual.nodes[i]['x'])
+            assert_almost_equal(P.dual.nodes[f]['y'], dual.nodes[i]['y'])
+        for i, j, data in dual.edges(data=True):
+            assert_almost_equal(P.dual[ids[i]][ids[j]]['length'],
+                                data['length'])
+
+    def test_split_merge(self):
+        """Dynamic dual: a new street splits a block, a removal merges"""
+        P = sx.DynamicDual(_grid(4))
+        assert_equal(len(P.dual), 9)
+        f = P.face((0, 0), (1, 0))
+        P.add_edge((0, 0), (1, 1))
+        assert_equal(P.deleted, [f])
+        assert_equal(len(P.created), 2)
+        for g in P.created:
+            assert_almost_equal(P.metrics[g]['area'], 0.5)
+        assert_equal(P.dual.number_of_edges(), 13)
+        _compare(P)
+
+        P.remove_edge((1, 1), (2, 1))
+        assert_equal(len(P.created), 1)
+        assert_almost_equal(P.metrics[P.created[0]]['area'], 2.0)
+        _compare(P)
+
+    def test_branches(self):
+        """Dynamic dual: branches, bridges and new components"""
+        P = sx.DynamicDual(_grid(3))
+        P.add_node('a', 0.5, 0.5)
+        P.add_node('b', 5, 5)
+        P.add_node('c', 6, 5)
+        P.update([((0, 0), 'a', {}), ('b', 'c', {'length': 3.0})])
+        _compare(P)
+        P.remove_edge((0, 0), 'a')
+        _compare(P)
+        P.remove_edge((0, 1), (1, 1))
+        P.remove_edge((1, 1), (1, 0))
+        _compare(P)
+        P.remove_edge((1, 1), (2, 1))  # bridge
+        _compare(P)
+
+    def test_random_edits(self):
+        """Dynamic dual: random removals and insertions"""
+        G = _delaunay(60, 3)
+        P = sx.DynamicDual(G)
+        edges = sorted(G.edges())
+        order = np.random.RandomState(4).permutation(len(edges))[:40]
+        removed = [edges[i] for i in order.tolist()]
+        for u, v in removed:
+            P.remove_edge(u, v)
+        _compare(P)
+        for u, v in reversed(removed):
+            P.add_edge(u, v)
+        _compare(P)
+        assert_equal(len(P.dual), len(sx.to_dual(G)[1]))
+
+    def test_crossing(self):
+        """Dynamic dual: crossing edges are refused"""
+        P = sx.DynamicDual(_grid(3))
+        P.add_edge((0, 0), (1, 1))
+        assert_raises(ValueError, P.add_edge, (1, 0), (0, 1))
+        _compare(P)
@@ -0,0 +1,178 @@
+from nose.tools import *
+import numpy as np
+import networkx as nx
+import spatialx as sx
+
+
+def _grid(n=3):
+    G = nx.grid_2d_graph(n, n)
+    for v in G:
+        G.nodes[v]['x'], G.nodes[v]['y'] = v
+    return G
+
+
+class TestDCEL(object):
+
+    def test_grid(self):
+        """DCEL: faces of a grid"""
+        D = sx.DCEL(_grid())
+        assert_equal(D.number_of_faces(), 5)
+        sizes = sorted(len(D.half_edges(f)) for f in range(5))
+        assert_equal(sizes, [4, 4, 4, 4, 8])
+        # every half-edge is on exactly one face
+        assert_equal(sorted(D.face_half_edges.tolist()),
+                     list(range(2 * D.number_of_edges())))
+
+    def test_orientation(self):
+        """DCEL: bounded faces counter-clockwise, the outer face clockwise"""
+        D = sx.DCEL(_grid())
+        for f in range(D.number_of_faces()):
+            h = D.half_edges(f)
+            x1, y1 = D.x[D.tail[h]], D.y[D.tail[h]]
+            x2, y2 = D.x[D.head(h)], D.y[D.head(h)]
+            area = (x1 * y2 - x2 * y1).sum() / 2
+            if len(h) == 4:
+                assert_almost_equal(area, 1.0)
+            else:
+                assert_almost_equal(area, -4.0)
+
+    def test_euler(self):
+        """DCEL: Euler's formula on a random planar graph"""
+        G = nx.Graph()
+        from scipy.spatial import Delaunay
+        points = np.random.RandomState(1).rand(100, 2)
+        for i, (x, y) in enumerate(points):
+            G.add_node(i, x=x, y=y)
+        for simplex in Delaunay(points).simplices:
+            nx.add_cycle(G, simplex.tolist())
+        D = sx.DCEL(G)
+        assert_equal(len(G) - G.number_of_edges() + D.number_of_faces(), 2)
+
+
+    def test_tiles(self):
+        """DCEL: the faces do not depend on the tiling"""
+        G = nx.Graph()
+        from scipy.spatial import Delaunay
+        points = np.random.RandomState(2).rand(300, 2)
+        for i, (x, y) in enumerate(points):
+            G.add_node(i, x=x, y=y)
+        for simplex in Delaunay(points).simplices:
+            nx.add_cycle(G, simplex.tolist())
+        G.add_edge(0, 300)
+        G.nodes[300].update(x=2.0, y=2.0)  # branch across the tiles
+        D = sx.DCEL(G)
+        for tiles, n_jobs in [(1, 1), (5, 1), (4, 2)]:
+            T = sx.DCEL(G, tiles=tiles, n_jobs=n_jobs)
+            assert_equal(T.face.tolist(), D.face.tolist())
+            assert_equal(T.face_offsets.tolist(), D.face_offsets.tolist())
+            assert_equal(T.face_half_edges.tolist(),
+                         D.face_half_edges.tolist())
+
+
+class TestFaces(object):
+
+    def test_dangling(self):
+        """Faces: a dangling edge is walked along both sides"""
+        G = nx.cycle_graph(4)
+        for v, (x, y) in enumerate([(0, 0), (1, 0), (1, 1), (0, 1)]):
+            G.nodes[v]['x'], G.nodes[v]['y'] = x, y
+        G.add_node(4, x=0.5, y=0.5)
+        G.add_edge(0, 4)
+        faces = sx.extract_faces(G)
+        assert_equal(sorted(len(f) for f in faces), [4, 6])
+        inner = [f for f in faces if len(f) == 6][0]
+        assert_true((0, 4) in inner and (4, 0) in inner)
+
+
+class TestDual(object):
+
+    def test_grid(self):
+        """Dual: the dual of a grid is a grid"""
+        faces, dual = sx.to_dual(_grid(4))
+        assert_equal(len(faces), 9)
+        assert_equal(dual.number_of_edges(), 12)
+        centers = dict((i, (data['x'], data['y']))
+                       for i, data in dual.nodes(data=True))
+        D = nx.relabel_nodes(dual, centers)
+        assert_equal(sorted(D.edges()), sorted(
+            nx.relabel_nodes(nx.grid_2d_graph(3, 3),
+                             lambda v: (v[0] + 0.5, v[1] + 0.5)).edges()))
+        for i, j, data in dual.edges(data=True):
+            assert_equal(len(data['edges']), 1)
+            assert_almost_equal(data['length'], 1.0)
+            assert_equal(len(data['boundary']), 1)
+            assert_equal(len(data['boundary'][0]), 2)
+        assert_equal(sorted(len(f) for f in faces), [4] * 9)
+
+    def test_shared_boundary(self):
+        """Dual: boundary of several edges, branches left out"""
+        G = nx.Graph()
+        for v, (x, y) in enumerate([(0, 0), (1, 0), (2, 0), (2, 1),
+                                    (1, 1), (0, 1), (1, 0.5), (-1, -1)]):
+            G.add_node(v, x=x, y=y)
+        nx.add_cycle(G, [0, 1, 2, 3, 4, 5])
+        nx.add_path(G, [1, 6, 4])
+        G.add_edge(0, 7)  # branch
+        faces, dual = sx.to_dual(G)
+        assert_equal(len(faces), 2)
+        assert_equal(dual.number_of_edges(), 1)
+        data = dual.edges[0, 1]
+        assert_equal(sorted(map(sorted, data['edges'])), [[1, 6], [4, 6]])
+        assert_almost_equal(data['length'], 1.0)
+        assert_true(data['boundary'] in ([[1, 6, 4]], [[4, 6, 1]]))
+        assert_equal(sorted(f.number_of_edges() for f in faces), [5, 5])
+
+    def test_outer_faces(self):
+        """Dual: outer faces found by orientation, not by length"""
+        G = nx.cycle_graph(4)
+        for v, (x, y) in enumerate([(0, 0), (4, 0), (4, 4), (0, 4)]):
+            G.nodes[v]['x'], G.nodes[v]['y'] = x, y
+        path = [0] + list(range(4, 14)) + [2]
+        for k, v in enumerate(range(4, 14)):
+            t = (k + 1) * 4 / 11
+            G.add_node(v, x=t + 0.1 * (-1) ** k, y=t)
+        nx.add_path(G, path)
+        G.add_edge(20, 21)
+        G.nodes[20].update(x=10, y=10)
+        G.nodes[21].update(x=11, y=10)
+        nx.add_cycle(G, [30, 31, 32])
+        for v, (x, y) in zip([30, 31, 32], [(20, 0), (21, 0), (20, 1)]):
+            G.nodes[v]['x'], G.nodes[v]['y'] = x, y
+        faces, dual = sx.to_dual(G, tiles=3)
+        assert_equal(len(faces), 3)
+        assert_equal(sorted(f.number_of_edges() for f in faces), [3, 13, 13])
+        assert_equal(dual.number_of_edges(), 1)
+
+
+class TestPrune(object):
+
+    def test_branches(self):
+        """Prune: branches removed and reported"""
+        G = nx.cycle_graph(4)
+        nx.add_path(G, [0, 4, 5, 6])
+        G.add_edge(5, 7)
+        nx.add_path(G, [8, 9, 10])
+        G.add_node(11)
+        G.add_edge(2, 2)
+        S, branches = sx.prune(G, branches=True)
+        assert_equal(sorted(S.nodes()), [0, 1, 2, 3])
+        assert_equal(S.number_of_edges(), 5)
+        branches = dict((b[1][0], b) for b in branches)
+        assert_equal(sorted(branches), [4, 9, 11])
+        attachment, nodes, edges = branches[4]
+        assert_equal(attachment, 0)
+        assert_equal(sorted(nodes), [4, 5, 6, 7])
+        assert_equal(edges[0], (4, 0))
+        assert_equal(sorted(edges), [(4, 0), (5, 4), (6, 5), (7, 5)])
+        assert_equal(branches[9][0], None)
+        assert_equal(sorted(branches[9][1]), [8, 9, 10])
+        assert_equal(branches[11], (None, [11], []))
+
+    def test_view(self):
+        """Prune: read-only view"""
+        G = nx.cycle_graph(3)
+        G.add_edge(0, 3)
+        S = sx.prune(G, view=True)
+        assert_equal(sorted(S.nodes()), [0, 1, 2])
+        assert_true(nx.is_frozen(S))
+        assert_equal(sorted(sx.prune(nx.path_graph(5)).nodes()), [])
@@ -0,0 +1,55 @@
+from nose.tools import *
+import numpy as np
+import networkx as nx
+import spatialx as sx
+
+
+def _grid(n=3):
+    G = nx.grid_2d_graph(n, n)
+    for v in G:
+        G.nodes[v]['x'], G.nodes[v]['y'] = v
+    return G
+
+
+class TestFaceMetrics(object):
+
+    def test_grid(self):
+        """Face metrics: squares of a grid"""
+        D = sx.DCEL(_grid())
+        metrics = sx.face_metrics(D)
+        outer = np.flatnonzero(metrics['outer'])
+        assert_equal(len(outer), 1)
+        assert_equal(len(D.half_edges(outer[0])), 8)
+        for f in np.flatnonzero(~metrics['outer']):
+            assert_almost_equal(metrics['area'][f], 1.0)
+            assert_almost_equal(metrics['perimeter'][f], 4.0)
+            assert_almost_equal(metrics['shape_factor'][f], 2 / np.pi)
+            nodes = D.face_nodes(f)
+            assert_almost_equal(metrics['x'][f], np.mean([v[0] for v in nodes]))
+            assert_almost_equal(metrics['y'][f], np.mean([v[1] for v in nodes]))
+        assert_almost_equal(metrics['area'][outer[0]], 4.0)
+
+    def test_polygon(self):
+        """Face metrics: regular polygon, with a branch inside"""
+        G = nx.cycle_graph(200)
+        for v in G:
+            angle = 2 * np.pi * v / 200
+            G.nodes[v]['x'] = 1e6 + np.cos(angle)
+            G.nodes[v]['y'] = 1e6 + np.sin(angle)
+        G.add_node('in', x=1e6, y=1e6)
+        G.add_edge(0, 'in', length=5.0)
+        metrics = sx.face_metrics(G)
+        f = np.flatnonzero(~metrics['outer'])[0]
+        assert_almost_equal(metrics['area'][f], 100 * np.sin(2 * np.pi / 200))
+        assert_almost_equal(metrics['perimeter'][f], 2 * np.pi, places=3)
+        assert_almost_equal(metrics['x'][f], 1e6, places=6)
+        assert_almost_equal(metrics['shape_factor'][f], 1.0, places=3)
+
+    def test_histograms(self):
+        """Face metrics: histograms of the bounded faces"""
+        metrics = sx.face_metrics(_grid(4))
+        (area, area_bins), (phi, phi_bins), joint = \
+            sx.face_histograms(metrics, area_bins=[0.5, 2], shape_bins=4)
+        assert_equal(area.tolist(), [9])
+        assert_equal(phi.tolist(), [0, 0, 9, 0])
+        assert_equal(joint.shape, (1, 4))
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+"""parallel.py
+
+Helpers to run the independent parts of a computation (typically the
+single-source searches of a centrality sweep) in worker processes.
+
+The work is split in a number of chunks that only depends on the size of the
+problem, never on the number of workers, and the partial results are returned
+in chunk order. Reducing them in that order makes the results bit-for-bit
+reproducible whatever the number of processes used.
+"""
+import multiprocessing
+
+
+__all__ = ["partition",
+           "imap"]
+
+
+#
+# Default number of chunks the work is split into
+#
+CHUNKS = 64
+
+
+#
+# Helper functions
+#
+
+## State shared by all the tasks of a worker, sent once per worker
+_state = {}
+
+
+def _initialize(state):
+    _state.clear()
+    _state.update(state)
+
+
+def _run(args):
+    func, task = args
+    return func(_state, task)
+
+
+def _n_processes(n_jobs):
+    """Number of processes, `n_jobs=-1` meaning one per CPU"""
+    if n_jobs is None:
+        return 1
+    if n_jobs < 0:
+        return max(1, multiprocessing.cpu_count() + 1 + n_jobs)
+    return max(1, n_jobs)
+
+
+
+#
+# Callable functions
+#
+def partition(items, chunks=CHUNKS):
+    """Splits a sequence in at most `chunks` contiguous chunks
+
+    Parameters
+    ----------
+
+    items: sequence
+
+    chunks: int
+        Maximum number of chunks. The partition only depends on `len(items)`
+        and `chunks`.
+
+    Returns
+    -------
+
+    chunks: list of lists
+    """
+    items = list(items)
+    n = len(items)
+    chunks = max(1, min(chunks, n))
+    bounds = [(i * n) // chunks for i in range(chunks + 1)]
+    return [items[bounds[i]:bounds[i+1]] for i in range(chunks)]
+
+
+def imap(func, tasks, state, n_jobs=1):
+    """Applies `func(state, task)` to every task, possibly in parallel
+
+    Parameters
+    ----------
+
+    func: function
+        Module-level (picklable) function taking the shared state and a task.
+
+    tasks: iterable
+
+    state: dictionary
+        Data shared by all tasks (e.g. the graph snapshot). It is sent once to
+        each worker process rather than once per task.
+
+    n_jobs: int
+        Number of worker processes. 1 runs everything in the current process,
+        -1 uses one process per CPU.
+
+    Returns
+    -------
+
+    results: iterator
+        The results of the tasks, in the order of `tasks`.
+    """
+    processes = _n_processes(n_jobs)
+    if processes == 1:
+        for task in tasks:
+            yield func(state, task)
+        return
+
+    pool = multiprocessing.Pool(processes, _initialize, (state,))
+    try:
+        for result in pool.imap(_run, [(func, task) for task in tasks]):
+            yield result
+        pool.close()
+    except BaseException:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
@@ -5,71 +5,518 @@ Algorithms to simplify spatial networks. Indeed, many networks contains many
 degree 2 nodes which are topologically redondant, but are needed to respect the
 geometry. Most of the time, these nodes are not necessary for the measures we
 perform---we usually only needs the distance between degree != 2 nodes--- and
-only make the computation slower. 
+only make the computation slower.
 
 Simplifying the network allows for substantial performance improvement, even
 when including the simplification/restitution process (linear in the number of
 nodes).
+
+The maximal chains of degree 2 nodes are traced in a single pass over the
+half-edges of a CSR snapshot of the graph (see `spatialx.classes.csrgraph`),
+and each is replaced by a super-edge. The position of every original edge
+and removed node along its super-edge is stored in the simplified graph, so
+that results can be mapped back to the original network.
 """
-import networkx as nx
+from heapq import heappush, heappop
+import numpy as np
+
+from spatialx.classes.csrgraph import CSRGraph
 
 
 __authors__ = """\n""".join(["Rémi Louf <remilouf@sciti.es>"])
 
 
 __all__ = ["simplify",
-           "restitute"]
+           "restitute",
+           "restitute_betweenness"]
+
+
+INF = float('inf')
+
+
+#
+# Helper functions
+#
+def _trace(adjacency, kept, m):
+    """Maximal chains between kept nodes, as (nodes, edges) id lists
+
+    Every chain starts and ends at a kept node, and all its other nodes have
+    degree 2. The cycles without any kept node start and end at their
+    first node.
+    """
+    offsets, neighbors, _, edge_index = adjacency
+    visited = [False] * m
+    chains = []
+
+    def follow(s, j):
+        nodes = [s]
+        edges = []
+        while True:
+            v = neighbors[j]
+            e = edge_index[j]
+            visited[e] = True
+            nodes.append(v)
+            edges.append(e)
+            if kept[v] or v == s:
+                return nodes, edges
+            # the other half-edge of the degree 2 node
+            j = offsets[v] if edge_index[offsets[v]] != e else offsets[v] + 1
+
+    for s in range(len(kept)):
+        if kept[s]:
+            for j in range(offsets[s], offsets[s + 1]):
+                if not visited[edge_index[j]]:
+                    chains.append(follow(s, j))
+    for s in range(len(kept)):
+        for j in range(offsets[s], offsets[s + 1]):
+            if not visited[edge_index[j]]:
+                chains.append(follow(s, j))
+    return chains
+
+
+def _split(chains):
+    """Splits the chains that would give self-loops or parallel edges
+
+    Among the chains between the same two nodes, the one with the fewest
+    edges is kept whole and the others are split at their middle node. The
+    closed chains are split in three.
+    """
+    groups = {}
+    for nodes, edges in chains:
+        key = (min(nodes[0], nodes[-1]), max(nodes[0], nodes[-1]))
+        groups.setdefault(key, []).append((nodes, edges))
+
+    split = []
+    for (s, t), group in groups.items():
+        group.sort(key=lambda chain: len(chain[1]))
+        for k, (nodes, edges) in enumerate(group):
+            m = len(edges)
+            if s == t and m > 2:
+                cuts = [0, m // 3, (2 * m) // 3, m]
+            elif k > 0 and m > 1:
+                cuts = [0, m // 2, m]
+            else:
+                cuts = [0, m]
+            for a, b in zip(cuts[:-1], cuts[1:]):
+                split.append((nodes[a:b + 1], edges[a:b]))
+    return split
+
+
+def _segments(E, End, left, right, flow):
+    """Adds flows along the chains, between the slots `left` < `right`
+
+    The edges between the two slots and the nodes strictly inside get the
+    flow, once `E` is summed (see `restitute_betweenness`).
+    """
+    np.add.at(E, left + 1, flow)
+    np.add.at(E, right + 1, -flow)
+    np.add.at(End, right, flow)
+
+
+def _chain_dijkstra(adjacency, seeds):
+    """Shortest paths on the simplified graph from the seeds (node, distance)
+
+    Returns the nodes in order of non-decreasing distance, and the lists of
+    distances and numbers of shortest paths.
+    """
+    n = len(adjacency)
+    D = [INF] * n
+    seen = [INF] * n
+    sigma = [0.0] * n
+    order = []
+    Q = []
+    for v, dist in seeds:
+        seen[v] = dist
+        sigma[v] = 1.0
+        heappush(Q, (dist, v))
+    while Q:
+        dist, v = heappop(Q)
+        if D[v] != INF:
+            continue
+        D[v] = dist
+        order.append(v)
+        for w, length, c in adjacency[v]:
+            vw_dist = dist + length
+            if vw_dist < seen[w]:
+                seen[w] = vw_dist
+                sigma[w] = sigma[v]
+                heappush(Q, (vw_dist, w))
+            elif vw_dist == seen[w]:
+                sigma[w] += sigma[v]
+    return order, D, sigma
+
 
 
 #
 # Callable functions
 #
 
-def simplify(G):
+def simplify(G, keep=None, weight='length'):
     ''' Returns a simplified version of the graph comprising
-            * The stations
-            * The nodes with degree > 2
-            * The nodes with degree 1
+            * The nodes with degree 1 or > 2
+            * The nodes for which `keep` is True (e.g. the stations)
     Linked by edges whose length is equal to the sum of the lengths of the edges they replace.
     The simplified graph is topologically equivalent (same loops, edge weights) but lighter and makes
     computations easier.
 
+    The chains of degree 2 nodes are traced in a single O(N+E) pass. A chain
+    that would give a self-loop, or an edge parallel to another one, keeps
+    one or two of its nodes, so that the faces of planar graphs are kept.
+
     Input
     -----
-        * G : NetworkX graph
+        * G : NetworkX graph, undirected
+        * keep : function `keep(node, data)`, True for the degree 2 nodes
+          that must be kept. For instance, to keep the stations:
+          `keep=lambda v, data: data.get('insee', '') != ''`
+        * weight : edge attribute holding the length of the edges. Edges
+          without it have length 1.
 
     Returns
     -------
         * S : Networkx graph
             nodes = nodes of the original graph of degree 1 or > 2
-            edges = "super edges" contains as a property 'in_edges' = [ordered list of the edges contained in this super-edge]
+            edges = "super edges", with the total `weight` of the edges they
+            replace, 'in_edges' = [ordered list of the edges contained in this
+            super-edge] and 'geometry' = [ordered list of the (x, y)
+            positions of their nodes]. The edges of G that are not part of a
+            chain keep their attributes.
+            S.graph['chains'] maps the edges and nodes of G to the super-edges
+            (see `restitute`):
+                - 'super_edges': list of the super-edges (u, v)
+                - 'edges': list of the edges of G, in the order of `G.edges()`
+                - 'super_edge', 'offset': arrays of the index of the
+                  super-edge of each edge of G, and of its position along
+                  the super-edge, from u
+                - 'forward': array, True if the edge goes from u to v
+                - 'lengths': array of the lengths of the edges of G
+                - 'nodes': list of the removed nodes
+                - 'node_super_edge', 'node_offset': arrays of the super-edge
+                  of each removed node and of its position along the
+                  super-edge (node k is between the edges k-1 and k)
     '''
+    if G.is_directed() or G.is_multigraph():
+        raise ValueError("simplify needs an undirected simple graph")
+    A = CSRGraph(G, weight=weight)
+    adjacency = A.adjacency()
+    offsets, neighbors = adjacency[0], adjacency[1]
+    n = len(A)
 
-    S = G.copy()
+    ## Nodes kept: degree != 2 (self-loops count twice), and keep(v, data)
+    kept = [False] * n
+    for v in range(n):
+        degree = offsets[v + 1] - offsets[v]
+        kept[v] = (degree != 2 or
+                   v in neighbors[offsets[v]:offsets[v + 1]] or
+                   (keep is not None and keep(A.nodes[v],
+                                              G.nodes[A.nodes[v]])))
 
-    ## Iterate over the graph's nodes
-    for n,data in F.nodes_iter(data=True):
-        if (F.degree(n)==2 and data['insee'] == ''): # If k=2 and not a station, delete
-            old_edges = F.edges(n,data=True)
+    chains = _split(_trace(adjacency, kept, A.number_of_edges()))
 
-            for e in old_edges: #remove edges from the graph
-                F.remove_edge(e[0],e[1])
+    ## Build the simplified graph
+    S = G.__class__()
+    S.graph.update(G.graph)
+    S.add_nodes_from((A.nodes[v], G.nodes[A.nodes[v]])
+                     for v in range(n) if kept[v])
+    S.add_nodes_from((A.nodes[nodes[0]], G.nodes[A.nodes[nodes[0]]])
+                     for nodes, edges in chains)
 
-            nodes = [e[i] for i in range(2) for e in old_edges if e[i]!=n]	
-            s_edge = (nodes[0],nodes[1],{'in_edges': []})
+    lengths = [1.0 if weight is None else float(data.get(weight, 1))
+               for u, v, data in G.edges(data=True)]
+    x = A.node_data['x'].tolist()
+    y = A.node_data['y'].tolist()
+    positions = not (np.isnan(A.node_data['x']).any() or
+                     np.isnan(A.node_data['y']).any())
 
-            ## Three cases: no edge is a super-edge, one is a super edge, both are.
-            for e in old_edges:
-                if 'in_edges' not in e[2]:
-                    s_edge[2]['in_edges'].append(e)
-                else:
-                    s_edge[2]['in_edges'] += e[2]['in_edges']
+    super_edges = []
+    super_edge = [0] * A.number_of_edges()
+    offset = [0] * A.number_of_edges()
+    forward = [True] * A.number_of_edges()
+    removed = []
+    node_super_edge = []
+    node_offset = []
+    for i, (nodes, edges) in enumerate(chains):
+        u, v = A.nodes[nodes[0]], A.nodes[nodes[-1]]
+        super_edges.append((u, v))
+        if len(edges) == 1:
+            data = dict(G.edges[A.edges[edges[0]]])
+        else:
+            data = {}
+        if weight is not None:
+            data[weight] = sum(lengths[e] for e in edges)
+        data['in_edges'] = [(A.nodes[a], A.nodes[b])
+                            for a, b in zip(nodes[:-1], nodes[1:])]
+        if positions:
+            data['geometry'] = [(x[a], y[a]) for a in nodes]
+        S.add_edge(u, v, **data)
 
-            F.add_edge(s_edge[0],s_edge[1],in_edges = s_edge[2]['in_edges'])
+        for k, e in enumerate(edges):
+            super_edge[e] = i
+            offset[e] = k
+            forward[e] = A.edges[e][0] == A.nodes[nodes[k]]
+        for k in range(1, len(nodes) - 1):
+            removed.append(A.nodes[nodes[k]])
+            node_super_edge.append(i)
+            node_offset.append(k)
 
+    S.graph['chains'] = {
+        'super_edges': super_edges,
+        'edges': A.edges,
+        'super_edge': np.array(super_edge, dtype=np.int64),
+        'offset': np.array(offset, dtype=np.int64),
+        'forward': np.array(forward, dtype=bool),
+        'lengths': np.array(lengths, dtype=np.float64),
+        'nodes': removed,
+        'node_super_edge': np.array(node_super_edge, dtype=np.int64),
+        'node_offset': np.array(node_offset, dtype=np.int64)}
     return S
 
 
 
-def restitute(S):
-    pass
+def restitute(S, nodes=None, edges=None, interpolate=False):
+    """ Maps values computed on a simplified graph back to the original graph
+
+    Each edge of the original graph gets the value of its super-edge. The
+    nodes of S keep their value, and the nodes removed by `simplify` get
+    the value of their super-edge when `edges` is given. Otherwise, or with
+    `interpolate`, they get the values of the ends of the super-edge,
+    linearly interpolated by the distance along the chain. Everything is
+    done with arrays, in time linear in the size of the original graph.
+
+    Restituting a betweenness computed on S only gives the betweenness of
+    the pairs of nodes of S: every shortest path between two nodes of S
+    that goes through a removed node goes through its whole chain, so the
+    edge betweenness of the super-edges is exact for these pairs
+    (unnormalized, or with the same normalization for the nodes and edges).
+    The pairs with an endpoint inside a chain are missing; for the
+    betweenness of all the pairs of nodes of the original graph, use
+    `restitute_betweenness`.
+
+    Input
+    -----
+        * S : Networkx graph returned by `simplify`
+        * nodes : values of the nodes of S, as a dictionary or an array in
+          the order of `list(S)`
+        * edges : values of the edges of S, as a dictionary keyed by edge
+          (in either direction) or an array in the order of `S.edges()`
+        * interpolate : if True, the removed nodes get the interpolated
+          values of the nodes even when `edges` is given
+
+    Returns
+    -------
+        * node_values : dictionary of the nodes of the original graph, or
+          None if `nodes` is None
+        * edge_values : dictionary of the edges of the original graph, or
+          None if `edges` is None
+    """
+    chains = S.graph['chains']
+    super_edges = chains['super_edges']
+    super_edge = chains['super_edge']
+    node_super_edge = chains['node_super_edge']
+
+    edge_values = None
+    if edges is not None:
+        if not isinstance(edges, dict):
+            edges = dict(zip(S.edges(), np.asarray(edges).tolist()))
+        values = np.array([edges[e] if e in edges else edges[(e[1], e[0])]
+                           for e in super_edges], dtype=np.float64)
+        edge_values = dict(zip(chains['edges'],
+                               values[super_edge].tolist()))
+
+    node_values = None
+    if nodes is not None:
+        if not isinstance(nodes, dict):
+            nodes = dict(zip(S, np.asarray(nodes).tolist()))
+        node_values = dict(nodes)
+        if edges is not None and not interpolate:
+            removed = values[node_super_edge]
+        else:
+            ## Distance of the removed nodes from the first end of the chain
+            K = len(super_edges)
+            lengths = chains['lengths']
+            starts = np.zeros(K + 1, dtype=np.int64)
+            np.cumsum(np.bincount(super_edge, minlength=K), out=starts[1:])
+            ordered = np.zeros(len(lengths) + 1)
+            ordered[starts[super_edge] + chains['offset'] + 1] = lengths
+            distance = np.cumsum(ordered)
+            first = starts[node_super_edge]
+            distance = (distance[first + chains['node_offset']] -
+                        distance[first])
+            total = np.bincount(super_edge, lengths, K)[node_super_edge]
+
+            a = np.array([nodes[u] for u, v in super_edges], dtype=np.float64)
+            b = np.array([nodes[v] for u, v in super_edges], dtype=np.float64)
+            a = a[node_super_edge]
+            b = b[node_super_edge]
+            removed = a + (b - a) * distance / total
+        node_values.update(zip(chains['nodes'], removed.tolist()))
+
+    return node_values, edge_values
+
+
+
+def restitute_betweenness(S, normalized=True):
+    """ Betweenness of the nodes and edges of the original graph, from S
+
+    The betweenness of all the pairs of nodes of the original graph,
+    including the nodes removed by `simplify`, is computed exactly with the
+    shortest paths of the simplified graph only. From a node inside a chain
+    the paths leave through either end of its chain, and a node inside a
+    chain is reached through either end, or directly from the same chain:
+    the distances and numbers of shortest paths to the removed nodes follow
+    from the ones of the ends of their chain. Brandes' accumulation is run
+    on S, with the dependencies of the removed nodes added to the ends of
+    their chain, and the flows along the chains are summed with cumulative
+    sums.
+
+    This takes one single-source search on S per node of the original
+    graph, and array operations linear in the number of removed nodes; the
+    searches on the original graph are avoided.
+
+    Input
+    -----
+        * S : Networkx graph returned by `simplify`
+        * normalized : if True, the node values are normalized by
+          `1/((n-1)(n-2))` and the edge values by `1/(n(n-1))`, as by
+          `betweenness_centrality` and `e_betweenness_centrality`, with n
+          the number of nodes of the original graph
+
+    Returns
+    -------
+        * node_values : dictionary of the betweenness of the nodes of the
+          original graph
+        * edge_values : dictionary of the betweenness of the edges of the
+          original graph
+    """
+    chains = S.graph['chains']
+    super_edges = chains['super_edges']
+    K = len(super_edges)
+    kept = list(S)
+    index = dict((v, i) for i, v in enumerate(kept))
+
+    ## Chain layout: the chain c has the slots start[c] + 0, ..., + m_c,
+    ## for its nodes from u to v; its edges are the slots 1 to m_c
+    super_edge = chains['super_edge']
+    counts = np.bincount(super_edge, minlength=K)
+    start = np.zeros(K + 1, dtype=np.int64)
+    np.cumsum(counts + 1, out=start[1:])
+    edge_slot = start[super_edge] + chains['offset'] + 1
+    lengths = np.zeros(start[-1])
+    lengths[edge_slot] = chains['lengths']
+    position = np.cumsum(lengths)
+    position -= np.repeat(position[start[:-1]], counts + 1)
+    total = position[start[1:] - 1]
+
+    ## Removed nodes: slot, chain, distances to the ends of the chain
+    node_chain = chains['node_super_edge']
+    node_slot = start[node_chain] + chains['node_offset']
+    ya = position[node_slot]
+    yb = total[node_chain] - ya
+    ends = np.array([(index[u], index[v]) for u, v in super_edges],
+                    dtype=np.int64).reshape(-1, 2)
+    a = ends[node_chain, 0]
+    b = ends[node_chain, 1]
+    R = len(node_chain)
+    n = len(kept) + R
+    node_start = np.zeros(K + 1, dtype=np.int64)
+    np.cumsum(np.bincount(node_chain, minlength=K), out=node_start[1:])
+
+    adjacency = [[] for v in kept]
+    for c, (u, v) in enumerate(super_edges):
+        if u != v:
+            adjacency[index[u]].append((index[v], total[c].item(), c))
+            adjacency[index[v]].append((index[u], total[c].item(), c))
+
+    betweenness = np.zeros(len(kept))
+    FA = np.zeros(R)              # dependencies through the end u
+    FB = np.zeros(R)              # dependencies through the end v
+    phi = np.zeros(K)             # flows through the whole chains
+    E = np.zeros(start[-1] + 1)   # flows along parts of the chains
+    End = np.zeros(start[-1] + 1)
+
+    sources = [(i, None) for i in range(len(kept))] + \
+        [(None, r) for r in range(R)]
+    for s, r in sources:
+        if r is None:
+            seeds = [(s, 0.0)]
+        else:
+            c = node_chain[r]
+            seeds = [(a[r].item(), ya[r].item()), (b[r].item(), yb[r].item())]
+        order, D, sigma = _chain_dijkstra(adjacency, seeds)
+
+        ## Removed targets, reached through either end of their chain
+        Dv = np.array(D)
+        sigmav = np.array(sigma)
+        via_a = Dv[a] + ya
+        via_b = Dv[b] + yb
+        if r is None:
+            dist = np.minimum(via_a, via_b)
+        else:
+            chain = slice(node_start[c], node_start[c + 1])
+            direct = np.full(R, INF)
+            direct[chain] = np.abs(ya[chain] - ya[r])
+            dist = np.minimum(np.minimum(via_a, via_b), direct)
+        with np.errstate(invalid='ignore'):
+            sa = np.where(via_a == dist, sigmav[a], 0.0)
+            sb = np.where(via_b == dist, sigmav[b], 0.0)
+            sd = 0.0 if r is None else (direct == dist).astype(np.float64)
+            count = sa + sb + sd
+            reached = np.isfinite(dist) & (count > 0)
+            if r is not None:
+                reached[r] = False
+            fa = np.where(reached, sa / count, 0.0)
+            fb = np.where(reached, sb / count, 0.0)
+        FA += fa
+        FB += fb
+        extra = (np.bincount(a, fa, len(kept)) +
+                 np.bincount(b, fb, len(kept)))
+
+        if r is not None:
+            ## Direct paths inside the chain of the source
+            same = np.flatnonzero(np.isfinite(direct) & reached)
+            fd = sd[same] / count[same]
+            left = np.minimum(node_slot[same], node_slot[r])
+            right = np.maximum(node_slot[same], node_slot[r])
+            _segments(E, End, left, right, fd)
+
+        ## Accumulation on S
+        delta = extra.tolist()
+        for w in reversed(order):
+            coeff = ((w != s) + delta[w]) / sigma[w]
+            Dw = D[w]
+            for v, length, k in adjacency[w]:
+                if D[v] + length == Dw:
+                    flow = sigma[v] * coeff
+                    delta[v] += flow
+                    phi[k] += flow
+            if w != s:
+                betweenness[w] += delta[w]
+            if r is not None:
+                ## paths leaving the source along its chain
+                if w == a[r] and Dw == ya[r]:
+                    _segments(E, End, np.array([start[c]]),
+                              np.array([node_slot[r]]), np.array([coeff]))
+                if w == b[r] and Dw == yb[r]:
+                    _segments(E, End, np.array([node_slot[r]]),
+                              np.array([start[c + 1] - 1]),
+                              np.array([coeff]))
+
+    ## Removed targets and whole chains, as flows along the chains
+    _segments(E, End, start[node_chain], node_slot, FA)
+    _segments(E, End, node_slot, start[node_chain + 1] - 1, FB)
+    _segments(E, End, start[:-1], start[1:] - 1, phi)
+    E = np.cumsum(E)
+
+    if normalized:
+        node_scale = 1.0 / ((n - 1) * (n - 2)) if n > 2 else 1.0
+        edge_scale = 1.0 / (n * (n - 1)) if n > 1 else 1.0
+    else:  # every pair is counted in both directions
+        node_scale = edge_scale = 0.5
+
+    node_values = dict(zip(kept, (node_scale * betweenness).tolist()))
+    node_values.update(zip(chains['nodes'],
+                           (node_scale * (E[node_slot] - End[node_slot])
+                            ).tolist()))
+    edge_values = dict(zip(chains['edges'],
+                           (edge_scale * E[edge_slot]).tolist()))
+    return node_values, edge_values
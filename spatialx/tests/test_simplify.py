@@ -0,0 +1,142 @@
+from nose.tools import *
+import numpy as np
+import networkx as nx
+import spatialx as sx
+
+
+def _grid(n=3, step=4):
+    """Grid whose edges are split in `step` segments"""
+    G = nx.Graph()
+    for i in range(n):
+        for j in range(n):
+            G.add_node((i * step, j * step), x=i * step, y=j * step)
+    for i in range((n - 1) * step + 1):
+        for j in range(0, (n - 1) * step + 1, step):
+            for a, b in [((i, j), (i + 1, j)), ((j, i), (j, i + 1))]:
+                if max(b) <= (n - 1) * step:
+                    G.add_node(a, x=a[0], y=a[1])
+                    G.add_node(b, x=b[0], y=b[1])
+                    G.add_edge(a, b, length=1.0)
+    return G
+
+
+class TestSimplify(object):
+
+    def test_grid(self):
+        """Simplify: chains of a subdivided grid"""
+        G = _grid()
+        S = sx.simplify(G)
+        assert_equal(len(S), 5)    # the corners have degree 2
+        assert_equal(S.number_of_edges(), 8)
+        assert_equal(sorted(d['length'] for u, v, d in S.edges(data=True)),
+                     [4.0] * 4 + [8.0] * 4)
+        for u, v, data in S.edges(data=True):
+            assert_equal(len(data['in_edges']), data['length'])
+            assert_equal(data['geometry'][0], (u[0], u[1]))
+            assert_equal(data['geometry'][-1], (v[0], v[1]))
+        assert_equal(sorted(len(f) for f in sx.extract_faces(S)),
+                     [3, 3, 3, 3, 4])
+
+    def test_mapping(self):
+        """Simplify: every edge and removed node is on its super-edge"""
+        G = _grid()
+        S = sx.simplify(G)
+        chains = S.graph['chains']
+        assert_equal(len(chains['edges']), G.number_of_edges())
+        assert_equal(len(chains['nodes']), len(G) - len(S))
+        for k, (a, b) in enumerate(chains['edges']):
+            u, v = chains['super_edges'][chains['super_edge'][k]]
+            path = S[u][v]['in_edges']
+            edge = path[chains['offset'][k]]
+            assert_equal(edge, (a, b) if chains['forward'][k] else (b, a))
+        for k, w in enumerate(chains['nodes']):
+            u, v = chains['super_edges'][chains['node_super_edge'][k]]
+            assert_equal(S[u][v]['in_edges'][chains['node_offset'][k]][0], w)
+
+    def test_keep(self):
+        """Simplify: nodes kept by the predicate"""
+        G = nx.path_graph(5)
+        G.nodes[2]['insee'] = '75056'
+        S = sx.simplify(G, keep=lambda v, data: data.get('insee', '') != '',
+                        weight=None)
+        assert_equal(sorted(S.edges()), [(0, 2), (2, 4)])
+        assert_true('geometry' not in S[0][2])
+
+    def test_loops_and_parallel(self):
+        """Simplify: no self-loops nor parallel edges"""
+        G = nx.cycle_graph(6)      # isolated cycle
+        nx.add_cycle(G, [10, 11, 12, 13])
+        G.add_edge(10, 14)         # cycle hanging from a node
+        nx.add_path(G, [20, 21, 22, 23])
+        nx.add_path(G, [20, 24, 23])
+        G.add_edge(20, 23)         # three chains between 20 and 23
+        G.add_edge(20, 25)
+        G.add_edge(23, 26)
+        S = sx.simplify(G, weight=None)
+        assert_equal(nx.number_of_selfloops(S), 0)
+        assert_equal(S.number_of_edges(), 3 + 4 + 5 + 2)
+        assert_equal(len(nx.cycle_basis(S)), len(nx.cycle_basis(G)))
+        assert_equal(sum(len(d['in_edges']) for u, v, d in S.edges(data=True)),
+                     G.number_of_edges())
+
+
+class TestRestitute(object):
+
+    def test_betweenness(self):
+        """Restitute: betweenness of the pairs of kept nodes"""
+        G = _grid(3, 3)
+        G.add_edge((0, 0), (1, 1), length=2.0)
+        G.nodes[(1, 1)].update(x=1, y=1)
+        S = sx.simplify(G)
+        b, eb = sx.restitute(
+            S,
+            nodes=sx.betweenness_centrality(S, normalized=False),
+            edges=sx.e_betweenness_centrality(S, normalized=False))
+
+        def kept(G, s, t):
+            return 1.0 if s in S and t in S else 0.0
+        expected = sx.gbetweenness_centrality(G, kept, normalized=False)
+        e_expected = sx.e_gbetweenness_centrality(G, kept, normalized=False)
+        assert_equal(sorted(b), sorted(G))
+        for v in G:
+            assert_almost_equal(b[v], expected[v])
+        assert_equal(sorted(eb), sorted(e_expected))
+        for e in G.edges():
+            assert_almost_equal(eb[e], e_expected[e])
+
+    def test_exact_betweenness(self):
+        """Restitute: betweenness of all the pairs of the original graph"""
+        G = _grid(4, 5)
+        G.add_edge((0, 0), (1, 1), length=1.0)
+        G.add_node('isolated')
+        S = sx.simplify(G)
+        for normalized in [True, False]:
+            b, eb = sx.restitute_betweenness(S, normalized=normalized)
+            expected = nx.betweenness_centrality(G, weight='length',
+                                                 normalized=normalized)
+            e_expected = nx.edge_betweenness_centrality(
+                G, weight='length', normalized=normalized)
+            assert_equal(sorted(b, key=str), sorted(G, key=str))
+            for v in G:
+                assert_almost_equal(b[v], expected[v])
+            assert_equal(len(eb), G.number_of_edges())
+            for (u, v), value in eb.items():
+                assert_almost_equal(value, e_expected[(u, v)]
+                                    if (u, v) in e_expected
+                                    else e_expected[(v, u)])
+
+    def test_interpolate(self):
+        """Restitute: node values interpolated along the chains"""
+        G = nx.path_graph(4)
+        G.add_edge(3, 4)
+        G.add_edge(3, 5)
+        for (u, v), l in zip(G.edges(), [1.0, 2.0, 1.0, 1.0, 1.0]):
+            G[u][v]['length'] = l
+        S = sx.simplify(G)
+        values, _ = sx.restitute(S, nodes={0: 0.0, 3: 8.0, 4: 1.0, 5: 1.0})
+        assert_almost_equal(values[1], 2.0)
+        assert_almost_equal(values[2], 6.0)
+        nodes, edges = sx.restitute(S, edges=np.arange(3.0))
+        assert_true(nodes is None)
+        assert_equal(sorted(edges), sorted(G.edges()))
+        assert_equal(edges[(0, 1)], edges[(2, 3)])